@@ -0,0 +1,37 @@
+import os
+import sys
+
+APP_DIR_NAME = "yt-playlist-downloader"
+
+def user_cache_dir():
+    """Returns (and creates) the per-user directory for disposable data such as metadata caches."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    path = os.path.join(base, APP_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def user_data_dir():
+    """Returns (and creates) the per-user directory for state that must survive restarts."""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    path = os.path.join(base, APP_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def user_runtime_dir():
+    """Returns (and creates) the per-user directory for sockets and other files that only matter while the app runs."""
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if sys.platform in ("win32", "darwin") or not base:
+        return user_data_dir()
+    path = os.path.join(base, APP_DIR_NAME)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
@@ -0,0 +1,75 @@
+import re
+import threading
+
+# Relative share of the budget: downloads started from a row button outrank "Download All" items
+FOREGROUND_WEIGHT = 3
+BACKGROUND_WEIGHT = 1
+
+RATE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg])?(?:i?b)?(?:/s)?\s*$', re.IGNORECASE)
+RATE_MULTIPLIERS = {None: 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3} # Binary, like yt-dlp's --limit-rate
+
+def parse_rate(text):
+    """Parses a rate such as '80M', '500K', '2.5 MiB/s' or '1048576' into bytes per second.
+
+    Returns None (no limit) for '', '0' and 'unlimited'. Raises ValueError otherwise.
+    """
+    if text is None or text.strip().lower() in ('', '0', 'unlimited', 'none'):
+        return None
+    match = RATE_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid rate '{text}'. Use e.g. 500K, 80M or 1.5G (bytes per second).")
+    rate = int(float(match.group(1)) * RATE_MULTIPLIERS[match.group(2) and match.group(2).lower()])
+    return rate or None
+
+
+class BandwidthBudget:
+    """Splits a total download rate across the active downloads in proportion to their weights.
+
+    Every registered DownloadHandle gets its share written to handle.rate_limit
+    whenever a download starts or finishes, a weight changes or the total
+    changes; the engines pick the new value up while downloading. A total of
+    None means unlimited.
+    """
+
+    def __init__(self, total_rate=None):
+        self.total_rate = total_rate
+        self._lock = threading.Lock()
+        self._downloads = {} # key: [handle, weight]
+
+    def set_total_rate(self, total_rate):
+        with self._lock:
+            self.total_rate = total_rate
+            self._rebalance()
+
+    def add(self, key, handle, weight=BACKGROUND_WEIGHT):
+        with self._lock:
+            self._downloads[key] = [handle, weight]
+            self._rebalance()
+
+    def set_weight(self, key, weight):
+        """Changes the weight of a running download. Returns False if it is not registered."""
+        with self._lock:
+            entry = self._downloads.get(key)
+            if entry is None:
+                return False
+            entry[1] = weight
+            self._rebalance()
+            return True
+
+    def remove(self, key):
+        with self._lock:
+            if self._downloads.pop(key, None) is not None:
+                self._rebalance()
+
+    def shares(self):
+        """Returns the current rate limit per key (None when unlimited)."""
+        with self._lock:
+            return {key: entry[0].rate_limit for key, entry in self._downloads.items()}
+
+    def _rebalance(self):
+        total_weight = sum(weight for _, weight in self._downloads.values())
+        for handle, weight in self._downloads.values():
+            if self.total_rate is None:
+                handle.rate_limit = None
+            else:
+                handle.rate_limit = max(1, int(self.total_rate * weight / total_weight))
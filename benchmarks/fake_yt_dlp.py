@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Stand-in for the yt-dlp executable, so benchmarks measure this project and not YouTube.
+
+Understands the options the engines pass: --version, --flat-playlist -j and
+downloads with or without --progress-template. Everything else is ignored.
+Behavior is set through environment variables:
+
+  FAKE_YTDLP_ENTRIES         entries printed for --flat-playlist (default 10000)
+  FAKE_YTDLP_PAGE_SIZE       entries per simulated playlist page (default 100)
+  FAKE_YTDLP_PAGE_DELAY      seconds spent "fetching" each page (default 0)
+  FAKE_YTDLP_SIZE            bytes per downloaded video (default 20 MiB)
+  FAKE_YTDLP_DURATION        seconds per download (default 1.0)
+  FAKE_YTDLP_PROGRESS_RATE   progress lines per second during a download (default 20)
+  FAKE_YTDLP_WRITE           "1" to write the output file named by -o (default: nothing is written)
+"""
+import json
+import os
+import sys
+import time
+
+def env_number(name, default):
+    return float(os.environ.get(name, default))
+
+def flat_entry(index):
+    """One --flat-playlist -j line, with the fields yt-dlp really prints for a YouTube playlist entry."""
+    video_id = f"fake{index:07d}"
+    return {
+        "_type": "url",
+        "ie_key": "Youtube",
+        "id": video_id,
+        "url": f"https://www.youtube.com/watch?v={video_id}",
+        "title": f"Benchmark video number {index} with a reasonably long title",
+        "description": None,
+        "duration": 180 + index % 600,
+        "channel_id": "UCbenchmarkchannel0000000",
+        "channel": "Benchmark Channel",
+        "channel_url": "https://www.youtube.com/channel/UCbenchmarkchannel0000000",
+        "uploader": "Benchmark Channel",
+        "uploader_id": "@benchmark",
+        "uploader_url": "https://www.youtube.com/@benchmark",
+        "thumbnails": [
+            {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg?sqp=-oaymwE1CKgBEF5IVfKriqkDKAgBFQAAiEIYAXABwAEG", "height": 94, "width": 168},
+            {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg?sqp=-oaymwE1CMQBEG5IVfKriqkDKAgBFQAAiEIYAXABwAEG", "height": 110, "width": 196},
+            {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg?sqp=-oaymwE2CPYBEIoBSFXyq4qpAygIARUAAIhCGAFwAcABBg==", "height": 138, "width": 246},
+            {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg?sqp=-oaymwE2CNACELwBSFXyq4qpAygIARUAAIhCGAFwAcABBg==", "height": 188, "width": 336},
+        ],
+        "timestamp": None,
+        "release_timestamp": None,
+        "availability": None,
+        "view_count": 1000 + index,
+        "live_status": None,
+        "channel_is_verified": None,
+        "__x_forwarded_for_ip": None,
+        "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        "original_url": f"https://www.youtube.com/watch?v={video_id}",
+        "webpage_url_basename": "watch",
+        "webpage_url_domain": "youtube.com",
+        "extractor": "youtube",
+        "extractor_key": "Youtube",
+        "playlist_count": None,
+        "playlist": "Benchmark playlist",
+        "playlist_id": "PLbenchmark",
+        "playlist_title": "Benchmark playlist",
+        "playlist_uploader": "Benchmark Channel",
+        "playlist_uploader_id": "@benchmark",
+        "n_entries": None,
+        "playlist_index": index + 1,
+        "playlist_autonumber": index + 1,
+        "epoch": int(time.time()),
+        "_version": {"version": "2025.01.01", "release_git_head": None, "repository": "yt-dlp/yt-dlp"},
+    }
+
+def flat_playlist():
+    entries = int(env_number("FAKE_YTDLP_ENTRIES", 10000))
+    page_size = max(1, int(env_number("FAKE_YTDLP_PAGE_SIZE", 100)))
+    page_delay = env_number("FAKE_YTDLP_PAGE_DELAY", 0)
+    for start in range(0, entries, page_size):
+        if page_delay:
+            time.sleep(page_delay)
+        page = "".join(json.dumps(flat_entry(index)) + "\n" for index in range(start, min(entries, start + page_size)))
+        sys.stdout.write(page)
+        sys.stdout.flush()
+
+def option_value(args, name):
+    return args[args.index(name) + 1] if name in args else None
+
+def download(args):
+    url = args[-1]
+    video_id = url.rsplit("=", 1)[-1]
+    size = int(env_number("FAKE_YTDLP_SIZE", 20 * 1024 * 1024))
+    duration = env_number("FAKE_YTDLP_DURATION", 1.0)
+    steps = max(1, int(duration * env_number("FAKE_YTDLP_PROGRESS_RATE", 20)))
+    structured = "--progress-template" in args
+    template = option_value(args, "-o") or "%(title)s [%(id)s].%(ext)s"
+    filename = template.replace("%(title)s", f"Benchmark video {video_id}").replace("%(id)s", video_id).replace("%(ext)s", "mp4")
+    speed = size / duration if duration else float(size)
+
+    print(f"[youtube] Extracting URL: {url}", flush=True)
+    print(f"[youtube] {video_id}: Downloading webpage", flush=True)
+    print(f"[info] {video_id}: Downloading 1 format(s): 18", flush=True)
+    print(f"[download] Destination: {filename}", flush=True)
+    started_at = time.monotonic()
+    for step in range(steps + 1):
+        downloaded = size * step // steps
+        eta = int((steps - step) * duration / steps)
+        if structured:
+            status = "finished" if step == steps else "downloading"
+            print(f"[progress] {status} {downloaded} {size} {speed:.1f} {eta} NA NA", flush=True)
+        else:
+            print(f"[download] {100.0 * step / steps:5.1f}% of {size / 1048576:.2f}MiB at {speed / 1048576:.2f}MiB/s ETA 00:{eta:02d}", flush=True)
+        # Sleep towards the step's deadline, so the stream rate does not drift with print overhead
+        delay = started_at + (step + 1) * duration / steps - time.monotonic()
+        if delay > 0 and step < steps:
+            time.sleep(delay)
+    if os.environ.get("FAKE_YTDLP_WRITE") == "1":
+        with open(filename, "wb") as output_file:
+            output_file.write(b"\0" * min(size, 4096))
+
+def main(args):
+    if "--version" in args:
+        print("2025.01.01")
+    elif "--flat-playlist" in args:
+        flat_playlist()
+    else:
+        download(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""Measures this project's own overhead with benchmarks/fake_yt_dlp.py standing in for yt-dlp.
+
+Each benchmark runs in a fresh child process with its own empty cache and data
+directories, so peak RSS and thread counts belong to that benchmark alone.
+Results are printed as a table; --json saves them and --compare reports the
+change against a saved run and exits with 1 if any metric got worse by more
+than --threshold.
+
+  python benchmarks/run_benchmarks.py
+  python benchmarks/run_benchmarks.py --only fetch_playlist selection --entries 50000
+  python benchmarks/run_benchmarks.py --json base.json
+  python benchmarks/run_benchmarks.py --compare base.json
+  python benchmarks/run_benchmarks.py --xvfb          # GUI benchmarks without a display (needs Xvfb)
+
+The GUI benchmarks are skipped when customtkinter or a display is missing.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import stat
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError: # Windows: no getrusage, peak RSS is not reported
+    resource = None
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+FAKE_YT_DLP = os.path.join(BENCHMARK_DIR, "fake_yt_dlp.py")
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLbenchmark"
+
+THREAD_SAMPLE_INTERVAL = 0.005
+GUI_POLL_INTERVAL = 0.001 # Sleep between Tk update() calls while a GUI benchmark waits
+DEFAULT_THRESHOLD = 10.0  # Percent change that counts as a regression with --compare
+DEFAULT_REPEAT = 3        # Runs per benchmark; the median of each metric is reported
+# Metrics that describe the run or the fake rather than this project; they never regress
+DESCRIPTIVE_METRICS = ('entries', 'videos', 'jobs', 'selected', 'failed', 'ideal_s', 'fake_output_s')
+
+sys.path.insert(0, REPO_DIR)
+
+
+# --- Measurement helpers ---
+
+class ThreadSampler:
+    """Samples the number of live Python threads in the background and keeps the peak."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(THREAD_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, threading.active_count() - 1) # Not counting the sampler itself
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def cpu_seconds():
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def load_script(name, filename):
+    """Imports one of the front-end scripts, whose file names are not valid module names."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_engine():
+    from download_engine import SubprocessEngine
+
+    class CountingEngine(SubprocessEngine):
+        """SubprocessEngine that counts the progress events it delivers and the downloads that failed."""
+
+        progress_events = 0
+        failures = 0
+
+        def download(self, url, handle=None, output_template=None, audio_only=False, on_progress=None, on_output=None,
+                     extract_audio=True, format_selector=None, info_file=None):
+            def counting_progress(event):
+                CountingEngine.progress_events += 1
+                if on_progress:
+                    on_progress(event)
+            result = super().download(url, handle, output_template, audio_only, counting_progress, on_output, extract_audio,
+                                      format_selector, info_file)
+            if not result['success']:
+                CountingEngine.failures += 1
+            return result
+
+    return CountingEngine(FAKE_YT_DLP)
+
+def fake_entries(count):
+    return [{'id': f"fake{index:07d}", 'title': f"Benchmark video number {index}",
+             'url': f"https://www.youtube.com/watch?v=fake{index:07d}"} for index in range(count)]
+
+def timed(function, *args, **kwargs):
+    started_at = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started_at
+
+
+# --- CLI benchmarks ---
+
+def bench_fetch_playlist(options):
+    """fetch_playlist_info end to end, against the time the fake alone needs to print the same output."""
+    cli = load_script("youtube_download_cli", "youtube_Download-cli.py")
+    engine = make_engine()
+
+    _, fake_seconds = timed(subprocess.run, [FAKE_YT_DLP, "--flat-playlist", "-j", PLAYLIST_URL],
+                            stdout=subprocess.DEVNULL, check=True)
+    entries, total_seconds = timed(cli.fetch_playlist_info, PLAYLIST_URL, engine)
+
+    first_entry = []
+    started_at = time.perf_counter()
+    engine.fetch_playlist(PLAYLIST_URL, on_entry=lambda entry: first_entry or first_entry.append(time.perf_counter()))
+    return {
+        'entries': len(entries),
+        'fetch_s': round(total_seconds, 3),
+        'fake_output_s': round(fake_seconds, 3),
+        'parse_overhead_s': round(max(0.0, total_seconds - fake_seconds), 3),
+        'entries_per_s': round(len(entries) / total_seconds),
+        'first_entry_ms': round((first_entry[0] - started_at) * 1000, 1) if first_entry else None,
+    }
+
+def bench_selection(options):
+    """parse_selection on large playlists, and prompt_for_selection including its listing of every title."""
+    cli = load_script("youtube_download_cli", "youtube_Download-cli.py")
+    count = options.entries
+    videos = fake_entries(count)
+    every_third = ",".join(str(index) for index in range(1, count + 1, 3))
+    ranges = " ".join(f"{start}-{min(count, start + 9)}" for start in range(1, count + 1, 20))
+    metrics = {'entries': count}
+    for label, selection in (('all', "all"), ('range', f"1-{count}"), ('list', every_third), ('ranges', ranges)):
+        _, seconds = timed(cli.parse_selection, selection, count)
+        metrics[f"parse_{label}_ms"] = round(seconds * 1000, 2)
+
+    cli.input = lambda prompt="": f"1-{count}" # Shadows the builtin inside the CLI module only
+    with contextlib.redirect_stdout(io.StringIO()):
+        selected, seconds = timed(cli.prompt_for_selection, videos)
+    metrics['prompt_ms'] = round(seconds * 1000, 1)
+    metrics['selected'] = len(selected)
+    return metrics
+
+def run_download_videos(options, jobs):
+    cli = load_script("youtube_download_cli", "youtube_Download-cli.py")
+    engine = make_engine()
+    videos = fake_entries(options.videos)
+    cpu_before = cpu_seconds()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        _, seconds = timed(cli.download_videos, videos, jobs=jobs, engine=engine)
+    waves = -(-options.videos // jobs)
+    ideal = waves * options.download_seconds
+    return {
+        'videos': options.videos,
+        'jobs': jobs,
+        'wall_s': round(seconds, 3),
+        'ideal_s': round(ideal, 3),
+        'overhead_per_video_ms': round(max(0.0, seconds - ideal) / options.videos * 1000, 1),
+        'progress_events_per_s': round(engine.progress_events / seconds),
+        'cpu_s': round(cpu_seconds() - cpu_before, 3),
+        'failed': engine.failures,
+    }
+
+def bench_download_sequential(options):
+    """download_videos one video at a time."""
+    return run_download_videos(options, jobs=1)
+
+def bench_download_parallel(options):
+    """download_videos on the scheduler with --jobs workers and the multiplexed progress display."""
+    return run_download_videos(options, jobs=options.jobs)
+
+
+# --- GUI benchmarks ---
+
+def start_gui():
+    """Returns (app, stats) with Tk callbacks counted, or raises RuntimeError if no GUI is possible."""
+    try:
+        import tkinter
+        gui = load_script("youtube_downloader_gui", "youtube_downloader-gui.py")
+    except ImportError as e:
+        raise RuntimeError(f"GUI dependencies missing ({e})") from None
+    try:
+        app = gui.YouTubeDownloaderApp()
+    except tkinter.TclError as e:
+        raise RuntimeError(f"no display ({e}); try --xvfb") from None
+    stats = {'callbacks': 0}
+    schedule = app.after
+
+    def counting_after(delay, callback=None, *args):
+        if callback is None:
+            return schedule(delay)
+        def counted(*callback_args):
+            stats['callbacks'] += 1
+            return callback(*callback_args)
+        return schedule(delay, counted, *args)
+
+    app.after = counting_after # Instance attribute: every self.after() in the app goes through it
+    app.engine = make_engine()
+    app.playlist_cache = None  # Always stream from the fetch, never show a cached list
+    return app, stats
+
+def pump(app, done, timeout):
+    """Runs the Tk loop until done() is true. Returns the seconds it took."""
+    started_at = time.perf_counter()
+    while not done():
+        app.update()
+        if time.perf_counter() - started_at > timeout:
+            raise RuntimeError("timed out waiting for the GUI")
+        time.sleep(GUI_POLL_INTERVAL)
+    return time.perf_counter() - started_at
+
+def bench_gui_fetch(options):
+    """fetch_playlist_titles streaming into the list, then display_videos on the full list."""
+    app, stats = start_gui()
+    try:
+        app.update()
+        app.url_entry.insert(0, PLAYLIST_URL)
+        started_at = time.perf_counter()
+        callbacks_before = stats['callbacks']
+        app.start_fetch_thread()
+        first_row = pump(app, lambda: app.video_info_list, options.timeout)
+        pump(app, lambda: app.status_label.cget("text").startswith(("Found", "No videos")), options.timeout)
+        total = time.perf_counter() - started_at
+        callbacks = stats['callbacks'] - callbacks_before
+
+        entries = list(app.video_info_list)
+        app.video_list.clear()
+        app.update()
+        app.video_info_list = entries
+        _, display_seconds = timed(lambda: (app.display_videos(), app.update_idletasks()))
+        return {
+            'entries': len(entries),
+            'first_row_ms': round(first_row * 1000, 1),
+            'fetch_to_ready_s': round(total, 3),
+            'rows_per_s': round(len(entries) / total),
+            'tk_callbacks_per_s': round(callbacks / total, 1),
+            'display_videos_ms': round(display_seconds * 1000, 1),
+        }
+    finally:
+        app.destroy()
+
+def bench_gui_download(options):
+    """Download All through run_download, with progress coalesced onto the UI_REFRESH_MS tick."""
+    app, stats = start_gui()
+    try:
+        app.set_max_concurrency(options.jobs)
+        app.video_info_list = fake_entries(options.videos)
+        app.display_videos()
+        app.update()
+        callbacks_before = stats['callbacks']
+        started_at = time.perf_counter()
+        cpu_before = cpu_seconds()
+        app.download_all()
+        pump(app, lambda: app.scheduler.is_idle() and not app.pending_row_updates, options.timeout)
+        seconds = time.perf_counter() - started_at
+        waves = -(-options.videos // options.jobs)
+        ideal = waves * options.download_seconds
+        return {
+            'videos': options.videos,
+            'jobs': options.jobs,
+            'wall_s': round(seconds, 3),
+            'overhead_per_video_ms': round(max(0.0, seconds - ideal) / options.videos * 1000, 1),
+            'progress_events_per_s': round(app.engine.progress_events / seconds),
+            'row_updates_posted_per_s': round(app.ui_stats['updates_received'] / seconds),
+            'row_updates_applied_per_s': round(app.ui_stats['rows_applied'] / seconds),
+            'tk_callbacks_per_s': round((stats['callbacks'] - callbacks_before) / seconds, 1),
+            'cpu_s': round(cpu_seconds() - cpu_before, 3),
+            'failed': app.engine.failures,
+        }
+    finally:
+        app.destroy()
+
+
+BENCHMARKS = {
+    'fetch_playlist': bench_fetch_playlist,
+    'selection': bench_selection,
+    'download_sequential': bench_download_sequential,
+    'download_parallel': bench_download_parallel,
+    'gui_fetch': bench_gui_fetch,
+    'gui_download': bench_gui_download,
+}
+
+
+# --- Orchestration ---
+
+def fake_environment(options, home):
+    env = dict(os.environ)
+    env.update({
+        'FAKE_YTDLP_ENTRIES': str(options.entries),
+        'FAKE_YTDLP_PAGE_SIZE': str(options.page_size),
+        'FAKE_YTDLP_PAGE_DELAY': str(options.page_delay),
+        'FAKE_YTDLP_DURATION': str(options.download_seconds),
+        'FAKE_YTDLP_PROGRESS_RATE': str(options.progress_rate),
+        # Empty cache/data directories: no cached playlists, archive entries or journal to resume
+        'XDG_CACHE_HOME': os.path.join(home, "cache"),
+        'XDG_DATA_HOME': os.path.join(home, "data"),
+        'XDG_RUNTIME_DIR': os.path.join(home, "run"), # Never talk to a download daemon the user is running
+        'LOCALAPPDATA': os.path.join(home, "cache"),
+        'APPDATA': os.path.join(home, "data"),
+        'HOME': home,
+    })
+    return env
+
+def run_child(options):
+    """Runs one benchmark in this process and prints its metrics as JSON."""
+    os.chdir(tempfile.mkdtemp(prefix="download-", dir=os.environ['HOME']))
+    with ThreadSampler() as sampler:
+        try:
+            metrics = BENCHMARKS[options.child](options)
+        except RuntimeError as e:
+            metrics = {'skipped': str(e)}
+    if 'skipped' not in metrics:
+        metrics['peak_threads'] = sampler.peak
+        metrics['peak_rss_mb'] = peak_rss_mb()
+    print(json.dumps(metrics))
+
+def run_benchmark(name, options, argv):
+    """Runs a benchmark options.repeat times and returns the median of every numeric metric."""
+    runs = []
+    for _ in range(options.repeat):
+        metrics = run_benchmark_once(name, options, argv)
+        if 'error' in metrics or 'skipped' in metrics:
+            return metrics
+        runs.append(metrics)
+    median = {}
+    for metric, value in runs[0].items():
+        values = [run.get(metric) for run in runs]
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            value = statistics.median(values)
+        median[metric] = value
+    return median
+
+def run_benchmark_once(name, options, argv):
+    home = tempfile.mkdtemp(prefix="yt-benchmark-")
+    try:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name] + argv,
+            env=fake_environment(options, home), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    if process.returncode != 0:
+        return {'error': (process.stderr.strip().splitlines() or [f"exit code {process.returncode}"])[-1]}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+def compare(name, metric, value, baseline, threshold):
+    """Returns (change text, regressed) for one metric against the baseline run."""
+    old = baseline.get(name, {}).get(metric)
+    if metric in DESCRIPTIVE_METRICS or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+        return "", False
+    change = (value - old) / old * 100
+    worse = -change if higher_is_better(metric) else change
+    return f"{change:+.1f}%", worse > threshold
+
+def print_results(results, baseline, threshold):
+    regressions = []
+    width = max(len(metric) for metrics in results.values() for metric in metrics) + 2
+    for name, metrics in results.items():
+        print(f"\n{name}")
+        for metric, value in metrics.items():
+            change, regressed = compare(name, metric, value, baseline, threshold) if baseline else ("", False)
+            marker = "  REGRESSION" if regressed else ""
+            print(f"  {metric:<{width}} {value!s:>12}  {change:>8}{marker}")
+            if regressed:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+def start_xvfb():
+    """Starts a virtual X server for the GUI benchmarks. Returns the process."""
+    if not shutil.which("Xvfb"):
+        sys.exit("Error: --xvfb needs the Xvfb executable.")
+    display = f":{90 + os.getpid() % 100}"
+    process = subprocess.Popen(["Xvfb", display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0) # Give the server time to accept connections
+    os.environ['DISPLAY'] = display
+    return process
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the downloader against a local fake yt-dlp.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--entries", type=int, default=10000, help="playlist entries (default: 10000)")
+    parser.add_argument("--page-size", type=int, default=100, help="entries per fake playlist page (default: 100)")
+    parser.add_argument("--page-delay", type=float, default=0.0, help="seconds per fake playlist page (default: 0)")
+    parser.add_argument("--videos", type=int, default=12, help="videos per download benchmark (default: 12)")
+    parser.add_argument("--jobs", type=int, default=4, help="parallel downloads (default: 4)")
+    parser.add_argument("--download-seconds", type=float, default=1.0, help="duration of one fake download (default: 1.0)")
+    parser.add_argument("--progress-rate", type=float, default=50.0,
+                        help="progress lines per second per fake download (default: 50)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"runs per benchmark, the median is reported (default: {DEFAULT_REPEAT})")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds before a GUI benchmark gives up")
+    parser.add_argument("--json", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare against results saved with --json")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"percent change reported as a regression with --compare (default: {DEFAULT_THRESHOLD:g})")
+    parser.add_argument("--xvfb", action="store_true", help="run the GUI benchmarks on a private Xvfb display")
+    parser.add_argument("--child", choices=list(BENCHMARKS), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    options = parse_args(argv)
+    if options.child:
+        run_child(options)
+        return 0
+
+    # The engines run the fake directly, like the real yt-dlp executable
+    mode = os.stat(FAKE_YT_DLP).st_mode
+    os.chmod(FAKE_YT_DLP, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    baseline = None
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+    xvfb = start_xvfb() if options.xvfb else None
+    child_argv = [arg for arg in argv if arg not in ("--xvfb",)]
+    results = {}
+    try:
+        for name in options.only or BENCHMARKS:
+            print(f"Running {name}...", file=sys.stderr, flush=True)
+            results[name] = run_benchmark(name, options, child_argv)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+    regressions = print_results(results, baseline, options.threshold)
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as results_file:
+            json.dump({'options': {key: value for key, value in vars(options).items()
+                                   if key not in ('child', 'json', 'compare', 'only', 'xvfb', 'threshold')},
+                       'results': results}, results_file, indent=2)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {options.threshold:g}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
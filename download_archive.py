@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+import time
+import os
+import re
+from urllib.parse import urlparse, parse_qs
+from app_paths import user_data_dir
+
+# Variants of the same video are archived separately: a video download does not cover its MP3
+VARIANT_VIDEO = "video"
+VARIANT_MP3 = "mp3"
+
+YOUTU_BE_PATH = re.compile(r'^/([\w-]{11})')
+SHORTS_PATH = re.compile(r'^/(?:shorts|embed|live)/([\w-]{11})')
+
+def video_id_of(video_info):
+    """Returns the video ID of an entry, derived from its URL when the entry has no 'id'."""
+    if video_info.get('id'):
+        return video_info['id']
+    url = video_info['url']
+    parsed = urlparse(url)
+    if parsed.hostname and parsed.hostname.endswith("youtu.be"):
+        match = YOUTU_BE_PATH.match(parsed.path)
+        if match:
+            return match.group(1)
+    query_id = parse_qs(parsed.query).get('v')
+    if query_id:
+        return query_id[0]
+    match = SHORTS_PATH.match(parsed.path)
+    if match:
+        return match.group(1)
+    return url # Non-YouTube sites: the URL itself is the most stable key we have
+
+
+class DownloadArchive:
+    """Persistent index of completed downloads, keyed by (video ID, variant).
+
+    All keys are loaded into a set once, so lookups are O(1) in memory; new
+    completions are appended to the SQLite file as they happen.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(user_data_dir(), "archive.sqlite3")
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS downloads ("
+                " video_id TEXT NOT NULL,"
+                " variant TEXT NOT NULL,"
+                " filename TEXT,"
+                " completed_at REAL NOT NULL,"
+                " PRIMARY KEY (video_id, variant))"
+            )
+            self._keys = set(conn.execute("SELECT video_id, variant FROM downloads"))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def contains(self, video_id, variant=VARIANT_VIDEO):
+        return (video_id, variant) in self._keys
+
+    def add(self, video_id, variant=VARIANT_VIDEO, filename=None):
+        """Records a completed download. Safe to call from worker threads."""
+        with self._lock:
+            self._keys.add((video_id, variant))
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO downloads (video_id, variant, filename, completed_at) VALUES (?, ?, ?, ?)",
+                    (video_id, variant, filename, time.time())
+                )
+
+    def files_in(self, directory):
+        """Returns {video_id: [filename, ...]} for archived downloads saved directly in a directory."""
+        directory = os.path.normcase(os.path.abspath(directory))
+        files = {}
+        with self._connect() as conn:
+            rows = conn.execute("SELECT video_id, filename FROM downloads WHERE filename IS NOT NULL").fetchall()
+        for video_id, filename in rows:
+            if os.path.normcase(os.path.dirname(os.path.abspath(filename))) == directory:
+                files.setdefault(video_id, []).append(filename)
+        return files
+
+    def remove(self, video_id, variant=VARIANT_VIDEO):
+        with self._lock:
+            self._keys.discard((video_id, variant))
+            with self._connect() as conn:
+                conn.execute("DELETE FROM downloads WHERE video_id = ? AND variant = ?", (video_id, variant))
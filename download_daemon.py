@@ -0,0 +1,861 @@
+import argparse
+import atexit
+import itertools
+import json
+import os
+import queue
+import select
+import signal
+import socket
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app_paths import user_cache_dir, user_runtime_dir
+from bandwidth_budget import BandwidthBudget, parse_rate
+from download_archive import DownloadArchive, VARIANT_VIDEO, video_id_of
+from download_engine import ENGINE_CHOICES, DownloadHandle, ProgressEvent, create_engine
+from download_jobs import check_selection, download_video, parse_selection, queue_job, record_attempt, reserve_space
+from title_index import TitleIndex
+from download_scheduler import DownloadScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, RetryAfter
+from fragment_tuner import FixedFragments, FragmentTuner
+from job_journal import JobJournal, JOB_CANCELLED, JOB_QUEUED
+from metrics import MetricsRegistry, start_exporters
+from playlist_cache import PlaylistCache
+from retry import DEFAULT_MAX_ATTEMPTS, RetryManager, RetryPolicy
+from staging import DiskSpaceGuard, StagingArea, staging_dir_from_env
+
+DAEMON_SOCKET_NAME = "daemon.sock"
+DAEMON_LOG_NAME = "daemon.log"
+DEFAULT_DAEMON_JOBS = 3
+DAEMON_FETCH_WORKERS = 4
+# How long a client waits for a daemon it started to accept connections
+DAEMON_START_TIMEOUT = 15.0
+# Minimum gap between progress records per video, and between queue statistics records
+DAEMON_PROGRESS_INTERVAL = 0.25
+DAEMON_STATS_INTERVAL = 1.0
+# Records buffered per watching client; a client that falls further behind is disconnected
+WATCH_BACKLOG = 10000
+# Finished jobs still listed by 'status'
+FINISHED_JOBS_KEPT = 1000
+
+# Job fields a client may submit, and the states a job goes through in the daemon
+JOB_FIELDS = ('url', 'title', 'id', 'duration', 'output_template', 'audio_only', 'format', 'size', 'info_file',
+              'playlist')
+STATE_QUEUED = "queued"
+STATE_ACTIVE = "active"
+STATE_RETRYING = "retrying"
+UNFINISHED_STATES = (STATE_QUEUED, STATE_ACTIVE, STATE_RETRYING)
+
+def default_socket_path():
+    return os.path.join(user_runtime_dir(), DAEMON_SOCKET_NAME)
+
+def daemon_supported():
+    """True if this platform has Unix domain sockets."""
+    return hasattr(socket, "AF_UNIX")
+
+def progress_event_of(record):
+    """Rebuilds the engine's ProgressEvent from a 'progress' record."""
+    return ProgressEvent(record['status'], record.get('downloaded_bytes'), record.get('total_bytes'), record.get('speed'),
+                         record.get('eta'), record.get('fragment_index'), record.get('fragment_count'))
+
+
+class DaemonError(Exception):
+    """The daemon could not be reached or rejected a request."""
+
+
+class DownloadDaemon:
+    """Owns the download queue, scheduler and engine for every front end on the machine.
+
+    Clients submit playlists (fetched here) and single videos, and follow
+    them through watch(). Videos are keyed by URL, so a video submitted by two
+    clients downloads once and is reported to both: every record names the
+    submissions it belongs to. A submission ends with a 'summary' record once
+    its playlists are fetched and all of its videos have finished. Jobs
+    only start while their estimated sizes fit the free disk space, and with
+    a StagingArea they are downloaded there and moved into place when done.
+    """
+
+    def __init__(self, engine, jobs=DEFAULT_DAEMON_JOBS, cache=None, archive=None, journal=None, budget=None,
+                 tuner=None, retry_policy=None, metrics=None, staging=None, space=None):
+        self.engine = engine
+        self.cache = cache
+        self.archive = archive
+        self.journal = journal
+        self.budget = budget or BandwidthBudget()
+        self.tuner = tuner
+        self._auto_tuner = tuner if isinstance(tuner, FragmentTuner) else None # Kept while a fixed level is set
+        self.metrics = metrics
+        self.staging = staging
+        self.space = space or DiskSpaceGuard()
+        self.scheduler = DownloadScheduler(self.run_job, max_workers=jobs, admit=self._admit)
+        self.retries = RetryManager(retry_policy, self.scheduler) # Throttling pauses the whole queue
+        self.started_at = time.time()
+        self._fetch_pool = ThreadPoolExecutor(max_workers=DAEMON_FETCH_WORKERS)
+        self._lock = threading.Lock()
+        self._jobs = {}                 # video url: job dict, plus 'state', 'submissions' and the latest progress
+        self._handles = {}              # video url: DownloadHandle of the running attempt
+        self._finished = deque()        # urls of finished jobs, oldest first
+        self._submissions = {}          # id: counts, 'pending' playlist fetches and 'videos' (urls)
+        self._ids = itertools.count(1)
+        self._last_progress = {}        # video url: time of the last progress record
+        self._watch_lock = threading.Lock()
+        self._watchers = set()          # One queue of JSON lines per watching client
+        self._stopping = False
+        if metrics is not None:
+            metrics.gauge('downloads_active', lambda: self.scheduler.stats()['active'])
+            metrics.gauge('downloads_queued', lambda: self.scheduler.stats()['queued'])
+        threading.Thread(target=self._stats_loop, name="daemon-stats", daemon=True).start()
+
+    # --- Requests ---
+
+    def handle_request(self, command, fields):
+        """Runs one client request and returns the response fields. Raises ValueError for a bad request."""
+        if command == 'ping':
+            return {'pid': os.getpid(), 'engine': self.engine.name}
+        if command == 'submit':
+            submission, queued = self.submit(
+                urls=fields.get('urls') or (), videos=fields.get('videos') or (), select=fields.get('select', "all"),
+                directory=fields.get('directory'), redownload=bool(fields.get('redownload')),
+                priority=int(fields.get('priority', PRIORITY_NORMAL))
+            )
+            return {'submission': submission, 'queued': queued}
+        if command == 'promote':
+            return {'promoted': self.scheduler.promote(fields['video'], int(fields.get('priority', PRIORITY_HIGH)))}
+        if command == 'cancel':
+            dequeued, stopping = self.cancel(fields.get('videos'))
+            return {'dequeued': dequeued, 'stopping': stopping}
+        if command == 'status':
+            return self.status()
+        if command == 'configure':
+            if fields.get('jobs'):
+                self.scheduler.set_max_workers(int(fields['jobs']))
+            if 'limit_rate' in fields:
+                self.budget.set_total_rate(fields['limit_rate'])
+            if 'fragments' in fields:
+                self.set_fragments(fields['fragments'])
+            return {'max_workers': self.scheduler.max_workers, 'limit_rate': self.budget.total_rate}
+        raise ValueError(f"Unknown command: {command}")
+
+    def submit(self, urls=(), videos=(), select="all", directory=None, redownload=False, priority=PRIORITY_NORMAL):
+        """Queues single videos and starts fetching playlists. Returns (submission id, URLs of newly queued videos).
+
+        Single videos are always queued; playlist entries already in the
+        download archive are skipped unless redownload is set. Jobs without an
+        output template are saved in directory.
+        """
+        if urls and select.strip().lower() != "all":
+            check_selection(select) # Rejects a malformed selection before anything is fetched
+        submission = next(self._ids)
+        with self._lock:
+            self._submissions[submission] = {'pending': len(urls), 'videos': set(), 'playlists': len(urls),
+                                             'playlists_failed': 0, 'succeeded': 0, 'failed': 0, 'cancelled': 0,
+                                             'skipped': 0, 'retries': 0, 'started_at': time.monotonic()}
+        queued = [video['url'] for video in videos
+                  if self._queue(submission, video, directory, priority, skip_archived=False)]
+        for url in urls:
+            self._fetch_pool.submit(self._fetch, submission, url, select, directory, not redownload, priority)
+        self._check_done(submission)
+        return submission, queued
+
+    def set_fragments(self, fragments):
+        """Sets the fragment concurrency of downloads started from now on: a level, 'auto' or None (yt-dlp's default)."""
+        if fragments is None:
+            self.tuner = None
+        elif fragments == "auto":
+            if self._auto_tuner is None:
+                self._auto_tuner = FragmentTuner()
+            self.tuner = self._auto_tuner
+        else:
+            try:
+                self.tuner = FixedFragments(fragments_arg(str(fragments)))
+            except ValueError:
+                raise ValueError(f"Invalid fragments: {fragments!r} (use a positive integer or 'auto').") from None
+
+    def cancel(self, video_urls=None):
+        """Cancels queued and running videos (default: all unfinished ones). Returns (dequeued urls, stopping urls)."""
+        with self._lock:
+            if video_urls is None:
+                video_urls = [url for url, job in self._jobs.items() if job['state'] in UNFINISHED_STATES]
+            handles = {url: self._handles[url] for url in video_urls if url in self._handles}
+        dequeued = [url for url in video_urls if self.scheduler.cancel(url)]
+        for url in dequeued:
+            if self.journal is not None:
+                self.journal.record(JOB_CANCELLED, url)
+            self._finish(url, {'success': False, 'cancelled': True, 'error': None})
+        for handle in handles.values():
+            handle.terminate() # run_job reports the result
+        return dequeued, sorted(handles)
+
+    def status(self):
+        stats = self.scheduler.stats()
+        with self._lock:
+            jobs = [{key: value for key, value in job.items() if key != 'submissions'} for job in self._jobs.values()]
+        return {'pid': os.getpid(), 'engine': self.engine.name, 'uptime': round(time.time() - self.started_at, 1),
+                'limit_rate': self.budget.total_rate, 'stats': stats, 'jobs': jobs}
+
+    def resume(self):
+        """Queues the jobs an earlier daemon left unfinished (it was stopped or crashed)."""
+        if self.journal is None:
+            return
+        jobs = self.journal.resumable_jobs()
+        if jobs:
+            submission, queued = self.submit(videos=jobs)
+            self._emit('resume', submissions=(submission,), videos=len(queued))
+
+    def stop(self, timeout=10.0):
+        """Stops starting jobs and ends running downloads. The journal resumes all of them at the next start."""
+        self._stopping = True
+        self.scheduler.clear() # Still 'queued' or 'retrying' in the journal
+        with self._lock:
+            handles = list(self._handles.values())
+        for handle in handles:
+            handle.terminate()
+        deadline = time.monotonic() + timeout
+        while not self.scheduler.is_idle() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self._fetch_pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Watching ---
+
+    def watch(self):
+        """Registers a watcher. Returns the queue its records (JSON lines) are put on."""
+        watcher = queue.Queue(maxsize=WATCH_BACKLOG)
+        with self._watch_lock:
+            self._watchers.add(watcher)
+        return watcher
+
+    def unwatch(self, watcher):
+        with self._watch_lock:
+            self._watchers.discard(watcher)
+
+    def is_watching(self, watcher):
+        with self._watch_lock:
+            return watcher in self._watchers
+
+    def _emit(self, record_type, job=None, submissions=(), **fields):
+        record = {'type': record_type, 'time': round(time.time(), 3)}
+        if job is not None:
+            record.update(video=job['url'], title=job['title'], playlist=job.get('playlist'))
+            submissions = job['submissions']
+        record['submissions'] = sorted(submissions)
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._watch_lock:
+            for watcher in list(self._watchers):
+                try:
+                    watcher.put_nowait(line)
+                except queue.Full:
+                    self._watchers.discard(watcher) # Too slow; its handler ends the connection
+
+    def _stats_loop(self):
+        idle_reported = False
+        while True:
+            time.sleep(DAEMON_STATS_INTERVAL)
+            idle = self.scheduler.is_idle()
+            if idle and idle_reported:
+                continue
+            idle_reported = idle
+            self._emit('stats', **self.scheduler.stats())
+
+    # --- Jobs ---
+
+    def _fetch(self, submission, playlist_url, select, directory, skip_archived, priority):
+        started_at = time.monotonic()
+        entries = None
+        try:
+            entries = self.engine.fetch_playlist(playlist_url)
+            if self.metrics is not None:
+                self.metrics.playlist_fetched(time.monotonic() - started_at, len(entries), success=bool(entries))
+            if entries and self.cache is not None:
+                self.cache.put(playlist_url, entries)
+            if not entries:
+                raise ValueError("No videos found")
+            index = TitleIndex(entries) if select.strip().lower() != "all" else None
+            selected = [entries[number - 1] for number in parse_selection(select, len(entries), index)]
+        except Exception as e:
+            if self.metrics is not None and entries is None:
+                self.metrics.playlist_fetched(time.monotonic() - started_at, 0, success=False)
+            with self._lock:
+                self._submissions[submission]['playlists_failed'] += 1
+            self._emit('playlist', submissions=(submission,), url=playlist_url, success=False, error=str(e))
+        else:
+            self._emit('playlist', submissions=(submission,), url=playlist_url, success=True, entries=len(entries),
+                       selected=len(selected))
+            # Downloads start as soon as this playlist is known, while others are still being fetched
+            for video in selected:
+                self._queue(submission, dict(video, playlist=playlist_url), directory, priority, skip_archived)
+        finally:
+            with self._lock:
+                self._submissions[submission]['pending'] -= 1
+            self._check_done(submission)
+
+    def _queue(self, submission, video, directory, priority, skip_archived):
+        """Adds a video to a submission, queuing it unless it is already unfinished. Returns True if it was queued."""
+        video = {key: video[key] for key in JOB_FIELDS if video.get(key) is not None}
+        video.setdefault('title', video['url'])
+        url = video['url']
+        with self._lock:
+            counts = self._submissions[submission]
+            job = self._jobs.get(url)
+            if job is not None and job['state'] in UNFINISHED_STATES:
+                job['submissions'].add(submission) # Joins the download another submission started
+                counts['videos'].add(url)
+                joined, archived = True, False
+            else:
+                joined = False
+                archived = (skip_archived and self.archive is not None
+                            and self.archive.contains(video_id_of(video), VARIANT_VIDEO))
+                if archived:
+                    counts['skipped'] += 1
+        if joined:
+            self.scheduler.promote(url, priority)
+            return False
+        if archived:
+            self._emit('skipped', submissions=(submission,), video=url, title=video['title'],
+                       playlist=video.get('playlist'), reason="already downloaded")
+            return False
+
+        job = queue_job(video, self.journal, directory)
+        job.update(state=STATE_QUEUED, submissions={submission})
+        with self._lock:
+            self._jobs[url] = job
+            counts['videos'].add(url)
+        self.scheduler.submit(url, priority)
+        self._emit('queued', job)
+        return True
+
+    def _admit(self, video_url):
+        # Runs under the scheduler's lock; a single dict lookup needs no self._lock
+        job = self._jobs.get(video_url)
+        return job is None or reserve_space(job, self.space, self.staging)
+
+    def run_job(self, video_url):
+        """Runs one attempt of a queued video. Called on a scheduler worker thread."""
+        handle = DownloadHandle()
+        with self._lock:
+            job = self._jobs[video_url]
+            job['state'] = STATE_ACTIVE
+            self._handles[video_url] = handle
+        self._emit('start', job)
+        started_at = time.monotonic()
+
+        def on_progress(event):
+            now = time.monotonic()
+            with self._lock:
+                job.update(percent=round(event.percent, 1), speed=event.speed, eta=event.eta)
+            if event.status != 'finished' and now - self._last_progress.get(video_url, 0) < DAEMON_PROGRESS_INTERVAL:
+                return
+            self._last_progress[video_url] = now
+            self._emit('progress', job, status=event.status, percent=round(event.percent, 1),
+                       downloaded_bytes=event.downloaded_bytes, total_bytes=event.total_bytes, speed=event.speed,
+                       eta=event.eta, fragment_index=event.fragment_index, fragment_count=event.fragment_count)
+
+        try:
+            result = download_video(job, self.engine, self.archive, self.journal, self.budget, self.tuner,
+                                    on_progress=on_progress, metrics=self.metrics,
+                                    queue_wait=self.scheduler.queue_wait(video_url), handle=handle,
+                                    staging=self.staging, space=self.space)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        finally:
+            with self._lock:
+                self._handles.pop(video_url, None)
+            self._last_progress.pop(video_url, None)
+
+        if self._stopping and result.get('cancelled'):
+            if self.journal is not None:
+                self.journal.record(JOB_QUEUED, video_url) # Interrupted by the shutdown, not by a user
+            return
+        decision = record_attempt(self.retries, job, result, started_at, self.journal, self.metrics)
+        if decision.retry_in is not None:
+            with self._lock:
+                job['state'] = STATE_RETRYING
+                for submission in job['submissions']:
+                    if submission in self._submissions:
+                        self._submissions[submission]['retries'] += 1
+            self._emit('retry', job, attempt=decision.attempt, category=decision.category, error=result.get('error'),
+                       retry_in=round(decision.retry_in, 1), queue_paused_for=round(self.scheduler.paused_for(), 1))
+            return RetryAfter(decision.retry_in)
+        self._finish(video_url, result, decision)
+
+    def _finish(self, video_url, result, decision=None):
+        if result['success']:
+            state = 'completed'
+        else:
+            state = 'cancelled' if result.get('cancelled') else 'failed'
+        with self._lock:
+            job = self._jobs[video_url]
+            job.update(state=state, error=result.get('error'))
+            for submission in job['submissions']:
+                if submission in self._submissions:
+                    self._submissions[submission]['succeeded' if result['success'] else state] += 1
+            self._finished.append(video_url)
+            while len(self._finished) > FINISHED_JOBS_KEPT:
+                old_url = self._finished.popleft()
+                if self._jobs.get(old_url, {}).get('state') not in UNFINISHED_STATES:
+                    self._jobs.pop(old_url, None)
+            submissions = list(job['submissions'])
+        self._emit('result', job, success=result['success'], cancelled=bool(result.get('cancelled')),
+                   error=result.get('error'), category=decision.category if decision else None,
+                   attempts=decision.attempt if decision else 0)
+        for submission in submissions:
+            self._check_done(submission)
+
+    def _check_done(self, submission):
+        """Emits a submission's 'summary' once its playlists are fetched and its videos have finished."""
+        with self._lock:
+            counts = self._submissions.get(submission)
+            if counts is None or counts['pending']:
+                return
+            for url in counts['videos']:
+                job = self._jobs.get(url)
+                if job is not None and job['state'] in UNFINISHED_STATES and submission in job['submissions']:
+                    return
+            del self._submissions[submission]
+        self._emit('summary', submissions=(submission,), playlists=counts['playlists'],
+                   playlists_failed=counts['playlists_failed'], videos=len(counts['videos']) + counts['skipped'],
+                   succeeded=counts['succeeded'], failed=counts['failed'], cancelled=counts['cancelled'],
+                   skipped=counts['skipped'], retries=counts['retries'],
+                   elapsed=round(time.monotonic() - counts['started_at'], 1))
+
+
+# --- Socket server ---
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """One client connection: JSON requests, one per line, each answered by one JSON line.
+
+    After a 'watch' request the connection only carries the daemon's records.
+    """
+
+    def handle(self):
+        daemon = self.server.download_daemon
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                command = request.pop('command')
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self._reply({'ok': False, 'error': "Malformed request"})
+                continue
+            if command == 'watch':
+                self._reply({'ok': True})
+                self._stream(daemon)
+                return
+            if command == 'shutdown':
+                self._reply({'ok': True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            try:
+                response = dict(daemon.handle_request(command, request), ok=True)
+            except Exception as e: # A bad request must not take the connection down
+                response = {'ok': False, 'error': str(e) or type(e).__name__}
+            self._reply(response)
+
+    def _reply(self, response):
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def _stream(self, daemon):
+        watcher = daemon.watch()
+        try:
+            while daemon.is_watching(watcher):
+                try:
+                    line = watcher.get(timeout=1.0)
+                except queue.Empty:
+                    if self._client_gone():
+                        return
+                    continue
+                self.wfile.write(line.encode("utf-8") + b"\n")
+                self.wfile.flush()
+        except OSError:
+            pass # The client went away
+        finally:
+            daemon.unwatch(watcher)
+
+    def _client_gone(self):
+        # A watching client sends nothing, so a readable socket means it was closed
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+
+
+# Windows has no Unix domain sockets, so there is no daemon there (see daemon_supported)
+_UnixStreamServer = getattr(socketserver, "ThreadingUnixStreamServer", object)
+
+
+class DaemonServer(_UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, download_daemon):
+        self.download_daemon = download_daemon
+        super().__init__(path, _RequestHandler)
+        os.chmod(path, 0o600) # Only this user may queue downloads
+
+    def server_bind(self):
+        # The socket is created without group/other access, so no one else can connect before the chmod
+        previous = os.umask(0o077)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(previous)
+
+
+# --- Clients ---
+
+class DaemonClient:
+    """A connection to the daemon. Not thread-safe; use one per thread (and a separate one for watch())."""
+
+    def __init__(self, path=None, timeout=None):
+        self.path = path or default_socket_path()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(self.path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._socket.settimeout(None)
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, command, **fields):
+        """Sends one request and returns the response dict. Raises DaemonError if it fails."""
+        try:
+            self._file.write(json.dumps(dict(fields, command=command), ensure_ascii=False).encode("utf-8") + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        except OSError as e:
+            raise DaemonError(f"Lost the connection to the download daemon: {e}") from None
+        if not line:
+            raise DaemonError("The download daemon closed the connection.")
+        response = json.loads(line)
+        if not response.pop('ok', False):
+            raise DaemonError(response.get('error') or "The download daemon rejected the request.")
+        return response
+
+    def watch(self):
+        """Subscribes to the daemon's records. Returns an iterator of record dicts that ends with the connection."""
+        self.request('watch')
+        return self._records()
+
+    def _records(self):
+        try:
+            for line in self._file:
+                yield json.loads(line)
+        except (OSError, ValueError):
+            return # Closed, possibly by close() on another thread
+
+    def close(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR) # Wakes up a thread blocked reading watch() records
+        except OSError:
+            pass
+        try:
+            self._file.close()
+        finally:
+            self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def connect(path=None, start=True, daemon_args=()):
+    """Returns a DaemonClient. Without a running daemon one is started (with daemon_args) if start is set.
+
+    Raises DaemonError if no daemon can be reached.
+    """
+    if not daemon_supported():
+        raise DaemonError("The download daemon needs Unix domain sockets, which this platform does not have.")
+    path = path or default_socket_path()
+    try:
+        return DaemonClient(path)
+    except OSError as e:
+        if not start:
+            raise DaemonError(f"No download daemon is running ({e}).") from None
+
+    log_path = os.path.join(user_cache_dir(), DAEMON_LOG_NAME)
+    with open(log_path, "ab") as log_file:
+        # A session of its own, so the daemon outlives the terminal or window that started it
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--socket", path, *daemon_args],
+                                   stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while True:
+        try:
+            return DaemonClient(path)
+        except OSError:
+            if process.poll() is not None:
+                try:
+                    return DaemonClient(path) # Lost a start-up race to another client's daemon
+                except OSError:
+                    raise DaemonError(f"The download daemon could not be started; see {log_path}.") from None
+            if time.monotonic() > deadline:
+                raise DaemonError(f"The download daemon did not start within {DAEMON_START_TIMEOUT:.0f}s; "
+                                  f"see {log_path}.") from None
+            time.sleep(0.05)
+
+
+class RemoteScheduler:
+    """DownloadScheduler look-alike for a front end whose downloads run in the daemon.
+
+    submit() sends the job dict describe_job(key) returns (url, title,
+    output_template, audio_only and optionally format and info_file). A watch connection keeps track of what is
+    queued and running and calls on_record(record) for every daemon record,
+    on its own thread; a lost connection is reported as a 'disconnected'
+    record. close() leaves the downloads running.
+    """
+
+    def __init__(self, describe_job, on_record=None, path=None, start=False, daemon_args=()):
+        self.describe_job = describe_job
+        self.on_record = on_record
+        self.max_workers = DEFAULT_DAEMON_JOBS
+        self._client = connect(path, start, daemon_args)
+        self._watch_client = connect(path, start=False)
+        self._lock = threading.Lock()
+        self._request_lock = threading.Lock()
+        self._states = {}       # video url: state of every unfinished video in the daemon
+        self._own = set()       # Unfinished videos this front end submitted
+        self._stats = {}
+        self._closed = False
+        records = self._watch_client.watch()
+        status = self._request('status')
+        with self._lock:
+            self._states = {job['url']: job['state'] for job in status['jobs'] if job['state'] in UNFINISHED_STATES}
+            self._update_stats(status['stats'])
+        threading.Thread(target=self._watch_loop, args=(records,), name="daemon-watch", daemon=True).start()
+
+    def submit(self, key, priority=PRIORITY_NORMAL, delay=0):
+        """Queues a job in the daemon. Returns False if it is already queued or running there."""
+        return bool(self.submit_many([key], priority))
+
+    def submit_many(self, keys, priority=PRIORITY_NORMAL):
+        """Queues several jobs with one daemon request. Returns the keys that were not already queued or running."""
+        response = self._request('submit', videos=[self.describe_job(key) for key in keys], priority=priority)
+        queued = set(response['queued'])
+        with self._lock:
+            self._own.update(keys)
+            for key in queued:
+                self._states[key] = STATE_QUEUED
+        return [key for key in keys if key in queued]
+
+    def promote(self, key, priority=PRIORITY_HIGH):
+        if not self.is_queued(key):
+            return False
+        return self._request('promote', video=key, priority=priority)['promoted']
+
+    def cancel(self, key):
+        """Cancels a queued or running job. Returns True only if it had not started yet."""
+        return key in self._request('cancel', videos=[key])['dequeued']
+
+    def clear(self):
+        """Cancels every unfinished job this front end submitted. Returns the keys of those that had not started."""
+        with self._lock:
+            keys = sorted(self._own)
+        return self._request('cancel', videos=keys)['dequeued'] if keys else []
+
+    def set_max_workers(self, max_workers):
+        """Changes the daemon's concurrency limit, which every front end shares."""
+        self.configure(jobs=int(max_workers))
+
+    def configure(self, **fields):
+        """Sends daemon-wide settings: jobs, limit_rate and/or fragments.
+
+        limit_rate is in bytes per second (None for unlimited); fragments is a
+        level, 'auto' or None for yt-dlp's default.
+        """
+        return self._request('configure', **fields)
+
+    def is_queued(self, key):
+        with self._lock:
+            return self._states.get(key) in (STATE_QUEUED, STATE_RETRYING)
+
+    def is_active(self, key):
+        with self._lock:
+            return self._states.get(key) == STATE_ACTIVE
+
+    def is_idle(self):
+        """True when nothing this front end submitted is still queued or running."""
+        with self._lock:
+            return not self._own
+
+    def queue_wait(self, key):
+        return None # Measured by the daemon
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        self._closed = True
+        for client in (self._watch_client, self._client):
+            try:
+                client.close()
+            except OSError:
+                pass
+
+    def _request(self, command, **fields):
+        with self._request_lock:
+            return self._client.request(command, **fields)
+
+    def _update_stats(self, stats):
+        # Every DownloadScheduler.stats() key, without the envelope of a 'stats' record
+        self._stats = {key: value for key, value in stats.items() if key not in ('type', 'time', 'submissions')}
+        self.max_workers = self._stats['max_workers']
+
+    def _watch_loop(self, records):
+        try:
+            for record in records:
+                record_type = record['type']
+                video_url = record.get('video')
+                with self._lock:
+                    if record_type == 'stats':
+                        self._update_stats(record)
+                    elif record_type == 'queued':
+                        self._states[video_url] = STATE_QUEUED
+                    elif record_type == 'start':
+                        self._states[video_url] = STATE_ACTIVE
+                    elif record_type == 'retry':
+                        self._states[video_url] = STATE_RETRYING
+                    elif record_type == 'result':
+                        self._states.pop(video_url, None)
+                        self._own.discard(video_url)
+                if self.on_record:
+                    try:
+                        self.on_record(record)
+                    except Exception as e: # A failing callback must not stop the watch
+                        print(f"Warning: handling a daemon '{record_type}' record failed ({e}).", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._own.clear() # Nothing will report on them any more
+            if self.on_record and not self._closed:
+                self.on_record({'type': 'disconnected'})
+
+
+# --- Daemon process ---
+
+def fragments_arg(text):
+    """argparse type for --concurrent-fragments: 'auto' or a positive integer."""
+    if text.lower() == "auto":
+        return "auto"
+    value = int(text)
+    if value < 1:
+        raise ValueError(text)
+    return value
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Background download daemon shared by the CLI and the GUI. It owns the download queue and "
+                    "takes JSON-line requests on a Unix socket; the front ends start it when needed."
+    )
+    parser.add_argument("--socket", metavar="PATH", help=f"socket to listen on (default: {default_socket_path()})")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_DAEMON_JOBS,
+                        help=f"videos downloaded at the same time, across all clients (default: {DEFAULT_DAEMON_JOBS})")
+    parser.add_argument("--limit-rate", type=parse_rate, default=None, metavar="RATE",
+                        help="total download rate shared by all downloads, e.g. 500K or 80M (bytes per second)")
+    parser.add_argument("-N", "--concurrent-fragments", type=fragments_arg, default=None, metavar="N|auto",
+                        help="DASH/HLS fragments fetched in parallel per video, or 'auto' to tune them per host")
+    parser.add_argument("--retries", type=int, default=DEFAULT_MAX_ATTEMPTS - 1, metavar="N",
+                        help=f"retry transient and throttling failures up to N times (default: {DEFAULT_MAX_ATTEMPTS - 1})")
+    parser.add_argument("--engine", choices=ENGINE_CHOICES, default="auto", help="yt-dlp backend (default: auto)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve metrics in Prometheus text format on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", metavar="PATH", help="write metrics as JSON to PATH every 10 seconds")
+    parser.add_argument("--no-cache", action="store_true", help="do not store fetched playlists in the metadata cache")
+    parser.add_argument("--staging-dir", default=staging_dir_from_env(), metavar="DIR",
+                        help="download, merge and convert in DIR and move each finished file into place in one step "
+                             "(default: $YTPD_STAGING_DIR, if set)")
+    parser.add_argument("--stop", action="store_true",
+                        help="ask the running daemon to stop (unfinished downloads resume when it starts again)")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.retries < 0:
+        parser.error("--retries must not be negative")
+    return args
+
+def bind(path, download_daemon):
+    """Returns a DaemonServer on path, replacing a stale socket. Raises DaemonError if a daemon already listens there."""
+    if os.path.exists(path):
+        try:
+            DaemonClient(path).close()
+        except OSError:
+            os.unlink(path) # Left behind by a daemon that did not exit cleanly
+        else:
+            raise DaemonError(f"A download daemon is already listening on {path}.")
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    return DaemonServer(path, download_daemon)
+
+def main(argv=None):
+    args = parse_args(argv)
+    path = args.socket or default_socket_path()
+    if args.stop:
+        try:
+            with connect(path, start=False) as client:
+                client.request('shutdown')
+        except DaemonError as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+
+    # yt-dlp is checked once here instead of at every front end start
+    try:
+        engine = create_engine(args.engine)
+        engine.version()
+    except (FileNotFoundError, RuntimeError):
+        print("Error: yt-dlp is not installed or not in your system's PATH.", file=sys.stderr)
+        return 1
+
+    def optional(name, factory):
+        try:
+            return factory()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Warning: {name} disabled ({e}).", file=sys.stderr)
+            return None
+
+    cache = None if args.no_cache else optional("playlist cache", PlaylistCache)
+    archive = optional("download archive", DownloadArchive)
+    journal = optional("job journal", lambda: JobJournal("daemon"))
+    tuner = None
+    if args.concurrent_fragments == "auto":
+        tuner = optional("fragment auto-tuning", FragmentTuner)
+    elif args.concurrent_fragments:
+        tuner = FixedFragments(args.concurrent_fragments)
+    staging = optional("staging directory", lambda: StagingArea(args.staging_dir)) if args.staging_dir else None
+    metrics = MetricsRegistry()
+    try:
+        for exporter in start_exporters(metrics, args.metrics_port, args.metrics_file):
+            atexit.register(exporter.close)
+    except (OSError, ValueError) as e:
+        print(f"Warning: metrics export disabled ({e}).", file=sys.stderr)
+
+    download_daemon = DownloadDaemon(engine, args.jobs, cache=cache, archive=archive, journal=journal,
+                                     budget=BandwidthBudget(args.limit_rate), tuner=tuner,
+                                     retry_policy=RetryPolicy(max_attempts=args.retries + 1), metrics=metrics,
+                                     staging=staging)
+    try:
+        server = bind(path, download_daemon)
+    except (DaemonError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    download_daemon.resume()
+    print(f"Download daemon (pid {os.getpid()}, {engine.name} engine) listening on {path}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        download_daemon.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,711 @@
+import asyncio
+import concurrent.futures
+import functools
+import subprocess
+import threading
+import json
+import time
+import sys
+import os
+from collections import deque, namedtuple
+
+try:
+    import yt_dlp
+except ImportError: # The in-process engine is optional; the subprocess engine only needs the yt-dlp executable
+    yt_dlp = None
+
+# yt-dlp prints one machine-readable line per progress update with this template:
+# "[progress] <status> <downloaded> <total> <speed> <eta> <fragment> <fragments>", "NA" for unknown fields
+PROGRESS_PREFIX = "[progress] "
+PROGRESS_FIELDS = (
+    "progress.status",
+    "progress.downloaded_bytes",
+    "progress.total_bytes,progress.total_bytes_estimate", # Fall back to the estimate for fragmented formats
+    "progress.speed",
+    "progress.eta",
+    "progress.fragment_index",
+    "progress.fragment_count",
+)
+PROGRESS_TEMPLATE = "download:" + PROGRESS_PREFIX + " ".join(f"%({field})s" for field in PROGRESS_FIELDS)
+
+# Line prefixes that mean the file was produced even if yt-dlp exited non-zero (e.g. warnings)
+SUCCESS_MARKERS = {
+    '[download] 100%': 'downloaded',            # Explicit 100% download (default progress format)
+    '[ExtractAudio] Destination:': 'audio_extracted',
+    '[ffmpeg] Destination:': 'converted',       # ffmpeg conversion/merge
+    '[Merger] Merging formats into': 'merged',  # Video/audio merged
+}
+# Line prefixes followed by the path of the file being written; the last one seen is the final file
+FILENAME_PREFIXES = (
+    '[download] Destination: ',
+    '[Merger] Merging formats into ',
+    '[ExtractAudio] Destination: ',
+)
+ALREADY_DOWNLOADED_SUFFIX = ' has already been downloaded'
+OUTPUT_TAIL_LINES = 20 # Recent output lines kept per download for error reports
+
+# The subprocess engine can only change --limit-rate by restarting yt-dlp (the .part file is
+# continued). It does so when the share moved by more than this fraction, at most this often.
+RATE_RESTART_THRESHOLD = 0.25
+RATE_RESTART_MIN_INTERVAL = 10.0
+
+
+class ProgressEvent(namedtuple('ProgressEvent', 'status downloaded_bytes total_bytes speed eta fragment_index fragment_count')):
+    """One structured progress update. Byte counts, speed (bytes/s) and eta (s) are None when unknown."""
+
+    __slots__ = ()
+
+    @property
+    def percent(self):
+        if self.status == 'finished':
+            return 100.0
+        if self.total_bytes and self.downloaded_bytes is not None:
+            return min(100.0, 100.0 * self.downloaded_bytes / self.total_bytes)
+        if self.fragment_count and self.fragment_index is not None:
+            return min(100.0, 100.0 * self.fragment_index / self.fragment_count)
+        return 0.0
+
+
+def format_bytes(num_bytes):
+    """Formats a byte count for display (e.g. '10.0 MiB')."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if num_bytes < 1024 or unit == 'GiB':
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024.0
+
+def format_speed(bytes_per_second):
+    """Formats a byte rate for display (e.g. '2.5 MiB/s')."""
+    return f"{format_bytes(bytes_per_second)}/s"
+
+def format_eta(seconds):
+    """Formats an ETA in seconds as MM:SS or H:MM:SS."""
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes:02}:{seconds:02}"
+
+def rate_changed(old_rate, new_rate):
+    """True if a rate limit moved enough to be worth re-applying (None means unlimited)."""
+    if old_rate == new_rate:
+        return False
+    if old_rate is None or new_rate is None:
+        return True
+    return abs(new_rate - old_rate) > old_rate * RATE_RESTART_THRESHOLD
+
+def parse_flat_entry(video_json):
+    """Builds the compact entry dict used by both front-ends from one --flat-playlist JSON object."""
+    return {
+        'id': video_json.get('id'),
+        'title': video_json['title'],
+        # Full (non-flat) info for a single video carries a direct media 'url'; prefer the page URL
+        'url': video_json.get('webpage_url') or video_json['url'],
+    }
+
+def _parse_number(text):
+    if text == "NA":
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def parse_progress_line(line):
+    """Returns a ProgressEvent for a line printed with PROGRESS_TEMPLATE, or None for any other line."""
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    parts = line[len(PROGRESS_PREFIX):].split()
+    if len(parts) != len(PROGRESS_FIELDS):
+        return None
+    return ProgressEvent(parts[0], *(_parse_number(part) for part in parts[1:]))
+
+def format_progress_line(event):
+    """Renders a progress event as a human-readable '[download]' line."""
+    line = f"[download] {event.percent:5.1f}%"
+    if event.total_bytes:
+        line += f" of {format_bytes(event.total_bytes)}"
+    if event.speed:
+        line += f" at {format_speed(event.speed)}"
+    if event.eta is not None:
+        line += f" ETA {format_eta(event.eta)}"
+    if event.fragment_count:
+        line += f" (frag {int(event.fragment_index or 0)}/{int(event.fragment_count)})"
+    return line
+
+
+class OutputClassifier:
+    """Classifies each line of yt-dlp output once, as it arrives.
+
+    Only flags and a short ring buffer of recent lines are kept, so memory per
+    download stays constant however long yt-dlp keeps printing.
+    """
+
+    def __init__(self, tail_lines=OUTPUT_TAIL_LINES):
+        self.downloaded = False
+        self.audio_extracted = False
+        self.converted = False
+        self.merged = False
+        self.filename = None
+        self.errors = deque(maxlen=5)
+        self.tail = deque(maxlen=tail_lines)
+
+    def feed_progress(self, event):
+        if event.status == 'finished':
+            self.downloaded = True
+
+    def feed_line(self, line):
+        line = line.rstrip()
+        if not line:
+            return
+        self.tail.append(line)
+        if line.startswith('ERROR:'):
+            self.errors.append(line)
+        elif line.startswith('['):
+            for marker, flag in SUCCESS_MARKERS.items():
+                if line.startswith(marker):
+                    setattr(self, flag, True)
+                    break
+            for prefix in FILENAME_PREFIXES:
+                if line.startswith(prefix):
+                    self.filename = line[len(prefix):].strip('"')
+                    break
+            else:
+                if line.startswith('[download] ') and line.endswith(ALREADY_DOWNLOADED_SUFFIX):
+                    self.filename = line[len('[download] '):-len(ALREADY_DOWNLOADED_SUFFIX)]
+                    self.downloaded = True
+
+    @property
+    def produced_output(self):
+        return self.downloaded or self.audio_extracted or self.converted or self.merged
+
+    def error_message(self, returncode):
+        if self.errors:
+            return "\n".join(self.errors)
+        if self.tail:
+            return "\n".join(self.tail)
+        return f"Unknown error (Exit Code: {returncode})"
+
+
+class PlaylistFetchError(RuntimeError):
+    """A playlist listing ended early (yt-dlp reported an error or exited non-zero).
+
+    entries holds what was listed before the failure. It is not the whole
+    playlist, so it must not be cached or used to decide which videos left it.
+    """
+
+    def __init__(self, message, entries=()):
+        super().__init__(message)
+        self.entries = list(entries)
+
+
+class DownloadHandle:
+    """Lets another thread cancel or throttle a running download, whichever engine runs it."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.process = None    # Set by SubprocessEngine while yt-dlp is running
+        self.rate_limit = None # Bytes per second, None for unlimited; may change while downloading
+        self.concurrent_fragments = None # Parallel DASH/HLS fragments, None for yt-dlp's default
+
+    def terminate(self):
+        self.cancelled = True
+        process = self.process
+        if process is not None:
+            process.terminate()
+
+
+# Upper bound on one line of yt-dlp output (flat playlist JSON lines can be long)
+STREAM_LINE_LIMIT = 16 * 1024 * 1024
+
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+def _get_event_loop():
+    """Returns the asyncio loop that runs every yt-dlp process, starting its thread on first use.
+
+    One thread reads the pipes of all fetches and downloads, however many run at once.
+    """
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            loop = asyncio.new_event_loop()
+            if sys.platform != "win32" and sys.version_info < (3, 12) and _pidfd_supported():
+                # Python 3.11 otherwise waits for every child process on a thread of its own
+                watcher = asyncio.PidfdChildWatcher()
+                watcher.attach_loop(loop)
+                asyncio.set_child_watcher(watcher)
+            threading.Thread(target=loop.run_forever, name="yt-dlp-processes", daemon=True).start()
+            _event_loop = loop
+        return _event_loop
+
+def _pidfd_supported():
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+        return True
+    except (AttributeError, OSError):
+        return False
+
+def _submit_in_thread(function, *args):
+    """Runs function(*args) on a new daemon thread. Returns a concurrent.futures.Future for its result."""
+    future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+class _LoopProcess:
+    """Lets DownloadHandle.terminate() stop a process owned by the event loop from any thread."""
+
+    def __init__(self, loop, process):
+        self._loop = loop
+        self._process = process
+
+    def terminate(self):
+        self._loop.call_soon_threadsafe(self._terminate)
+
+    def _terminate(self):
+        if self._process.returncode is None:
+            try:
+                self._process.terminate()
+            except ProcessLookupError:
+                pass # Exited in the meantime
+
+
+class SubprocessEngine:
+    """Runs every fetch and download as a separate yt-dlp process (the original behavior).
+
+    All processes are started and read by one shared asyncio loop thread, so
+    nothing blocks on a pipe: fetch_playlist() and download() only wait for
+    a future, and submit_fetch()/submit_download() return one right away.
+    Callbacks (on_entry, on_progress, on_output) run on the loop thread.
+    """
+
+    name = "subprocess"
+
+    def __init__(self, executable="yt-dlp"):
+        self.executable = executable
+
+    def version(self):
+        """Returns the yt-dlp version. Raises FileNotFoundError if the executable is missing."""
+        result = subprocess.run([self.executable, "--version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return result.stdout.strip()
+
+    def fetch_playlist(self, url, on_entry=None):
+        """Returns the playlist entries, calling on_entry(entry) for each one as it is parsed."""
+        return self.submit_fetch(url, on_entry).result()
+
+    def submit_fetch(self, url, on_entry=None):
+        """Starts fetching a playlist. Returns a concurrent.futures.Future for the entry list."""
+        return asyncio.run_coroutine_threadsafe(self._fetch_playlist(url, on_entry), _get_event_loop())
+
+    async def _fetch_playlist(self, url, on_entry):
+        command = [
+            self.executable,
+            "--flat-playlist",
+            "-j",
+            "--no-warnings", # Hide warnings for a cleaner output
+            url
+        ]
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=STREAM_LINE_LIMIT
+        )
+
+        entries = []
+        errors = []
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                if line.strip():
+                    if line.startswith(b"ERROR:"):
+                        errors.append(line.decode("utf-8", errors="replace").strip())
+                        continue
+                    try:
+                        entry = parse_flat_entry(json.loads(line))
+                    except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+                        continue # Ignore other lines that are not entries
+                    entries.append(entry)
+                    if on_entry:
+                        on_entry(entry)
+            await process.wait()
+        finally:
+            await _reap(process)
+        if errors or process.returncode != 0:
+            error = errors[-1] if errors else f"yt-dlp exited with code {process.returncode}"
+            raise PlaylistFetchError(f"The playlist listing stopped after {len(entries)} entries: {error}", entries)
+        return entries
+
+    def fetch_metadata(self, url):
+        """Returns the full info dict of one video (formats, sizes, duration), as printed by yt-dlp -J."""
+        return self.submit_fetch_metadata(url).result()
+
+    def submit_fetch_metadata(self, url):
+        """Starts extracting one video's full metadata. Returns a concurrent.futures.Future for the info dict."""
+        return asyncio.run_coroutine_threadsafe(self._fetch_metadata(url), _get_event_loop())
+
+    async def _fetch_metadata(self, url):
+        process = await asyncio.create_subprocess_exec(
+            self.executable, "-J", "--no-playlist", "--no-warnings", url,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LINE_LIMIT
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        finally:
+            await _reap(process)
+        if process.returncode != 0:
+            lines = stderr.decode("utf-8", errors="replace").strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"Unknown error (Exit Code: {process.returncode})")
+        return json.loads(stdout)
+
+    def build_command(self, url, output_template=None, audio_only=False, rate_limit=None, concurrent_fragments=None,
+                      extract_audio=True, format_selector=None, info_file=None):
+        command = [self.executable, "--progress", "--newline", "--progress-template", PROGRESS_TEMPLATE]
+        command.append("--continue") # Resume .part files left by an interrupted run (yt-dlp's default, made explicit)
+        if rate_limit:
+            command.extend(["--limit-rate", str(int(rate_limit))])
+        if concurrent_fragments:
+            command.extend(["--concurrent-fragments", str(concurrent_fragments)])
+        if output_template:
+            command.extend(["-o", output_template])
+        if audio_only and extract_audio:
+            command.extend(["--extract-audio", "--audio-format", "mp3", "--no-playlist"])
+        elif audio_only:
+            # Fetch the audio stream only; the caller converts it in a separate stage
+            command.extend(["-f", "bestaudio/best", "--no-playlist"])
+        elif format_selector:
+            command.extend(["-f", format_selector])
+        if info_file:
+            command.extend(["--load-info-json", info_file]) # Replaces the URL, skipping the extraction
+        else:
+            command.append(url) # Add the video URL last
+        return command
+
+    def download(self, url, handle=None, output_template=None, audio_only=False, on_progress=None, on_output=None,
+                 extract_audio=True, format_selector=None, info_file=None):
+        """Downloads one video and returns a result dict (success, returncode, error, filename).
+
+        With audio_only and extract_audio=False, only the best audio stream is
+        downloaded and left in its original format for the caller to convert.
+        format_selector (a yt-dlp -f expression) is ignored for audio-only
+        downloads. With info_file (JSON saved from fetch_metadata()), yt-dlp
+        starts from that info instead of extracting the video again.
+        If handle.rate_limit changes substantially while the file is downloading,
+        yt-dlp is restarted with the new --limit-rate and continues the .part file.
+        """
+        return self.submit_download(url, handle, output_template, audio_only, on_progress, on_output,
+                                    extract_audio, format_selector, info_file).result()
+
+    def submit_download(self, url, handle=None, output_template=None, audio_only=False, on_progress=None,
+                        on_output=None, extract_audio=True, format_selector=None, info_file=None):
+        """Starts a download like download(). Returns a concurrent.futures.Future for its result dict."""
+        handle = handle or DownloadHandle()
+        coroutine = self._download(url, handle, output_template, audio_only, on_progress, on_output, extract_audio,
+                                   format_selector, info_file)
+        return asyncio.run_coroutine_threadsafe(coroutine, _get_event_loop())
+
+    async def _download(self, url, handle, output_template, audio_only, on_progress, on_output, extract_audio,
+                        format_selector, info_file):
+        loop = asyncio.get_running_loop()
+        classifier = OutputClassifier()
+        process = None
+        while not handle.cancelled: # A job cancelled before its process started never starts one
+            rate_limit = handle.rate_limit
+            started_at = time.monotonic()
+            restarting = False
+            process = await asyncio.create_subprocess_exec(
+                *self.build_command(url, output_template, audio_only, rate_limit, handle.concurrent_fragments,
+                                    extract_audio, format_selector, info_file),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT, # Merge stdout and stderr for simpler parsing
+                limit=STREAM_LINE_LIMIT
+            )
+            handle.process = _LoopProcess(loop, process)
+            if handle.cancelled: # Cancelled while the process was starting
+                process.terminate()
+
+            try:
+                while True:
+                    raw_line = await process.stdout.readline()
+                    if not raw_line:
+                        break
+                    line = raw_line.decode("utf-8", errors="replace")
+                    event = parse_progress_line(line)
+                    if event is not None:
+                        classifier.feed_progress(event)
+                        if on_progress:
+                            on_progress(event)
+                        # Only restart mid-transfer, never while merging or post-processing
+                        if (not restarting and event.status == 'downloading' and rate_changed(rate_limit, handle.rate_limit)
+                                and time.monotonic() - started_at >= RATE_RESTART_MIN_INTERVAL):
+                            restarting = True
+                            process.terminate()
+                        continue
+                    if restarting:
+                        continue # Output of the process being replaced
+                    classifier.feed_line(line)
+                    if on_output and line.strip():
+                        on_output(line.rstrip())
+                await process.wait()
+            finally:
+                await _reap(process) # A failing callback must not leave yt-dlp running
+            if not restarting or handle.cancelled:
+                break
+            if on_output:
+                new_rate = handle.rate_limit
+                on_output(f"[limit-rate] Continuing at {format_speed(new_rate) if new_rate else 'full speed'}")
+
+        if process is None:
+            return {'success': False, 'cancelled': True, 'returncode': None, 'error': "Cancelled", 'filename': None}
+        # Even if returncode is non-zero, check for success indicators in output
+        # This handles cases where yt-dlp exits with warnings but completes successfully
+        success = process.returncode == 0 or (not handle.cancelled and classifier.produced_output)
+        error = None
+        if not success:
+            error = classifier.error_message(process.returncode)
+        return {'success': success, 'cancelled': handle.cancelled, 'returncode': process.returncode, 'error': error,
+                'filename': classifier.filename}
+
+
+async def _reap(process):
+    """Kills a process that is still running (e.g. after an exception) and waits for it."""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+class _OutputLogger:
+    """yt_dlp logger that forwards messages to the on_output callback of its instance's current download."""
+
+    def __init__(self, context):
+        self.context = context
+
+    def debug(self, message):
+        # yt-dlp routes normal [info]/[download] messages through debug()
+        self.context.emit_output(message)
+
+    def info(self, message):
+        self.context.emit_output(message)
+
+    def warning(self, message):
+        self.context.emit_output(f"WARNING: {message}")
+
+    def error(self, message):
+        self.context.emit_output(message)
+        self.context.last_error = message
+
+
+class _DownloadContext:
+    """The download a YoutubeDL instance is running, bound into its hooks and logger.
+
+    With concurrent fragments, yt-dlp calls progress hooks from its fragment
+    pool threads, so per-download state cannot live in thread-local storage.
+    """
+
+    def __init__(self):
+        self.ydl = None
+        self.handle = None
+        self.on_progress = None
+        self.on_output = None
+        self.last_error = None
+        self.filename = None
+
+    def begin(self, handle, on_progress, on_output):
+        self.handle = handle
+        self.on_progress = on_progress
+        self.on_output = on_output
+        self.last_error = None
+        self.filename = None
+
+    def end(self):
+        self.handle = self.on_progress = self.on_output = None
+
+    def emit_output(self, message):
+        callback = self.on_output
+        if callback:
+            callback(message)
+
+
+class YoutubeDLEngine:
+    """Drives yt_dlp.YoutubeDL in-process.
+
+    Each worker thread keeps one YoutubeDL instance per option set, so extractor
+    instances, cookies and the HTTP session are reused across videos. Progress
+    arrives through progress hooks instead of scraped stdout; each instance's
+    hooks are bound to a _DownloadContext describing its current download.
+    """
+
+    name = "inprocess"
+
+    def __init__(self):
+        if yt_dlp is None:
+            raise RuntimeError("The yt_dlp Python package is not installed.")
+        self._local = threading.local()
+
+    def version(self):
+        return yt_dlp.version.__version__
+
+    def _instance(self, options):
+        """Returns this thread's (YoutubeDL, _DownloadContext) for an option set."""
+        cache = getattr(self._local, 'instances', None)
+        if cache is None:
+            cache = self._local.instances = {}
+        key = tuple(sorted(options.items()))
+        instance = cache.get(key)
+        if instance is None:
+            context = _DownloadContext()
+            params = {
+                'quiet': True,
+                'noprogress': True,
+                'logger': _OutputLogger(context),
+                'continuedl': True, # Resume .part files left by an interrupted run
+                'progress_hooks': [functools.partial(self._progress_hook, context)],
+                'postprocessor_hooks': [functools.partial(self._postprocessor_hook, context)],
+            }
+            if options.get('flat'):
+                params.update({'extract_flat': 'in_playlist', 'skip_download': True, 'no_warnings': True})
+            if options.get('output_template'):
+                params['outtmpl'] = options['output_template']
+            if options.get('metadata'):
+                params.update({'skip_download': True, 'noplaylist': True, 'no_warnings': True})
+            if options.get('audio_only'):
+                params.update({'format': 'bestaudio/best', 'noplaylist': True})
+                if options.get('extract_audio'):
+                    params['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3'}]
+            elif options.get('format'):
+                params['format'] = options['format']
+            context.ydl = yt_dlp.YoutubeDL(params)
+            instance = cache[key] = (context.ydl, context)
+        return instance
+
+    def _progress_hook(self, context, status):
+        handle = context.handle
+        if handle is not None and handle.cancelled:
+            raise yt_dlp.utils.DownloadCancelled("Download cancelled")
+        if handle is not None:
+            # yt-dlp's downloaders read 'ratelimit' from the shared params on every block,
+            # so a rebalanced share takes effect immediately
+            params = context.ydl.params
+            if params.get('ratelimit') != handle.rate_limit:
+                params['ratelimit'] = handle.rate_limit
+        if status.get('status') == 'finished' and status.get('filename'):
+            context.filename = status['filename']
+        callback = context.on_progress
+        if not callback or status.get('status') not in ('downloading', 'finished'):
+            return
+        event = ProgressEvent(
+            status['status'],
+            status.get('downloaded_bytes'),
+            status.get('total_bytes') or status.get('total_bytes_estimate'),
+            status.get('speed'),
+            status.get('eta'),
+            status.get('fragment_index'),
+            status.get('fragment_count'),
+        )
+        callback(event)
+
+    def _postprocessor_hook(self, context, status):
+        if status.get('status') == 'started':
+            context.emit_output(f"[{status.get('postprocessor')}] Processing")
+        elif status.get('status') == 'finished' and status.get('info_dict', {}).get('filepath'):
+            context.filename = status['info_dict']['filepath'] # e.g. the .mp3 after audio extraction
+
+    def submit_fetch(self, url, on_entry=None):
+        """Starts fetch_playlist() on a background thread. Returns a concurrent.futures.Future for the entries."""
+        return _submit_in_thread(self.fetch_playlist, url, on_entry)
+
+    def fetch_playlist(self, url, on_entry=None):
+        ydl, _ = self._instance({'flat': True})
+        # Unprocessed extraction keeps playlist entries as a lazy generator, so they can be
+        # reported page by page instead of after the whole playlist has been enumerated
+        info = ydl.extract_info(url, download=False, process=False)
+        if info.get('_type') in ('url', 'url_transparent'):
+            info = ydl.extract_info(url, download=False) # Redirects (e.g. watch?v=...&list=...) need full processing
+        raw_entries = info.get('entries') if info.get('_type') == 'playlist' else [info]
+        entries = []
+        try:
+            for video_json in raw_entries or []:
+                try:
+                    entry = parse_flat_entry(video_json)
+                except (KeyError, TypeError):
+                    continue
+                entries.append(entry)
+                if on_entry:
+                    on_entry(entry)
+        except yt_dlp.utils.DownloadError as e: # A later page of the lazy entry list failed
+            raise PlaylistFetchError(f"The playlist listing stopped after {len(entries)} entries: {e}", entries) from e
+        return entries
+
+    def submit_fetch_metadata(self, url):
+        """Starts fetch_metadata() on a background thread. Returns a concurrent.futures.Future for the info dict."""
+        return _submit_in_thread(self.fetch_metadata, url)
+
+    def fetch_metadata(self, url):
+        ydl, _ = self._instance({'metadata': True})
+        return ydl.sanitize_info(ydl.extract_info(url, download=False)) # JSON-safe, like yt-dlp -J
+
+    def download(self, url, handle=None, output_template=None, audio_only=False, on_progress=None, on_output=None,
+                 extract_audio=True, format_selector=None, info_file=None):
+        handle = handle or DownloadHandle()
+        # Planned selectors are a handful of format-ID pairs, so one instance per selector stays small
+        ydl, context = self._instance({'output_template': output_template, 'audio_only': audio_only,
+                              'extract_audio': audio_only and extract_audio,
+                              'format': None if audio_only else format_selector})
+        ydl.params['ratelimit'] = handle.rate_limit
+        ydl.params['concurrent_fragment_downloads'] = handle.concurrent_fragments or 1 # Read when the download starts
+        context.begin(handle, on_progress, on_output)
+        try:
+            returncode = ydl.download_with_info_file(info_file) if info_file else ydl.download([url])
+            error = None
+        except yt_dlp.utils.DownloadCancelled:
+            returncode, error = 1, "Cancelled"
+        except yt_dlp.utils.DownloadError as e:
+            returncode, error = 1, str(e)
+        finally:
+            context.end()
+        if returncode and error is None:
+            error = context.last_error or f"Unknown error (Exit Code: {returncode})"
+        return {'success': returncode == 0, 'cancelled': handle.cancelled, 'returncode': returncode, 'error': error,
+                'filename': context.filename}
+
+
+ENGINE_CHOICES = ("auto", "inprocess", "subprocess")
+
+def create_engine(name="auto"):
+    """Returns an engine by name. 'auto' prefers the in-process engine when yt_dlp is importable."""
+    if name == "inprocess" or (name == "auto" and yt_dlp is not None):
+        return YoutubeDLEngine()
+    if name in ("auto", "subprocess"):
+        return SubprocessEngine()
+    raise ValueError(f"Unknown engine: {name}")
+
+_default_engine = None
+
+def get_default_engine():
+    """Returns the process-wide engine, creating the 'auto' engine on first use."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = create_engine()
+    return _default_engine
+
+def set_default_engine(engine):
+    """Replaces the process-wide engine (e.g. with a stub in tests)."""
+    global _default_engine
+    _default_engine = engine
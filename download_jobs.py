@@ -0,0 +1,220 @@
+import os
+import re
+import time
+from download_engine import DownloadHandle
+from download_archive import VARIANT_MP3, VARIANT_VIDEO, video_id_of
+from metadata_prefetch import discard_info_file
+from job_journal import JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RETRYING, JOB_STARTED
+from staging import space_directories
+from title_index import parse_query, split_terms
+
+# Selection parts made of numbers, commas and dashes; anything else is a title filter
+SELECTION_NUMBERS_PATTERN = re.compile(r'^[\d,-]+$')
+
+# yt-dlp's default file name. It is stored per job as an absolute template, so a resumed
+# download finds its .part file even if it is restarted from another directory.
+OUTPUT_TEMPLATE = "%(title)s [%(id)s].%(ext)s"
+
+def parse_selection(selection_input, count, index=None):
+    """Parses a selection such as '1, 5, 8-10' or 'all' into sorted 1-based indices.
+
+    With a TitleIndex of the entries, the selection may also contain title
+    filters (see title_index.parse_query), e.g. '/lecture 1-50' or
+    'tutorial !live': the numbers pick entries as usual (all of them if
+    there are none) and the filters keep those whose titles match.
+    Raises ValueError with a message for the user if the selection is invalid.
+    """
+    numbers, filters = _split_selection(selection_input, index is not None)
+    if filters:
+        matches = index.search(" ".join(filters))
+        if not numbers or numbers == ['all']:
+            return [position + 1 for position in matches if position < count]
+        matching = {position + 1 for position in matches}
+        return [number for number in parse_selection(" ".join(numbers), count) if number in matching]
+    if numbers == ['all']:
+        return list(range(1, count + 1))
+
+    selected_indices = set()
+    for start, end in _selection_ranges(numbers, count):
+        selected_indices.update(range(start, end + 1))
+    return sorted(selected_indices)
+
+def check_selection(selection_input):
+    """Raises the ValueError parse_selection() would for a malformed selection, title filters included.
+
+    For checking a selection before the playlist is known: ranges are
+    checked, not expanded, so '1-9999999999' costs nothing.
+    """
+    numbers, filters = _split_selection(selection_input, True)
+    if filters:
+        parse_query(" ".join(filters))
+    if numbers != ['all']:
+        for _ in _selection_ranges(numbers, None):
+            pass
+
+def _split_selection(selection_input, allow_filters):
+    """Splits a selection into its lower-cased number parts and its title filters."""
+    numbers, filters = [], []
+    for part in split_terms(selection_input):
+        if part.lower() == 'all' or SELECTION_NUMBERS_PATTERN.match(part):
+            numbers.append(part.lower())
+        elif not allow_filters:
+            raise ValueError("Invalid input. Please use numbers or 'all'.")
+        else:
+            filters.append(part)
+    if 'all' in numbers and len(numbers) > 1:
+        raise ValueError("Invalid input. Please use numbers or 'all'.")
+    return numbers, filters
+
+def _selection_ranges(numbers, count):
+    """Yields the (start, end) ranges of number parts, checked against count (unbounded if None)."""
+    for part in re.split(r'[,\s]+', " ".join(numbers)):
+        if not part:
+            continue
+
+        if '-' in part:
+            try:
+                start, end = map(int, part.split('-'))
+            except ValueError:
+                raise ValueError("Invalid range format. Use numbers and a dash (e.g., 5-8).") from None
+            if not 1 <= start <= end or (count is not None and end > count):
+                raise ValueError("Invalid range. Please enter valid numbers.")
+            yield start, end
+        else:
+            try:
+                number = int(part)
+            except ValueError:
+                raise ValueError("Invalid input. Please use numbers or 'all'.") from None
+            if number < 1 or (count is not None and number > count):
+                raise ValueError("Invalid number. Please enter a valid number from the list.")
+            yield number, number
+
+def queue_job(video, journal=None, directory=None):
+    """Fixes a video's output template and records it as queued. Returns the job dict.
+
+    Without an output_template of its own the video is saved in directory
+    (default: the current directory).
+    """
+    job = dict(video)
+    job.setdefault('output_template', os.path.join(directory or os.getcwd(), OUTPUT_TEMPLATE))
+    if journal is not None:
+        fields = {'audio_only': True} if job.get('audio_only') else {}
+        if job.get('format'):
+            fields['format'] = job['format']
+        if job.get('size'):
+            fields['size'] = job['size']
+        journal.record(JOB_QUEUED, job['url'], title=job['title'], id=job.get('id'),
+                       output_template=job['output_template'], playlist=job.get('playlist'), **fields)
+    return job
+
+def staged_template(job, staging=None):
+    """Returns the output template a job is downloaded with inside the staging area, or None if it is not staged."""
+    if staging is None:
+        return None
+    return staging.template_for(job['output_template'], video_id_of(job), bool(job.get('audio_only')))
+
+def reserve_space(job, space, staging=None):
+    """Reserves a queued job's estimated size (its planned 'size', if any) on the volumes it writes to.
+
+    Meant as a DownloadScheduler admit callback; returns False while the job
+    has to wait (see DiskSpaceGuard.reserve).
+    """
+    return space.reserve(job['url'], space_directories(job['output_template'], staged_template(job, staging)),
+                         job.get('size'))
+
+def download_video(job, engine, archive=None, journal=None, budget=None, tuner=None, on_progress=None, on_output=None,
+                   metrics=None, queue_wait=None, handle=None, staging=None, space=None):
+    """Downloads one queued job and records the outcome in the journal and, on success, the archive.
+
+    While it runs, the job holds a share of the bandwidth budget, and the
+    tuner (FragmentTuner or FixedFragments) picks its fragment concurrency. Engine
+    exceptions are journaled as failures and re-raised. An interrupt leaves
+    the job 'started', so the next run resumes it. With a metrics registry the
+    attempt's queue wait, first byte, bytes and throughput are recorded. Pass a
+    DownloadHandle to be able to cancel the download from another thread.
+    Jobs with 'audio_only' set are saved as MP3 (converted by yt-dlp). A job's
+    'format' (a planned -f expression) is passed to the engine, and its
+    'info_file' (saved by MetadataPrefetcher) is used for this attempt only
+    and deleted afterwards. With a StagingArea the file is downloaded there
+    and moved next to the output template once it is complete. With a
+    DiskSpaceGuard the job holds its reserved space (reserved here if the
+    caller did not admit it through reserve_space()) until it ends, and
+    fails without downloading if it does not fit.
+    """
+    if journal is not None:
+        journal.record(JOB_STARTED, job['url'])
+    if space is not None and not space.holds(job['url']):
+        reserve_space(job, space, staging) # Outside a scheduler nothing else runs, so the job is always admitted
+    shortfall = space.shortfall(job['url']) if space is not None else None
+    staged = staged_template(job, staging)
+    handle = handle or DownloadHandle()
+    if budget is not None:
+        budget.add(job['url'], handle)
+    session = None
+    if tuner is not None and not shortfall:
+        session = tuner.begin(job['url'])
+        handle.concurrent_fragments = session.fragments
+    download_metrics = metrics.begin_download(job['url'], queue_wait) if metrics is not None else None
+    audio_only = bool(job.get('audio_only'))
+    info_file = job.pop('info_file', None) # Retries extract again, in case the saved media URLs expired
+
+    def progress(event):
+        if session is not None:
+            session.feed_progress(event)
+        if download_metrics is not None:
+            download_metrics.feed_progress(event)
+        if on_progress:
+            on_progress(event)
+
+    def output(line):
+        if session is not None:
+            session.feed_line(line)
+        if on_output:
+            on_output(line)
+
+    result = None
+    try:
+        if shortfall:
+            result = {'success': False, 'cancelled': False, 'returncode': None, 'error': shortfall, 'filename': None}
+        else:
+            result = engine.download(job['url'], handle=handle, output_template=staged or job['output_template'],
+                                     audio_only=audio_only, on_progress=progress, on_output=output,
+                                     format_selector=job.get('format'), info_file=info_file)
+        if staged:
+            result = staging.finalize(result, staged, job['output_template'])
+    except Exception as e:
+        if journal is not None:
+            journal.record(JOB_FAILED, job['url'], error=str(e))
+        if download_metrics is not None:
+            download_metrics.finish({'success': False, 'error': str(e)})
+        raise
+    finally:
+        if budget is not None:
+            budget.remove(job['url'])
+        if info_file:
+            discard_info_file(info_file)
+        if session is not None:
+            tuner.end(session, failed=result is None or not (result['success'] or result['cancelled']))
+        if space is not None:
+            space.release(job['url'], result['filename'] if result and result['success'] else None)
+    if download_metrics is not None:
+        download_metrics.finish(result)
+    if result['success']:
+        if archive is not None:
+            archive.add(video_id_of(job), VARIANT_MP3 if audio_only else VARIANT_VIDEO, result.get('filename'))
+        if journal is not None:
+            journal.record(JOB_COMPLETED, job['url'], filename=result.get('filename'))
+    elif journal is not None:
+        journal.record(JOB_CANCELLED if result.get('cancelled') else JOB_FAILED, job['url'], error=result.get('error'))
+    return result
+
+def record_attempt(retries, job, result, started_at, journal=None, metrics=None):
+    """Feeds a finished attempt to the retry manager and journals a scheduled retry. Returns the RetryDecision."""
+    decision = retries.record_attempt(job['url'], result, time.monotonic() - started_at)
+    if decision.retry_in is not None:
+        if journal is not None:
+            journal.record(JOB_RETRYING, job['url'], attempt=decision.attempt, category=decision.category,
+                           error=result.get('error'), retry_in=round(decision.retry_in, 1))
+        if metrics is not None:
+            metrics.retry_scheduled(decision.category)
+    return decision
@@ -0,0 +1,279 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+
+# Lower numbers run first. Row buttons use PRIORITY_HIGH so they jump ahead of "Download All".
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+
+# run_job may return RetryAfter(seconds) to have its job queued again, at the same priority, after a delay
+RetryAfter = namedtuple('RetryAfter', 'delay')
+
+# While admit() refuses the next job, it is asked again this often (and whenever a job finishes)
+ADMIT_RECHECK_INTERVAL = 5.0
+
+
+class DownloadScheduler:
+    """Runs queued download jobs on a bounded pool of worker threads.
+
+    Jobs are identified by a hashable key (the video URL). Within the same
+    priority they run in FIFO order. Delayed jobs (retries) count as queued
+    but only become runnable once their delay has passed, and pause() keeps
+    every worker from starting new jobs for a while. With admit, the next job
+    only starts once admit(key) returns True; jobs behind it wait too, so a
+    large job is not starved by smaller ones.
+    """
+
+    def __init__(self, run_job, max_workers=3, admit=None):
+        self.run_job = run_job           # Called as run_job(key) on a worker thread
+        self.admit = admit               # Called as admit(key) under the queue lock before a job starts
+        self.max_workers = max(1, int(max_workers))
+        self._heap = []                  # [priority, sequence, key, enqueued_at, valid]
+        self._queued = {}                # key: heap entry (only jobs still waiting)
+        self._delayed = {}               # key: (ready_at, priority, enqueued_at) for jobs waiting out a delay
+        self._paused_until = None        # Monotonic time before which no job starts
+        self._refused = False            # Set while admit() refuses the next job
+        self._active = set()             # keys currently handed to run_job
+        self._waits = {}                 # key: seconds the running job waited in the queue
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._started_at = None          # First job start of the current (or last) busy period
+        self._finished_at = None         # Set when the queue drains, so stats stay readable afterwards
+        self._completed = 0
+        self._retries = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+        self._ensure_workers()
+
+    # --- Queue management ---
+
+    def submit(self, key, priority=PRIORITY_NORMAL, delay=0):
+        """Queues a job, optionally to become runnable after `delay` seconds. Returns False if the job is already queued or running."""
+        with self._cond:
+            if key in self._queued or key in self._delayed or key in self._active:
+                return False
+            now = time.monotonic()
+            if delay > 0:
+                self._delayed[key] = (now + delay, priority, now)
+            else:
+                self._push(key, priority, now)
+            self._cond.notify_all()
+            return True
+
+    def promote(self, key, priority=PRIORITY_HIGH):
+        """Moves a queued job to a higher priority; a delayed job becomes runnable now. Returns False if it is not queued."""
+        with self._cond:
+            delayed = self._delayed.pop(key, None)
+            if delayed is not None:
+                self._push(key, min(priority, delayed[1]), delayed[2])
+                self._cond.notify_all()
+                return True
+            entry = self._queued.get(key)
+            if entry is None:
+                return False
+            if priority < entry[0]:
+                entry[4] = False
+                self._push(key, priority, entry[3])
+            return True
+
+    def cancel(self, key):
+        """Removes a job that has not started yet. Returns False if it is not queued."""
+        with self._cond:
+            if self._delayed.pop(key, None) is not None:
+                return True
+            entry = self._queued.pop(key, None)
+            if entry is None:
+                return False
+            entry[4] = False
+            return True
+
+    def clear(self):
+        """Removes every job that has not started yet and returns their keys."""
+        with self._cond:
+            keys = list(self._queued.keys()) + list(self._delayed.keys())
+            for entry in self._queued.values():
+                entry[4] = False
+            self._queued.clear()
+            self._delayed.clear()
+            self._heap.clear()
+            return keys
+
+    def set_max_workers(self, max_workers):
+        """Changes the concurrency limit. Running jobs are never interrupted."""
+        with self._cond:
+            self.max_workers = max(1, int(max_workers))
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Keeps workers from starting jobs for `seconds` (extends, never shortens, a running pause). Running jobs continue."""
+        with self._cond:
+            until = time.monotonic() + seconds
+            if self._paused_until is None or until > self._paused_until:
+                self._paused_until = until
+
+    def resume(self):
+        with self._cond:
+            self._paused_until = None
+            self._cond.notify_all()
+
+    def paused_for(self):
+        """Returns the seconds left in the current pause (0.0 if not paused)."""
+        with self._cond:
+            return self._pause_remaining(time.monotonic())
+
+    # --- State queries ---
+
+    def is_queued(self, key):
+        with self._cond:
+            return key in self._queued or key in self._delayed
+
+    def is_active(self, key):
+        with self._cond:
+            return key in self._active
+
+    def queue_wait(self, key):
+        """Seconds a running job waited before it started (retries include their delay). None if it is not running."""
+        with self._cond:
+            return self._waits.get(key)
+
+    def is_idle(self):
+        with self._cond:
+            return not self._queued and not self._delayed and not self._active
+
+    def stats(self):
+        """Returns a snapshot of queue depth and throughput for the current busy period."""
+        with self._cond:
+            if self._started_at is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self._finished_at or time.monotonic()) - self._started_at
+            attempts = self._completed + self._retries
+            return {
+                'queued': len(self._queued) + len(self._delayed),
+                'delayed': len(self._delayed),
+                'active': len(self._active),
+                'completed': self._completed,
+                'retries': self._retries,
+                'max_workers': self.max_workers,
+                'paused_for': self._pause_remaining(time.monotonic()),
+                'admission_blocked': self._refused,
+                'elapsed': elapsed,
+                'jobs_per_minute': (self._completed * 60.0 / elapsed) if elapsed > 0 else 0.0,
+                'avg_wait': (self._total_wait / attempts) if attempts else 0.0,
+                'avg_run': (self._total_run / attempts) if attempts else 0.0,
+            }
+
+    # --- Internals ---
+
+    def _push(self, key, priority, enqueued_at):
+        entry = [priority, next(self._sequence), key, enqueued_at, True]
+        self._queued[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _pause_remaining(self, now):
+        if self._paused_until is None or self._paused_until <= now:
+            return 0.0
+        return self._paused_until - now
+
+    def _release_due(self, now):
+        """Moves delayed jobs whose delay has passed into the run queue."""
+        for key, (ready_at, priority, enqueued_at) in list(self._delayed.items()):
+            if ready_at <= now:
+                del self._delayed[key]
+                self._push(key, priority, enqueued_at)
+
+    def _can_start(self):
+        now = time.monotonic()
+        self._release_due(now)
+        if not self._queued or len(self._active) >= self.max_workers or self._pause_remaining(now):
+            return False
+        if self.admit is None:
+            return True
+        entry = self._peek_next()
+        try:
+            self._refused = entry is not None and not self.admit(entry[2])
+        except Exception:
+            self._refused = False # A failing admission check must not stall the queue
+        return not self._refused
+
+    def _wait_timeout(self):
+        """Seconds until a delayed job or the end of a pause may let a worker start (None: wait for a notify)."""
+        now = time.monotonic()
+        deadlines = [ready_at for ready_at, _, _ in self._delayed.values()]
+        if self._pause_remaining(now):
+            deadlines.append(self._paused_until)
+        if self._refused:
+            deadlines.append(now + ADMIT_RECHECK_INTERVAL) # Space may also be freed outside the queue
+        if not deadlines:
+            return None
+        return max(0.01, min(deadlines) - now)
+
+    def _peek_next(self):
+        while self._heap and not self._heap[0][4]:
+            heapq.heappop(self._heap) # Cancelled or promoted
+        return self._heap[0] if self._heap else None
+
+    def _pop_next(self):
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if entry[4]:
+                del self._queued[entry[2]]
+                return entry
+        return None
+
+    def _ensure_workers(self):
+        # Workers are never torn down; a lower limit simply leaves the extra ones waiting.
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._can_start():
+                    self._cond.wait(self._wait_timeout())
+                entry = self._pop_next()
+                if entry is None:
+                    continue
+                key = entry[2]
+                now = time.monotonic()
+                if self._started_at is None or self._finished_at is not None:
+                    # A new busy period starts: reset the throughput counters
+                    self._started_at = now
+                    self._finished_at = None
+                    self._completed = 0
+                    self._retries = 0
+                    self._total_wait = 0.0
+                    self._total_run = 0.0
+                self._active.add(key)
+                wait_time = now - entry[3]
+                self._waits[key] = wait_time
+
+            retry = None
+            try:
+                outcome = self.run_job(key)
+                if isinstance(outcome, RetryAfter):
+                    retry = outcome
+            except Exception:
+                # run_job reports its own errors; a failure must never kill the worker.
+                pass
+            finally:
+                with self._cond:
+                    self._active.discard(key)
+                    self._waits.pop(key, None)
+                    finished = time.monotonic()
+                    if retry is not None:
+                        self._retries += 1
+                        self._delayed[key] = (finished + retry.delay, entry[0], finished)
+                    else:
+                        self._completed += 1
+                    self._total_wait += wait_time
+                    self._total_run += finished - now
+                    if not self._active and not self._queued and not self._delayed:
+                        self._finished_at = finished
+                    self._cond.notify_all()
@@ -0,0 +1,169 @@
+import re
+from collections import namedtuple
+from bandwidth_budget import parse_rate
+from download_engine import format_bytes, format_eta
+
+# Height caps tried, in order, when a playlist has to fit a size budget
+HEIGHT_STEPS = (4320, 2160, 1440, 1080, 720, 480, 360, 240, 144)
+HEIGHT_PATTERN = re.compile(r'^\s*(\d+)\s*p?\s*$', re.IGNORECASE)
+
+# A planned format for one video: a yt-dlp -f expression, its height (None if
+# audio-only) and its estimated size in bytes (None if unknown)
+FormatChoice = namedtuple('FormatChoice', 'format_selector height size')
+
+# height_cap is None when no cap was needed. choices maps video URL to FormatChoice;
+# over_budget lists videos left out because even the lowest cap did not fit, and
+# unknown_size the videos counted as 0 bytes because no size is known.
+FormatPlan = namedtuple('FormatPlan', 'height_cap choices total_size over_budget unknown_size')
+
+def parse_size(text):
+    """Parses a size such as '20G', '500M' or '1.5 GiB' into bytes. Returns None for '' and '0'."""
+    try:
+        return parse_rate(text)
+    except ValueError:
+        raise ValueError(f"Invalid size '{text}'. Use e.g. 500M, 20G or 1.5G.") from None
+
+def parse_height(text):
+    """Parses a height such as '720' or '720p'. Raises ValueError otherwise."""
+    match = HEIGHT_PATTERN.match(text or "")
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"Invalid height '{text}'. Use e.g. 720 or 1080p.")
+    return int(match.group(1))
+
+def height_selector(max_height):
+    """Returns a -f expression for the best video no taller than max_height, for videos without metadata."""
+    return f"bv*[height<={max_height}]+ba/b[height<={max_height}]/wv*+ba/w"
+
+def summarize_info(info):
+    """Reduces a full yt-dlp info dict to what planning needs (no URLs, thumbnails or descriptions).
+
+    Format sizes fall back to filesize_approx, then to bitrate times duration.
+    """
+    duration = info.get('duration')
+    formats = []
+    for fmt in info.get('formats') or []:
+        video = fmt.get('vcodec') != 'none'
+        audio = fmt.get('acodec') != 'none'
+        if not (video or audio) or not fmt.get('format_id'):
+            continue # Storyboards and the like
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and duration:
+            size = int(fmt['tbr'] * 125 * duration) # tbr is in kbit/s
+        formats.append({'format_id': fmt['format_id'], 'video': video, 'audio': audio,
+                        'height': fmt.get('height') if video else None, 'tbr': fmt.get('tbr'), 'size': size})
+    return {'id': info.get('id'), 'title': info.get('title'), 'duration': duration, 'formats': formats}
+
+def _bitrate(fmt):
+    return fmt.get('tbr') or 0
+
+def choose_format(metadata, max_height=None):
+    """Picks the best video+audio combination no taller than max_height. Returns a FormatChoice or None.
+
+    'Best' is the greatest height, then the highest bitrate. If every video
+    format is taller than max_height, the shortest one is chosen.
+    """
+    formats = metadata.get('formats') or []
+    audio_only = [fmt for fmt in formats if fmt['audio'] and not fmt['video']]
+    best_audio = max(audio_only, key=_bitrate, default=None)
+    candidates = [] # (height, bitrate, selector, size)
+    for fmt in formats:
+        if not fmt['video'] or not fmt['height']:
+            continue
+        if fmt['audio']:
+            candidates.append((fmt['height'], _bitrate(fmt), fmt['format_id'], fmt['size']))
+        elif best_audio is not None:
+            size = fmt['size'] + best_audio['size'] if fmt['size'] and best_audio['size'] else None
+            candidates.append((fmt['height'], _bitrate(fmt) + _bitrate(best_audio),
+                               f"{fmt['format_id']}+{best_audio['format_id']}", size))
+    if not candidates:
+        if best_audio is None:
+            return None
+        return FormatChoice(best_audio['format_id'], None, best_audio['size'])
+    if max_height is not None:
+        fitting = [candidate for candidate in candidates if candidate[0] <= max_height]
+        lowest = min(candidate[0] for candidate in candidates)
+        candidates = fitting or [candidate for candidate in candidates if candidate[0] == lowest]
+    height, _, selector, size = max(candidates, key=lambda candidate: (candidate[0], candidate[1]))
+    # The fallback applies if the saved format IDs are gone by the time the download starts
+    return FormatChoice(f"{selector}/{height_selector(height)}", height, size)
+
+def plan_formats(metadata_by_url, max_height=None, size_budget=None):
+    """Chooses a format for every video with metadata. Returns a FormatPlan.
+
+    metadata_by_url maps video URL to summarize_info() output, in playlist
+    order. With a size_budget, one height cap is applied to the whole
+    playlist, stepping down through HEIGHT_STEPS until the estimated total
+    fits; if even the lowest step does not, videos are taken in playlist
+    order while they fit and the rest are listed in over_budget.
+    """
+    cap = max_height
+    previous = None # (cap, choices, total_size, unknown_size) of the last cap tried
+    while True:
+        choices = {}
+        for url, metadata in metadata_by_url.items():
+            choice = choose_format(metadata, cap)
+            if choice is not None:
+                choices[url] = choice
+        total_size = sum(choice.size or 0 for choice in choices.values())
+        unknown_size = [url for url in metadata_by_url if url not in choices or not choices[url].size]
+        if size_budget is None or total_size <= size_budget:
+            return FormatPlan(cap, choices, total_size, [], unknown_size)
+        if previous is not None and total_size >= previous[2]:
+            # The lower cap saved nothing: keep the cap that produced these choices
+            cap, choices, total_size, unknown_size = previous
+            break
+        previous = (cap, choices, total_size, unknown_size)
+        # Caps at or above the tallest chosen format would change nothing. Videos whose shortest
+        # format is taller than the cap are already as small as they get, so they do not count.
+        tallest = max((choice.height or 0 for choice in choices.values()
+                       if cap is None or (choice.height or 0) <= cap), default=0)
+        lower = [height for height in HEIGHT_STEPS if height < tallest and (cap is None or height < cap)]
+        if not lower:
+            break
+        cap = lower[0]
+
+    kept, over_budget, total_size = {}, [], 0
+    for url, choice in choices.items():
+        if total_size + (choice.size or 0) <= size_budget:
+            kept[url] = choice
+            total_size += choice.size or 0
+        else:
+            over_budget.append(url)
+    return FormatPlan(cap, kept, total_size, over_budget, [url for url in unknown_size if url not in over_budget])
+
+def planned_format(plan, url, max_height=None):
+    """Returns the -f expression to download a video with: its planned format, else the plan's height cap.
+
+    None (yt-dlp's default format) if there is neither a plan nor a max_height.
+    """
+    choice = plan.choices.get(url) if plan is not None else None
+    if choice is not None:
+        return choice.format_selector
+    cap = plan.height_cap if plan is not None else max_height
+    return height_selector(cap) if cap else None
+
+def planned_size(plan, url):
+    """Returns the estimated size in bytes of a video's planned format, or None if it is unknown."""
+    choice = plan.choices.get(url) if plan is not None else None
+    return choice.size if choice is not None else None
+
+def describe_plan(plan, videos):
+    """Summarizes a plan for the given number of videos, e.g. '12 of 12 videos planned at up to 720p, 1.2 GiB'."""
+    quality = f"up to {plan.height_cap}p" if plan.height_cap else "the best quality"
+    text = f"{len(plan.choices)} of {videos} video(s) planned at {quality}, {format_bytes(plan.total_size)} in total"
+    if plan.unknown_size:
+        text += f" ({len(plan.unknown_size)} of unknown size)"
+    if plan.over_budget:
+        text += f"; {len(plan.over_budget)} over the size budget"
+    return text
+
+def describe_choice(metadata, choice):
+    """Formats a planned video for display, e.g. '720p · 84.2 MiB · 12:05'."""
+    parts = []
+    if choice is not None:
+        parts.append(f"{choice.height}p" if choice.height else "audio")
+        if choice.size:
+            parts.append(format_bytes(choice.size))
+    if metadata and metadata.get('duration'):
+        parts.append(format_eta(metadata['duration']))
+    return " · ".join(parts)
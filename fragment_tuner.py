@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+import json
+import time
+import os
+import re
+from urllib.parse import urlparse
+from app_paths import user_cache_dir
+
+# Concurrency levels are powers of two between these bounds
+MIN_FRAGMENTS = 1
+MAX_FRAGMENTS = 16
+START_FRAGMENTS = 2
+# Fragments allowed across all active downloads; each download gets an equal slice of it
+TOTAL_FRAGMENT_BUDGET = 16
+
+SCALING_GAIN = 0.10   # Doubling must raise throughput by at least this fraction to be kept
+EWMA_ALPHA = 0.5      # Weight of the newest measurement of a level
+MIN_SAMPLES = 5       # Progress events needed before a download's throughput counts
+
+# Output that means the host is pushing back (rate limiting, refused or retried fragments)
+THROTTLE_PATTERN = re.compile(r'HTTP Error (?:403|429)|Retrying fragment|Got error', re.IGNORECASE)
+
+def host_of(url):
+    """Returns the host a tuning level is remembered for ('www.' and 'm.' are ignored)."""
+    host = (urlparse(url).hostname or "").lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+def _fold_throughput(measured, level, throughput):
+    previous = measured.get(level)
+    measured[level] = throughput if previous is None else previous + EWMA_ALPHA * (throughput - previous)
+
+def _floor_power_of_two(value):
+    level = MIN_FRAGMENTS
+    while level * 2 <= value:
+        level *= 2
+    return level
+
+
+class TuningSession:
+    """Measures one download for the tuner: fragment throughput and signs of throttling."""
+
+    def __init__(self, host, fragments, capped=False):
+        self.host = host
+        self.fragments = fragments # Value passed to yt-dlp as --concurrent-fragments
+        self.capped = capped       # Set when parallel downloads held it below the host's level
+        self.speed_total = 0.0
+        self.samples = 0
+        self.throttled = False
+
+    def feed_progress(self, event):
+        # Only fragmented (DASH/HLS) downloads say anything about fragment concurrency
+        if event.status == 'downloading' and event.fragment_count and event.speed:
+            self.speed_total += event.speed
+            self.samples += 1
+
+    def feed_line(self, line):
+        if THROTTLE_PATTERN.search(line):
+            self.throttled = True
+
+    @property
+    def throughput(self):
+        """Mean reported speed in bytes/s, or None if there were too few fragment updates."""
+        if self.samples < MIN_SAMPLES:
+            return None
+        return self.speed_total / self.samples
+
+
+class FixedFragments:
+    """Stand-in for FragmentTuner that always uses the same level and learns nothing."""
+
+    def __init__(self, fragments):
+        self.fragments = fragments
+
+    def begin(self, url):
+        return TuningSession(host_of(url), self.fragments)
+
+    def end(self, session, failed=False):
+        pass
+
+
+class FragmentTuner:
+    """Picks --concurrent-fragments per download and learns a level per host.
+
+    yt-dlp fixes the fragment concurrency when a download starts, so the level
+    is tuned from one download to the next: each finished download reports the
+    throughput it reached, and the host's level doubles while doubling pays off,
+    steps back when it does not, and halves on throttling or failures. Levels
+    are stored on disk so later sessions start from the tuned value.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(user_cache_dir(), "fragment_tuning.sqlite3")
+        self._lock = threading.Lock()
+        self._active = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hosts ("
+                " host TEXT PRIMARY KEY,"
+                " fragments INTEGER NOT NULL,"
+                " throughput TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._hosts = {
+                host: {'fragments': fragments, 'throughput': {int(level): speed for level, speed in json.loads(throughput).items()}}
+                for host, fragments, throughput in conn.execute("SELECT host, fragments, throughput FROM hosts")
+            }
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def begin(self, url):
+        """Starts measuring a download and returns its TuningSession."""
+        host = host_of(url)
+        with self._lock:
+            self._active += 1
+            state = self._hosts.get(host)
+            level = state['fragments'] if state else START_FRAGMENTS
+            # Parallel downloads already share the link; split the fragment budget between them
+            cap = _floor_power_of_two(max(MIN_FRAGMENTS, min(MAX_FRAGMENTS, TOTAL_FRAGMENT_BUDGET // self._active)))
+            return TuningSession(host, min(level, cap), capped=cap < level)
+
+    def end(self, session, failed=False):
+        """Folds a finished download's measurements into its host's level. Cancelled downloads are not failures."""
+        with self._lock:
+            self._active -= 1
+            state = self._hosts.setdefault(session.host, {'fragments': START_FRAGMENTS, 'throughput': {}})
+            level = session.fragments
+            throughput = session.throughput
+            if session.capped:
+                # Held below the host's level by the other downloads: its level is kept, only the speed is noted
+                if throughput is None:
+                    return
+                _fold_throughput(state['throughput'], level, throughput)
+            elif session.throttled or (failed and session.samples):
+                state['fragments'] = max(MIN_FRAGMENTS, level // 2)
+            elif throughput is not None:
+                measured = state['throughput']
+                _fold_throughput(measured, level, throughput)
+                lower = measured.get(level // 2) if level > MIN_FRAGMENTS else None
+                higher = measured.get(level * 2)
+                if lower is not None and measured[level] < lower * (1 + SCALING_GAIN):
+                    state['fragments'] = level // 2 # The last doubling did not scale
+                elif level * 2 <= MAX_FRAGMENTS and (higher is None or higher > measured[level] * (1 + SCALING_GAIN)):
+                    state['fragments'] = level * 2
+                else:
+                    state['fragments'] = level
+            else:
+                return # Not a fragmented download: nothing learned
+            row = (session.host, state['fragments'], json.dumps(state['throughput']), time.time())
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO hosts (host, fragments, throughput, updated_at) VALUES (?, ?, ?, ?)", row)
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from app_paths import user_data_dir
+
+# Job events, in the order a download normally goes through them
+JOB_QUEUED = "queued"
+JOB_STARTED = "started"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_RETRYING = "retrying" # A failed attempt that will be retried after a backoff
+
+# Jobs whose last event is one of these are offered for resume after a restart
+RESUMABLE_EVENTS = (JOB_QUEUED, JOB_STARTED, JOB_RETRYING, JOB_FAILED)
+
+# Records are flushed to the OS immediately (survives a crash of the app) and fsynced at
+# most this often (survives a crash of the machine, minus the last interval)
+JOURNAL_SYNC_INTERVAL = 1.0
+
+
+class JobJournal:
+    """Append-only log of download job transitions, replayed at start-up to resume interrupted work.
+
+    Each line is one JSON record: {"event", "url", "time", ...fields}. Fields of
+    later records are merged into the job, so a job is typically queued with its
+    title, output template and audio flag and later only gains a filename or an
+    error. A truncated last line (crash mid-write) is ignored on replay. Once no
+    resumable job is left the file is emptied, so it stays small.
+    """
+
+    def __init__(self, name="gui", path=None):
+        # Each front end keeps its own journal, so one never resumes or truncates the other's jobs
+        self.path = path or os.path.join(user_data_dir(), f"{name}-journal.jsonl")
+        self._lock = threading.Lock()
+        self._jobs = {}          # url: merged job dict, including 'event' (the last one)
+        self._resumable = set()  # urls whose last event is in RESUMABLE_EVENTS
+        self._last_sync = 0.0
+        self._replay()
+        self._compact()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    # --- Recording ---
+
+    def record(self, event, url, **fields):
+        """Appends one job event. Safe to call from worker threads."""
+        entry = {'event': event, 'url': url, 'time': round(time.time(), 3)}
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            now = time.monotonic()
+            if now - self._last_sync >= JOURNAL_SYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._last_sync = now
+            self._apply(entry)
+            if not self._resumable and self._jobs:
+                # Nothing left to resume: start the next session with an empty file
+                self._jobs.clear()
+                self._file.truncate(0)
+
+    def discard(self):
+        """Forgets every job, e.g. when the user declines to resume."""
+        with self._lock:
+            self._jobs.clear()
+            self._resumable.clear()
+            self._file.truncate(0)
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    # --- Queries ---
+
+    def resumable_jobs(self):
+        """Returns the jobs that were queued, interrupted or failed, in the order they were first queued."""
+        with self._lock:
+            return [dict(self._jobs[url]) for url in self._jobs if url in self._resumable]
+
+    def __len__(self):
+        return len(self._resumable)
+
+    # --- Internals ---
+
+    def _apply(self, entry):
+        url = entry['url']
+        job = self._jobs.setdefault(url, {})
+        job.update(entry)
+        if entry['event'] in RESUMABLE_EVENTS:
+            self._resumable.add(url)
+        else:
+            self._resumable.discard(url)
+
+    def _replay(self):
+        try:
+            with open(self.path, encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # Torn last line
+                    if isinstance(entry, dict) and 'event' in entry and 'url' in entry:
+                        self._apply(entry)
+        except FileNotFoundError:
+            pass
+
+    def _compact(self):
+        """Rewrites the journal with one merged record per resumable job."""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as temp_file:
+            for url, job in self._jobs.items():
+                if url in self._resumable:
+                    temp_file.write(json.dumps(job, ensure_ascii=False) + "\n")
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, self.path)
+        self._jobs = {url: job for url, job in self._jobs.items() if url in self._resumable}
@@ -0,0 +1,243 @@
+import concurrent.futures
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from app_paths import user_cache_dir
+from format_planner import summarize_info
+
+DEFAULT_PREFETCH_WORKERS = 4 # Extractions in flight at once; more mostly invites rate limiting
+# Saved info holds signed media URLs that expire after about six hours, so it is only
+# handed to a download well before that
+INFO_FILE_MAX_AGE = 2 * 60 * 60
+INFO_FILE_SUFFIX = ".info.json"
+# Saved info files held at once. Downloads take them roughly in playlist order, so the first
+# ones are kept and later videos are extracted again when their download starts.
+MAX_INFO_FILES = 200
+# Not needed to download the planned format, but often most of an info file
+UNUSED_INFO_FIELDS = ('thumbnails', 'automatic_captions', 'subtitles', 'heatmap')
+
+
+class _Batch:
+    """The videos of one prefetch() call; its future resolves when all of them are done."""
+
+    def __init__(self, urls):
+        self.future = concurrent.futures.Future()
+        self.results = dict.fromkeys(urls)
+        self.remaining = set(self.results)
+        self._lock = threading.Lock()
+        if not self.remaining:
+            self.future.set_result(self.results)
+
+    def finish(self, url, metadata):
+        with self._lock:
+            self.results[url] = metadata
+            self.remaining.discard(url)
+            done = not self.remaining and not self.future.done()
+        if done:
+            self.future.set_result(self.results)
+
+
+class MetadataPrefetcher:
+    """Fetches full per-video metadata in the background, after a flat playlist listing.
+
+    At most max_workers extractions run at once; they are engine futures, so
+    no thread waits on them. Each result is reduced with summarize_info() and
+    stored in the PlaylistCache. The info (minus UNUSED_INFO_FIELDS) of up to
+    MAX_INFO_FILES videos is also saved to info_dir, so a download started
+    soon after can load it (take_info_file()) instead of extracting the video
+    again. on_metadata(entry, metadata, error) is called
+    from a background thread as each video completes (metadata is None if it
+    failed), or from prefetch() itself for videos already cached.
+    """
+
+    def __init__(self, engine, cache=None, max_workers=DEFAULT_PREFETCH_WORKERS, info_dir=None, on_metadata=None):
+        self.engine = engine
+        self.cache = cache
+        self.max_workers = max_workers
+        self.info_dir = info_dir or os.path.join(user_cache_dir(), "info")
+        self.on_metadata = on_metadata
+        self._lock = threading.Lock()
+        self._pending = deque() # Entries waiting for a free slot
+        self._waiting = {}      # Video URL -> batches waiting for its queued or running extraction
+        self._active = 0
+        self._metadata = {}     # Video URL -> summary
+        self._info_files = {}   # Video URL -> (path, saved_at)
+        self._errors = {}       # Video URL -> error message
+        # Cache writes and info files are handled off the engine's loop thread, one at a time
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="metadata-writer")
+        os.makedirs(self.info_dir, exist_ok=True)
+        self._remove_stale_info_files()
+
+    def prefetch(self, entries):
+        """Queues videos for extraction. Returns a Future for {url: metadata or None} covering these entries.
+
+        Videos already known are answered from memory or the cache, and a video
+        whose extraction is already queued or running is not extracted twice.
+        """
+        entries = list(entries)
+        batch = _Batch(entry['url'] for entry in entries)
+        with self._lock:
+            missing = [entry['url'] for entry in entries
+                       if entry['url'] not in self._metadata and entry['url'] not in self._waiting]
+        cached = self.cache.get_metadata(missing) if self.cache is not None and missing else {}
+        known = []
+        with self._lock:
+            for entry in entries:
+                url = entry['url']
+                if url in cached:
+                    self._metadata.setdefault(url, cached[url])
+                if url in self._metadata:
+                    known.append((entry, self._metadata[url]))
+                elif url in self._waiting:
+                    self._waiting[url].append(batch)
+                else:
+                    self._waiting[url] = [batch]
+                    self._pending.append(entry)
+        for entry, metadata in known:
+            if self.on_metadata:
+                self.on_metadata(entry, metadata, None)
+            batch.finish(entry['url'], metadata)
+        self._pump()
+        return batch.future
+
+    def _pump(self):
+        while True:
+            with self._lock:
+                if self._active >= self.max_workers or not self._pending:
+                    return
+                entry = self._pending.popleft()
+                self._active += 1
+            try:
+                future = self.engine.submit_fetch_metadata(entry['url'])
+            except Exception as e:
+                future = concurrent.futures.Future()
+                future.set_exception(e)
+            future.add_done_callback(functools.partial(self._fetched, entry))
+
+    def _fetched(self, entry, future):
+        with self._lock:
+            self._active -= 1
+        try:
+            self._writer.submit(self._store, entry, future)
+        except RuntimeError: # Closed
+            self._finish(entry['url'], None)
+        self._pump()
+
+    def _finish(self, url, metadata):
+        with self._lock:
+            batches = self._waiting.pop(url, ())
+        for batch in batches:
+            batch.finish(url, metadata)
+
+    def _store(self, entry, future):
+        url = entry['url']
+        metadata = error = None
+        try:
+            info = future.result()
+            metadata = summarize_info(info)
+            path = self._save_info(url, info) if self._has_info_room() else None
+            if self.cache is not None:
+                self.cache.put_metadata(url, metadata)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        with self._lock:
+            if metadata is not None:
+                self._metadata[url] = metadata
+                if path is not None:
+                    self._info_files[url] = (path, time.time())
+                self._errors.pop(url, None)
+            else:
+                self._errors[url] = error
+        if self.on_metadata:
+            self.on_metadata(entry, metadata, error)
+        self._finish(url, metadata)
+
+    def _has_info_room(self):
+        """True if another info file may be saved. Expired ones are deleted to make room."""
+        oldest = time.time() - INFO_FILE_MAX_AGE
+        with self._lock:
+            expired = [url for url, (_, saved_at) in self._info_files.items() if saved_at < oldest]
+            paths = [self._info_files.pop(url)[0] for url in expired]
+            room = len(self._info_files) < MAX_INFO_FILES
+        for path in paths:
+            discard_info_file(path)
+        return room
+
+    def _save_info(self, url, info):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16] + INFO_FILE_SUFFIX
+        path = os.path.join(self.info_dir, name)
+        info = {key: value for key, value in info.items() if key not in UNUSED_INFO_FIELDS}
+        with open(path + ".tmp", "w", encoding="utf-8") as info_file:
+            json.dump(info, info_file)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def _remove_stale_info_files(self):
+        oldest = time.time() - INFO_FILE_MAX_AGE
+        for name in os.listdir(self.info_dir):
+            path = os.path.join(self.info_dir, name)
+            try:
+                if os.path.getmtime(path) < oldest:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def metadata(self, url):
+        """Returns the metadata summary of a video, or None if it is not (yet) known."""
+        with self._lock:
+            return self._metadata.get(url)
+
+    def error(self, url):
+        """Returns why a video's extraction failed, or None."""
+        with self._lock:
+            return self._errors.get(url)
+
+    def take_info_file(self, url):
+        """Returns the path of a video's saved info if it is still fresh, handing it over to the caller.
+
+        Each file is handed out once: a retry extracts the video again. The
+        caller deletes the file when the download attempt is over.
+        """
+        with self._lock:
+            path, saved_at = self._info_files.pop(url, (None, None))
+        if path is None:
+            return None
+        if time.time() - saved_at > INFO_FILE_MAX_AGE or not os.path.exists(path):
+            discard_info_file(path)
+            return None
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'active': self._active, 'fetched': len(self._metadata),
+                    'failed': len(self._errors)}
+
+    def cancel(self):
+        """Drops the queued extractions; their prefetch() futures resolve with None for them."""
+        with self._lock:
+            dropped = list(self._pending)
+            self._pending.clear()
+        for entry in dropped:
+            self._finish(entry['url'], None)
+
+    def close(self):
+        """Cancels queued extractions, waits for stored results and deletes the unused info files."""
+        self.cancel()
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            paths = [path for path, _ in self._info_files.values()]
+            self._info_files.clear()
+        for path in paths:
+            discard_info_file(path)
+
+
+def discard_info_file(path):
+    """Deletes a saved info file once its download attempt is over."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
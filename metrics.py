@@ -0,0 +1,338 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRIC_PREFIX = "ytpd_"
+# Per-download records kept for the JSON export (the histograms cover everything)
+RECENT_DOWNLOADS = 200
+METRICS_FLUSH_INTERVAL = 10.0 # Seconds between rewrites of the JSON metrics file
+# Front ends read these when no command-line option is given
+METRICS_PORT_ENV = "YTPD_METRICS_PORT"
+METRICS_FILE_ENV = "YTPD_METRICS_FILE"
+
+# Histogram upper bounds, per unit
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+THROUGHPUT_BUCKETS = tuple(2 ** power for power in range(16, 31, 2)) # 64 KiB/s .. 1 GiB/s
+BYTES_BUCKETS = tuple(2 ** power for power in range(20, 35, 2))      # 1 MiB .. 16 GiB
+
+HELP = {
+    'playlist_fetches_total': "Playlist enumerations, by outcome.",
+    'playlist_entries_total': "Entries returned by playlist enumerations.",
+    'playlist_fetch_seconds': "Time to enumerate a playlist.",
+    'downloads_total': "Finished download attempts, by outcome.",
+    'download_bytes_total': "Bytes transferred by downloads.",
+    'download_retries_total': "Failed attempts that were scheduled for a retry, by failure class.",
+    'download_queue_wait_seconds': "Time a download attempt waited in the queue (including retry backoff).",
+    'download_first_byte_seconds': "Time from starting an attempt to its first transferred bytes.",
+    'download_seconds': "Duration of a download attempt.",
+    'download_bytes': "Bytes transferred per download attempt.",
+    'download_throughput_bytes_per_second': "Average transfer rate of a download attempt.",
+    'download_peak_throughput_bytes_per_second': "Highest rate yt-dlp reported during a download attempt.",
+    'transcodes_total': "Finished MP3 conversions, by outcome.",
+    'transcode_seconds': "Duration of an MP3 conversion.",
+}
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _outcome(result):
+    if result['success']:
+        return "completed"
+    return "cancelled" if result.get('cancelled') else "failed"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense: counts per upper bound, plus sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Process-wide counters, histograms and gauges, plus the most recent per-download records.
+
+    Safe to update from any thread. Gauges are callables read at export time,
+    e.g. the scheduler's queue depth.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}   # name: {label_key: value}
+        self._histograms = {} # name: {label_key: Histogram}
+        self._gauges = {}     # name: callable returning a number
+        self._recent = deque(maxlen=RECENT_DOWNLOADS)
+        self.started_at = time.time()
+
+    # --- Recording ---
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def gauge(self, name, read):
+        """Registers a gauge whose value is read by calling read() at export time."""
+        with self._lock:
+            self._gauges[name] = read
+
+    def playlist_fetched(self, seconds, entries, success=True):
+        self.inc('playlist_fetches_total', outcome="completed" if success else "failed")
+        if success:
+            self.inc('playlist_entries_total', entries)
+            self.observe('playlist_fetch_seconds', seconds)
+
+    def begin_download(self, url, queue_wait=None):
+        """Starts measuring one download attempt. Returns its DownloadMetrics."""
+        return DownloadMetrics(self, url, queue_wait)
+
+    def retry_scheduled(self, category):
+        self.inc('download_retries_total', category=category)
+
+    def transcoded(self, seconds, result):
+        self.inc('transcodes_total', outcome=_outcome(result))
+        if result['success']:
+            self.observe('transcode_seconds', seconds)
+
+    def add_download(self, record):
+        """Keeps one finished attempt's record for the JSON export."""
+        with self._lock:
+            self._recent.append(record)
+
+    # --- Export ---
+
+    def to_prometheus(self):
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: (list(h.cumulative()), h.sum, h.count) for key, h in series.items()}
+                          for name, series in self._histograms.items()}
+            gauges = dict(self._gauges)
+        for name, series in sorted(counters.items()):
+            full_name = METRIC_PREFIX + name
+            lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {full_name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{full_name}{_format_labels(key)} {value}")
+        for name, series in sorted(histograms.items()):
+            full_name = METRIC_PREFIX + name
+            lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {full_name} histogram")
+            for key, (buckets, total, count) in sorted(series.items()):
+                for bound, cumulative in buckets:
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{full_name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {total:g}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {count}")
+        for name, read in sorted(gauges.items()):
+            full_name = METRIC_PREFIX + name
+            lines.append(f"# TYPE {full_name} gauge")
+            lines.append(f"{full_name} {read()}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Returns every metric and the recent per-download records as a JSON-serializable dict."""
+        with self._lock:
+            counters = {name: [dict(key, value=value) for key, value in series.items()]
+                        for name, series in self._counters.items()}
+            histograms = {
+                name: [dict(key, count=h.count, sum=round(h.sum, 3),
+                            buckets={("+Inf" if bound == float("inf") else f"{bound:g}"): total
+                                     for bound, total in h.cumulative()})
+                       for key, h in series.items()]
+                for name, series in self._histograms.items()
+            }
+            gauges = dict(self._gauges)
+            recent = list(self._recent)
+        return {
+            'time': round(time.time(), 3),
+            'started_at': round(self.started_at, 3),
+            'counters': counters,
+            'histograms': histograms,
+            'gauges': {name: read() for name, read in gauges.items()},
+            'recent_downloads': recent,
+        }
+
+
+class DownloadMetrics:
+    """Measures one download attempt from its progress events: first byte, bytes and throughput."""
+
+    def __init__(self, registry, url, queue_wait=None):
+        self.registry = registry
+        self.url = url
+        self.queue_wait = queue_wait
+        self.started_at = time.monotonic()
+        self.first_byte_at = None
+        self.last_progress_at = None
+        self.peak_speed = 0.0
+        self._first_bytes = 0     # Bytes already reported by the first progress event
+        self._completed_files = 0 # Bytes of earlier files of the same attempt (e.g. video, then audio)
+        self._current_file = 0
+
+    def feed_progress(self, event):
+        downloaded = int(event.downloaded_bytes or 0)
+        if downloaded:
+            now = time.monotonic()
+            if self.first_byte_at is None:
+                self.first_byte_at = now
+                self._first_bytes = downloaded
+            self.last_progress_at = now
+            if downloaded < self._current_file: # A new file started
+                self._completed_files += self._current_file
+            self._current_file = downloaded
+        if event.speed and event.speed > self.peak_speed:
+            self.peak_speed = event.speed
+
+    @property
+    def bytes_transferred(self):
+        return self._completed_files + self._current_file
+
+    def finish(self, result):
+        """Records the attempt's outcome in the registry."""
+        registry = self.registry
+        duration = time.monotonic() - self.started_at
+        transferred = self.bytes_transferred
+        outcome = _outcome(result)
+        registry.inc('downloads_total', outcome=outcome)
+        registry.inc('download_bytes_total', transferred)
+        registry.observe('download_seconds', duration)
+        if self.queue_wait is not None:
+            registry.observe('download_queue_wait_seconds', self.queue_wait)
+        first_byte = None
+        average = None
+        if self.first_byte_at is not None:
+            first_byte = self.first_byte_at - self.started_at
+            registry.observe('download_first_byte_seconds', first_byte)
+            registry.observe('download_bytes', transferred, buckets=BYTES_BUCKETS)
+            # Rate between the first and last progress events, which bracket the measured bytes
+            transfer_time = self.last_progress_at - self.first_byte_at
+            if transfer_time > 0:
+                average = (transferred - self._first_bytes) / transfer_time
+                registry.observe('download_throughput_bytes_per_second', average, buckets=THROUGHPUT_BUCKETS)
+            if self.peak_speed:
+                registry.observe('download_peak_throughput_bytes_per_second', self.peak_speed, buckets=THROUGHPUT_BUCKETS)
+        registry.add_download({
+            'url': self.url,
+            'outcome': outcome,
+            'finished_at': round(time.time(), 3),
+            'queue_wait': None if self.queue_wait is None else round(self.queue_wait, 3),
+            'first_byte': None if first_byte is None else round(first_byte, 3),
+            'seconds': round(duration, 3),
+            'bytes': transferred,
+            'avg_speed': None if average is None else round(average),
+            'peak_speed': round(self.peak_speed) or None,
+            'error': result.get('error') if outcome == "failed" else None,
+        })
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes would otherwise be logged to stderr
+
+
+class MetricsServer:
+    """Serves the registry in Prometheus text format on http://127.0.0.1:<port>/metrics from a daemon thread."""
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsFileWriter:
+    """Rewrites a JSON snapshot of the registry every `interval` seconds, and once more on close()."""
+
+    def __init__(self, registry, path, interval=METRICS_FLUSH_INTERVAL):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as metrics_file:
+            json.dump(self.registry.snapshot(), metrics_file, indent=1)
+        os.replace(temp_path, self.path) # Readers never see a half-written file
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError:
+                pass # e.g. the disk is full; the next interval tries again
+
+
+def start_exporters(registry, port=None, path=None):
+    """Starts the HTTP endpoint and/or the JSON file writer that are configured. Returns them as a list.
+
+    port and path default to the YTPD_METRICS_PORT and YTPD_METRICS_FILE
+    environment variables. Raises OSError if the port cannot be bound.
+    """
+    port = port if port is not None else os.environ.get(METRICS_PORT_ENV)
+    path = path or os.environ.get(METRICS_FILE_ENV)
+    exporters = []
+    if port:
+        exporters.append(MetricsServer(registry, int(port)))
+    if path:
+        exporters.append(MetricsFileWriter(registry, path))
+    return exporters
@@ -0,0 +1,129 @@
+import sqlite3
+import json
+import time
+import os
+from app_paths import user_cache_dir
+
+DEFAULT_TTL = 24 * 60 * 60     # Cached playlists older than this are treated as missing
+DEFAULT_MAX_ENTRIES = 200000   # Upper bound on cached entries across all playlists
+METADATA_TTL = 7 * 24 * 60 * 60 # Format lists and sizes of a published video rarely change
+DEFAULT_MAX_METADATA = 50000   # Upper bound on cached per-video metadata rows
+METADATA_QUERY_CHUNK = 500     # Stays under SQLite's limit on bound parameters
+
+
+class PlaylistCache:
+    """On-disk cache of parsed playlist entries, keyed by playlist URL.
+
+    Entries are the same {'title', 'url'} dicts the fetch functions build.
+    Expired playlists are dropped on read, and the least recently used
+    playlists are evicted once the total entry count exceeds max_entries.
+    Full per-video metadata summaries (see format_planner.summarize_info)
+    are kept in a second table, keyed by video URL.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, metadata_ttl=METADATA_TTL,
+                 max_metadata=DEFAULT_MAX_METADATA):
+        self.path = path or os.path.join(user_cache_dir(), "playlists.sqlite3")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.metadata_ttl = metadata_ttl
+        self.max_metadata = max_metadata
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS playlists ("
+                " url TEXT PRIMARY KEY,"
+                " entries TEXT NOT NULL,"
+                " entry_count INTEGER NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS video_metadata ("
+                " url TEXT PRIMARY KEY,"
+                " metadata TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS video_metadata_age ON video_metadata (fetched_at)")
+
+    def _connect(self):
+        # A short-lived connection per call keeps the cache usable from any thread
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, url):
+        """Returns (entries, fetched_at) for a cached playlist, or None if missing or expired."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT entries, fetched_at FROM playlists WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM playlists WHERE url = ?", (url,))
+                return None
+            conn.execute("UPDATE playlists SET accessed_at = ? WHERE url = ?", (now, url))
+        return json.loads(row[0]), row[1]
+
+    def put(self, url, entries):
+        """Stores the full entry list for a playlist and evicts old playlists if over budget."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO playlists (url, entries, entry_count, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (url, json.dumps(entries), len(entries), now, now)
+            )
+            conn.execute("DELETE FROM playlists WHERE fetched_at < ?", (now - self.ttl,))
+            self._evict(conn, keep_url=url)
+
+    def invalidate(self, url):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM playlists WHERE url = ?", (url,))
+
+    def get_metadata(self, urls):
+        """Returns {video url: metadata} for the given videos that have fresh cached metadata."""
+        urls = list(urls)
+        oldest = time.time() - self.metadata_ttl
+        found = {}
+        with self._connect() as conn:
+            for start in range(0, len(urls), METADATA_QUERY_CHUNK):
+                chunk = urls[start:start + METADATA_QUERY_CHUNK]
+                rows = conn.execute(
+                    f"SELECT url, metadata FROM video_metadata WHERE fetched_at >= ? AND url IN ({', '.join('?' * len(chunk))})",
+                    (oldest, *chunk)
+                ).fetchall()
+                found.update((url, json.loads(metadata)) for url, metadata in rows)
+        return found
+
+    def put_metadata(self, url, metadata):
+        """Stores one video's metadata summary and drops the oldest rows if over max_metadata."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO video_metadata (url, metadata, fetched_at) VALUES (?, ?, ?)",
+                         (url, json.dumps(metadata), now))
+            conn.execute("DELETE FROM video_metadata WHERE fetched_at < ?", (now - self.metadata_ttl,))
+            excess = conn.execute("SELECT COUNT(*) FROM video_metadata").fetchone()[0] - self.max_metadata
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM video_metadata WHERE url IN"
+                    " (SELECT url FROM video_metadata ORDER BY fetched_at ASC LIMIT ?)", (excess,)
+                )
+
+    def _evict(self, conn, keep_url):
+        total = conn.execute("SELECT COALESCE(SUM(entry_count), 0) FROM playlists").fetchone()[0]
+        if total <= self.max_entries:
+            return
+        rows = conn.execute(
+            "SELECT url, entry_count FROM playlists WHERE url != ? ORDER BY accessed_at ASC", (keep_url,)
+        ).fetchall()
+        for url, entry_count in rows:
+            if total <= self.max_entries:
+                break
+            conn.execute("DELETE FROM playlists WHERE url = ?", (url,))
+            total -= entry_count
+
+
+def diff_entries(old_entries, new_entries):
+    """Compares two entry lists by video URL. Returns (added, removed) lists of entries."""
+    old_urls = {entry['url'] for entry in old_entries}
+    new_urls = {entry['url'] for entry in new_entries}
+    added = [entry for entry in new_entries if entry['url'] not in old_urls]
+    removed = [entry for entry in old_entries if entry['url'] not in new_urls]
+    return added, removed
@@ -0,0 +1,138 @@
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+from download_archive import video_id_of
+
+# Synced files carry the video ID in their name, so the folder itself is the index
+SYNC_OUTPUT_TEMPLATE = "%(title)s [%(id)s].%(ext)s"
+# Per-folder record of which videos each synced playlist contained
+SYNC_MANIFEST_NAME = ".playlist-sync.json"
+# Files of videos that left every synced playlist are moved here with PRUNE_MOVE
+REMOVED_DIR_NAME = "Removed from playlist"
+
+# What to do with files of videos that left the playlist
+PRUNE_KEEP = "keep"      # Report them (again on every sync) and leave them in place
+PRUNE_MOVE = "move"      # Move them into REMOVED_DIR_NAME
+PRUNE_DELETE = "delete"  # Delete them
+PRUNE_CHOICES = (PRUNE_KEEP, PRUNE_MOVE, PRUNE_DELETE)
+
+FILENAME_ID_PATTERN = re.compile(r'\[([^\[\]]+)\]\.\w+$')
+# Leftovers of unfinished downloads and conversions do not count as present
+INCOMPLETE_SUFFIXES = (".part", ".ytdl", ".tmp", ".temp")
+
+SyncPlan = namedtuple('SyncPlan', 'new present') # Playlist entries to download / already in the folder
+
+def index_folder(directory, archive=None):
+    """Returns {video_id: [path, ...]} for the finished downloads directly inside a directory.
+
+    IDs come from '[id]' in the file names (SYNC_OUTPUT_TEMPLATE and the CLI's
+    default template); files saved under other names are found through the
+    download archive. One directory listing, no per-file stat calls.
+    """
+    index = {}
+    names = set()
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(".") or name.lower().endswith(INCOMPLETE_SUFFIXES) or ".part-Frag" in name:
+                    continue
+                names.add(name)
+                match = FILENAME_ID_PATTERN.search(name)
+                if match:
+                    index.setdefault(match.group(1), []).append(os.path.join(directory, name))
+    except FileNotFoundError:
+        return index # Nothing synced yet
+    if archive is not None:
+        for video_id, filenames in archive.files_in(directory).items():
+            for filename in filenames:
+                path = os.path.join(directory, os.path.basename(filename))
+                if os.path.basename(filename) in names and path not in index.get(video_id, ()):
+                    index.setdefault(video_id, []).append(path)
+    return index
+
+def plan_sync(entries, index):
+    """Splits playlist entries into those missing from the folder index and those already in it."""
+    new, present = [], []
+    for entry in entries:
+        (present if video_id_of(entry) in index else new).append(entry)
+    return SyncPlan(new, present)
+
+def prune(paths, directory, mode):
+    """Moves or deletes files according to mode. Returns a list of (path, error or None)."""
+    outcomes = []
+    if mode == PRUNE_KEEP:
+        return outcomes
+    removed_dir = os.path.join(directory, REMOVED_DIR_NAME)
+    for path in paths:
+        try:
+            if mode == PRUNE_MOVE:
+                os.makedirs(removed_dir, exist_ok=True)
+                os.replace(path, os.path.join(removed_dir, os.path.basename(path)))
+            else:
+                os.remove(path)
+            outcomes.append((path, None))
+        except OSError as e:
+            outcomes.append((path, str(e)))
+    return outcomes
+
+
+class SyncManifest:
+    """The video IDs each playlist synced into a folder contained at its last sync.
+
+    Stored as SYNC_MANIFEST_NAME in the folder, so the folder can be moved or
+    synced from another machine. A video whose ID was dropped by a playlist and
+    is in no other synced playlist is an orphan; orphans that were kept stay
+    flagged until their files are gone or the video returns to a playlist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, SYNC_MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._playlists = {}  # playlist url: set of video IDs
+        self._flagged = set() # Orphans that were reported and kept
+        self._dropped = set() # IDs dropped by a playlist since the manifest was loaded
+        try:
+            with open(self.path, encoding="utf-8") as manifest_file:
+                data = json.load(manifest_file)
+            self._playlists = {url: set(ids) for url, ids in data.get('playlists', {}).items()}
+            self._flagged = set(data.get('flagged', []))
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError, TypeError):
+            pass # Unreadable manifest: start over, nothing is treated as an orphan
+
+    def update(self, playlist_url, entries):
+        """Replaces a playlist's IDs with those of its current entries."""
+        ids = {video_id_of(entry) for entry in entries}
+        with self._lock:
+            self._dropped |= self._playlists.get(playlist_url, set()) - ids
+            self._playlists[playlist_url] = ids
+
+    def orphans(self, index):
+        """Returns the IDs in the folder index that no synced playlist contains any more."""
+        with self._lock:
+            tracked = set().union(*self._playlists.values())
+            # Flags of files that are gone or of videos back in a playlist are not needed any more
+            self._flagged = {video_id for video_id in self._flagged if video_id in index and video_id not in tracked}
+            return sorted(video_id for video_id in (self._dropped | self._flagged)
+                          if video_id in index and video_id not in tracked)
+
+    def set_flagged(self, video_ids):
+        """Remembers the orphans that were kept, so the next sync reports them again."""
+        with self._lock:
+            self._flagged = set(video_ids)
+
+    def save(self):
+        """Writes the manifest atomically."""
+        with self._lock:
+            data = {'playlists': {url: sorted(ids) for url, ids in self._playlists.items()},
+                    'flagged': sorted(self._flagged)}
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(data, manifest_file)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,129 @@
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+
+# Failure classes, from "try again soon" to "never retry"
+FAILURE_TRANSIENT = "transient"        # Network hiccups and server errors
+FAILURE_THROTTLED = "throttled"        # The site is rate limiting us; everything should back off
+FAILURE_UNAVAILABLE = "unavailable"    # Private, removed, region-locked or members-only videos
+FAILURE_PERMANENT = "permanent"        # Anything else (unsupported URL, missing ffmpeg, ...)
+RETRYABLE_FAILURES = (FAILURE_TRANSIENT, FAILURE_THROTTLED)
+
+# Checked in this order against the error text; the first match wins
+FAILURE_PATTERNS = (
+    (FAILURE_THROTTLED, re.compile(
+        r"HTTP Error 429|Too Many Requests|rate.?limit|confirm you.?re not a bot|temporarily blocked", re.IGNORECASE)),
+    (FAILURE_UNAVAILABLE, re.compile(
+        r"Video unavailable|Private video|video is private|has been removed|no longer available|"
+        r"members.only|not available in your country|geo.?restrict|confirm your age|age.restricted|"
+        r"live event will begin|Premieres in", re.IGNORECASE)),
+    (FAILURE_PERMANENT, re.compile(r"HTTP Error 404|Unsupported URL|is not a valid URL", re.IGNORECASE)),
+    (FAILURE_TRANSIENT, re.compile(
+        r"HTTP Error (?:5\d\d|403|408)|timed? ?out|Connection (?:reset|refused|aborted)|"
+        r"Remote end closed|IncompleteRead|Temporary failure in name resolution|Name or service not known|"
+        r"Network is unreachable|Unable to download (?:webpage|video data|API page)|giving up after|"
+        r"SSL|EOF occurred", re.IGNORECASE)),
+)
+
+# Backoff: base * 2^(attempt-1), capped, with the upper half jittered so parallel retries spread out
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 5.0
+DEFAULT_MAX_DELAY = 300.0
+# Circuit breaker: throttling pauses the whole queue; the pause doubles while throttling continues
+THROTTLE_COOLDOWN = 60.0
+MAX_THROTTLE_COOLDOWN = 15 * 60.0
+
+RetryDecision = namedtuple('RetryDecision', 'category attempt retry_in') # retry_in is None when the job is final
+
+def classify_failure(error):
+    """Returns the failure class of an error message (FAILURE_PERMANENT when nothing matches)."""
+    text = error or ""
+    for category, pattern in FAILURE_PATTERNS:
+        if pattern.search(text):
+            return category
+    return FAILURE_PERMANENT
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for retryable failures."""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, category, attempt):
+        return category in RETRYABLE_FAILURES and attempt < self.max_attempts
+
+    def delay(self, attempt):
+        """Delay before the attempt after `attempt` (1-based)."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class RetryManager:
+    """Classifies failed attempts, decides on retries and keeps every attempt per key.
+
+    Throttling trips a circuit breaker shared by all jobs: the scheduler (if
+    given) is paused for a cooldown that doubles while throttling continues and
+    resets after the next success, and retries are never scheduled before the
+    pause ends.
+    """
+
+    def __init__(self, policy=None, scheduler=None, cooldown=THROTTLE_COOLDOWN, max_cooldown=MAX_THROTTLE_COOLDOWN):
+        self.policy = policy or RetryPolicy()
+        self.scheduler = scheduler
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._attempts = {}          # key: list of attempt dicts
+        self._trips = 0              # Consecutive throttling trips
+        self._open_until = 0.0       # Monotonic end of the current breaker pause
+
+    def record_attempt(self, key, result, duration=None):
+        """Records one finished attempt and returns a RetryDecision.
+
+        Successful and cancelled attempts have category None and are final.
+        """
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.setdefault(key, [])
+            # Numbering restarts after a final outcome, so a later manual retry gets a fresh budget
+            attempt = attempts[-1]['attempt'] + 1 if attempts and attempts[-1]['retry_in'] is not None else 1
+            if result['success'] or result.get('cancelled'):
+                category = None
+            else:
+                category = classify_failure(result.get('error'))
+            record = {'attempt': attempt, 'time': time.time(), 'duration': duration, 'success': result['success'],
+                      'category': category, 'error': None if result['success'] else result.get('error')}
+            attempts.append(record)
+
+            if result['success']:
+                self._trips = 0
+            pause = 0.0
+            if category == FAILURE_THROTTLED and now >= self._open_until:
+                # Parallel downloads throttled by the same event trip the breaker once
+                pause = min(self.max_cooldown, self.cooldown * 2 ** self._trips)
+                self._trips += 1
+                self._open_until = now + pause
+
+            retry_in = None
+            if self.policy.should_retry(category, attempt):
+                retry_in = max(self.policy.delay(attempt), self._open_until - now)
+            record['retry_in'] = retry_in
+
+        if pause and self.scheduler is not None:
+            self.scheduler.pause(pause)
+        return RetryDecision(category, attempt, retry_in)
+
+    def attempts(self, key):
+        """Returns the recorded attempts of a key, oldest first."""
+        with self._lock:
+            return [dict(record) for record in self._attempts.get(key, [])]
+
+    def paused_for(self):
+        """Seconds left on the circuit breaker (0.0 when closed)."""
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
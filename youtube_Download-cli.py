@@ -1,163 +1,1003 @@
-import subprocess
+import argparse
+import atexit
+import shutil
 import json
+import threading
+import time
+import sqlite3
 import sys
 import os
-import re
+from concurrent.futures import ThreadPoolExecutor
+from download_scheduler import DownloadScheduler, RetryAfter
+from download_engine import (ENGINE_CHOICES, create_engine, format_eta, format_progress_line,
+                             format_speed, get_default_engine, set_default_engine)
+from playlist_cache import PlaylistCache, diff_entries
+from download_archive import DownloadArchive, VARIANT_VIDEO, video_id_of
+from job_journal import JobJournal, JOB_FAILED
+from bandwidth_budget import BandwidthBudget, parse_rate
+from fragment_tuner import FixedFragments, FragmentTuner
+from retry import DEFAULT_MAX_ATTEMPTS, RetryManager, RetryPolicy
+from metrics import MetricsRegistry, start_exporters
+from download_jobs import OUTPUT_TEMPLATE, check_selection, download_video, parse_selection, queue_job, record_attempt, reserve_space
+from playlist_sync import PRUNE_CHOICES, PRUNE_KEEP, SyncManifest, index_folder, plan_sync, prune
+from download_daemon import DEFAULT_DAEMON_JOBS, DaemonError, connect
+from format_planner import describe_plan, parse_height, parse_size, plan_formats, planned_format, planned_size
+from metadata_prefetch import DEFAULT_PREFETCH_WORKERS, MetadataPrefetcher
+from title_index import TitleIndex
+from staging import DiskSpaceGuard, StagingArea, staging_dir_from_env
+
+# Batch mode: playlists fetched at the same time, and the minimum gap between progress records per video
+BATCH_FETCH_WORKERS = 4
+BATCH_PROGRESS_INTERVAL = 1.0
+
+# Longer playlists (and filter results) list only this many titles in interactive mode
+LIST_PRINT_LIMIT = 50
+
+def fragments_arg(text):
+    """argparse type for --concurrent-fragments: 'auto' or a positive integer."""
+    if text.lower() == "auto":
+        return "auto"
+    value = int(text)
+    if value < 1:
+        raise ValueError(text)
+    return value
+
+def parse_args(argv=None):
+    """Parses command-line options."""
+    parser = argparse.ArgumentParser(
+        description="YouTube Playlist Downloader (CLI). Without URLs it runs interactively; "
+                    "with URLs (or --url-file) it runs headless and writes JSON lines to stdout."
+    )
+    parser.add_argument(
+        "urls",
+        nargs="*",
+        metavar="URL",
+        help="playlist or video URLs to download without prompting"
+    )
+    parser.add_argument(
+        "--url-file",
+        help="file with one playlist URL per line (blank lines and # comments are ignored)"
+    )
+    parser.add_argument(
+        "--select",
+        default="all",
+        help="videos to download from each playlist in batch mode, e.g. '1,5,8-10' or 'all' (default); title "
+             "filters can narrow it: words ('lecture'), exclusions ('!live') and regexes ('/^part\\s*\\d+'), e.g. "
+             "'/lecture 1-50'"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help=f"number of videos to download at the same time (default: 1; {DEFAULT_DAEMON_JOBS} for a daemon this "
+             "command starts)"
+    )
+    parser.add_argument(
+        "--limit-rate",
+        type=parse_rate,
+        default=None,
+        metavar="RATE",
+        help="total download rate shared by all parallel downloads, e.g. 500K or 80M (bytes per second)"
+    )
+    parser.add_argument(
+        "-N", "--concurrent-fragments",
+        type=fragments_arg,
+        default=None,
+        metavar="N|auto",
+        help="DASH/HLS fragments fetched in parallel per video; 'auto' tunes the value per host from "
+             "measured throughput and remembers it (default: yt-dlp's default of 1)"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS - 1,
+        metavar="N",
+        help="retry transient and throttling failures up to N times with exponential backoff "
+             f"(default: {DEFAULT_MAX_ATTEMPTS - 1}; 0 disables retries)"
+    )
+    parser.add_argument(
+        "--sync",
+        metavar="DIR",
+        help="mirror the playlists into DIR: download only the entries whose files are not in DIR yet "
+             "(no per-video requests) and report files of videos that left the playlists"
+    )
+    parser.add_argument(
+        "--prune",
+        choices=PRUNE_CHOICES,
+        default=PRUNE_KEEP,
+        help="with --sync, what to do with files of videos that left every synced playlist: 'keep' and "
+             "report them (default), 'move' them into a 'Removed from playlist' subfolder, or 'delete' them"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="serve download metrics in Prometheus text format on http://127.0.0.1:PORT/metrics "
+             "(default: $YTPD_METRICS_PORT, if set)"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="write download metrics and recent per-download records as JSON to PATH every 10 seconds and "
+             "on exit (default: $YTPD_METRICS_FILE, if set)"
+    )
+    parser.add_argument(
+        "--prefetch-metadata",
+        action="store_true",
+        help="fetch the full metadata (formats, sizes, durations) of the selected videos, "
+             f"{DEFAULT_PREFETCH_WORKERS} at a time, and plan each video's format before downloading; downloads "
+             "then start from the saved metadata instead of extracting each video again"
+    )
+    parser.add_argument(
+        "--max-height",
+        type=parse_height,
+        metavar="N",
+        help="download videos at most N pixels tall, e.g. 720 (default: the best available)"
+    )
+    parser.add_argument(
+        "--size-budget",
+        type=parse_size,
+        metavar="SIZE",
+        help="keep the videos of each playlist under SIZE in total, e.g. 20G, by lowering the resolution of the "
+             "whole playlist (videos that still do not fit are skipped); implies --prefetch-metadata"
+    )
+    parser.add_argument(
+        "--staging-dir",
+        default=staging_dir_from_env(),
+        metavar="DIR",
+        help="download, merge and convert in DIR (e.g. a local SSD or tmpfs) and move each finished file into "
+             "place in one step (default: $YTPD_STAGING_DIR, if set; otherwise files are written in place)"
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINE_CHOICES,
+        default="auto",
+        help="'inprocess' drives the yt_dlp Python package directly, 'subprocess' runs the yt-dlp "
+             "executable per video; 'auto' (default) prefers inprocess when yt_dlp is importable"
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="hand the URLs to the background download daemon (started if needed, with this command's -j, "
+             "--limit-rate, -N, --retries, --engine and --staging-dir) and follow their progress; the downloads continue if "
+             "this command is interrupted, and all clients share the daemon's concurrency limit"
+    )
+    parser.add_argument(
+        "--detach",
+        action="store_true",
+        help="with --daemon, exit as soon as the URLs are submitted"
+    )
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        help="print the download daemon's queue and jobs as one JSON record and exit"
+    )
+    parser.add_argument(
+        "--cancel",
+        action="append",
+        metavar="URL|all",
+        help="cancel a queued or running video in the download daemon ('all' for every unfinished one); "
+             "can be given several times"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always fetch playlists from YouTube instead of using the local metadata cache"
+    )
+    parser.add_argument(
+        "--redownload",
+        action="store_true",
+        help="download videos again even if the download archive lists them as completed"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="without prompting, finish the downloads a previous run left queued, interrupted or failed "
+             "(partial files are continued); can be combined with URLs"
+    )
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.retries < 0:
+        parser.error("--retries must not be negative")
+    if args.size_budget:
+        args.prefetch_metadata = True
+    args.batch = bool(args.urls or args.url_file or args.resume)
+    if args.select != "all" and not args.batch:
+        parser.error("--select requires URLs or --url-file")
+    if args.select != "all":
+        try:
+            check_selection(args.select) # Checks the syntax before any playlist is fetched
+        except ValueError as e:
+            parser.error(f"--select: {e}")
+    if args.sync and not (args.urls or args.url_file):
+        parser.error("--sync requires URLs or --url-file")
+    if args.sync and args.select != "all":
+        parser.error("--sync always mirrors whole playlists and cannot be combined with --select")
+    if args.prune != PRUNE_KEEP and not args.sync:
+        parser.error("--prune requires --sync")
+    if args.daemon and not (args.urls or args.url_file):
+        parser.error("--daemon requires URLs or --url-file")
+    if args.daemon and (args.sync or args.resume):
+        parser.error("--daemon cannot be combined with --sync or --resume (the daemon resumes its own downloads)")
+    if args.daemon and (args.prefetch_metadata or args.max_height):
+        parser.error("--prefetch-metadata, --max-height and --size-budget cannot be combined with --daemon")
+    if args.detach and not args.daemon:
+        parser.error("--detach requires --daemon")
+    if (args.status or args.cancel) and (args.batch or args.daemon):
+        parser.error("--status and --cancel cannot be combined with URLs")
+    return args
 
 def main():
     """Main function to run the command-line interface."""
+    args = parse_args()
+    if args.daemon or args.status or args.cancel:
+        # Thin client: the daemon has checked yt-dlp and holds the queue, so nothing else is set up here
+        sys.exit(run_daemon_client(args))
     
-    # Check if yt-dlp is installed
+    # Check if yt-dlp is installed (the in-process engine answers without starting a process)
     try:
-        subprocess.run(["yt-dlp", "--version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except FileNotFoundError:
-        print("Error: yt-dlp is not installed or not in your system's PATH.")
-        print("Please install it by running: pip install yt-dlp")
+        set_default_engine(create_engine(args.engine))
+        get_default_engine().version()
+    except (FileNotFoundError, RuntimeError):
+        # stderr keeps stdout clean for JSON consumers in batch mode
+        out = sys.stderr if args.batch else sys.stdout
+        print("Error: yt-dlp is not installed or not in your system's PATH.", file=out)
+        print("Please install it by running: pip install yt-dlp", file=out)
         sys.exit(1)
 
+    cache = None
+    if not args.no_cache:
+        try:
+            cache = PlaylistCache()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Warning: playlist cache disabled ({e}).", file=sys.stderr if args.batch else sys.stdout)
+
+    # Completed downloads are always recorded; --redownload only skips the lookup
+    try:
+        archive = DownloadArchive()
+    except (sqlite3.Error, OSError) as e:
+        archive = None
+        print(f"Warning: download archive disabled ({e}).", file=sys.stderr if args.batch else sys.stdout)
+    skip_archived = not args.redownload
+
+    # Journal of queued/started/finished jobs, so an interrupted run can be resumed
+    try:
+        journal = JobJournal("cli")
+    except OSError as e:
+        journal = None
+        print(f"Warning: job journal disabled ({e}).", file=sys.stderr if args.batch else sys.stdout)
+
+    # Total rate limit, split evenly across whichever downloads are running
+    budget = BandwidthBudget(args.limit_rate)
+
+    tuner = None
+    if args.concurrent_fragments == "auto":
+        try:
+            tuner = FragmentTuner()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Warning: fragment auto-tuning disabled ({e}).", file=sys.stderr if args.batch else sys.stdout)
+    elif args.concurrent_fragments:
+        tuner = FixedFragments(args.concurrent_fragments)
+
+    retry_policy = RetryPolicy(max_attempts=args.retries + 1)
+
+    # Downloads run in the staging directory, if one is set, and only start while their estimated
+    # sizes fit the free space of the volumes they write to
+    staging = None
+    if args.staging_dir:
+        try:
+            staging = StagingArea(args.staging_dir)
+        except OSError as e:
+            print(f"Warning: staging directory disabled ({e}).", file=sys.stderr if args.batch else sys.stdout)
+    space = DiskSpaceGuard()
+
+    # Fetch and download instrumentation, exported only when an endpoint or file is configured
+    metrics = MetricsRegistry()
+    try:
+        for exporter in start_exporters(metrics, args.metrics_port, args.metrics_file):
+            atexit.register(exporter.close) # Writes the final JSON snapshot however the run ends
+    except (OSError, ValueError) as e:
+        print(f"Warning: metrics export disabled ({e}).", file=sys.stderr if args.batch else sys.stdout)
+
+    # Full per-video metadata, fetched in the background so formats are planned before downloading
+    prefetcher = None
+    if args.prefetch_metadata:
+        try:
+            prefetcher = MetadataPrefetcher(get_default_engine(), cache)
+        except OSError as e:
+            print(f"Warning: metadata prefetch disabled ({e}).", file=sys.stderr if args.batch else sys.stdout)
+        else:
+            atexit.register(prefetcher.close)
+
+    if args.batch:
+        sys.exit(run_batch(args, cache, archive=archive, skip_archived=skip_archived, journal=journal, budget=budget,
+                           tuner=tuner, retry_policy=retry_policy, metrics=metrics, prefetcher=prefetcher,
+                           staging=staging, space=space))
+
     print("============================================")
     print("= YouTube Playlist Downloader (CLI)      =")
     print("============================================")
+
+    if journal is not None:
+        offer_resume(journal, jobs=args.jobs or 1, archive=archive, budget=budget, tuner=tuner, retry_policy=retry_policy,
+                     metrics=metrics, staging=staging, space=space)
     
     while True:
         playlist_url = input("\nEnter YouTube Playlist URL (or 'exit' to quit): ")
         if playlist_url.lower() == 'exit':
             break
 
-        print("\nFetching playlist info...")
-        videos = fetch_playlist_info(playlist_url)
+        videos = load_playlist(playlist_url, cache, metrics=metrics)
 
         if videos:
+            if prefetcher is not None:
+                prefetcher.prefetch(videos) # Runs while the list is read and a selection is typed
             selected_videos = prompt_for_selection(videos)
+            if prefetcher is not None:
+                prefetcher.cancel() # Videos not extracted yet are queued again if they were selected
             if selected_videos:
-                download_videos(selected_videos)
+                download_videos(selected_videos, jobs=args.jobs or 1, archive=archive, skip_archived=skip_archived,
+                                journal=journal, budget=budget, tuner=tuner, retry_policy=retry_policy, metrics=metrics,
+                                prefetcher=prefetcher, max_height=args.max_height, size_budget=args.size_budget,
+                                staging=staging, space=space)
         else:
             print("Could not find any videos at that URL. Please try again.")
 
-def fetch_playlist_info(url):
+def fetch_playlist_info(url, engine=None, metrics=None):
     """Fetches video titles and URLs from a playlist."""
+    started_at = time.monotonic()
     try:
-        command = [
-            "yt-dlp",
-            "--flat-playlist",
-            "-j",
-            "--no-warnings", # Hide warnings for a cleaner output
-            url
-        ]
-        
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            universal_newlines=True
-        )
-
-        video_info_list = []
-        for line in iter(process.stdout.readline, ''):
-            if line.strip():
-                try:
-                    video_json = json.loads(line)
-                    video_info_list.append({
-                        'title': video_json['title'],
-                        'url': video_json['url']
-                    })
-                except json.JSONDecodeError:
-                    pass # Ignore lines that are not valid JSON
-        process.wait()
-
-        return video_info_list
+        engine = engine or get_default_engine()
+        entries = engine.fetch_playlist(url)
+        if metrics is not None:
+            metrics.playlist_fetched(time.monotonic() - started_at, len(entries))
+        return entries
 
     except Exception as e:
+        if metrics is not None:
+            metrics.playlist_fetched(time.monotonic() - started_at, 0, success=False)
         print(f"An error occurred while fetching info: {e}")
         return []
 
+def load_playlist(url, cache=None, engine=None, metrics=None):
+    """Returns playlist entries, from the cache when possible, refreshing it in the background."""
+    if cache is not None:
+        cached = cache.get(url)
+        if cached:
+            entries, fetched_at = cached
+            age = format_eta(time.time() - fetched_at)
+            print(f"\nLoaded {len(entries)} videos from cache (fetched {age} ago), refreshing in the background...")
+            refresh_thread = threading.Thread(
+                target=refresh_cached_playlist, args=(url, cache, entries, engine, metrics), daemon=True
+            )
+            refresh_thread.start()
+            return entries
+
+    print("\nFetching playlist info...")
+    videos = fetch_playlist_info(url, engine, metrics)
+    if videos and cache is not None:
+        cache.put(url, videos)
+    return videos
+
+def refresh_cached_playlist(url, cache, cached_entries, engine=None, metrics=None):
+    """Re-fetches a cached playlist, stores it and reports entries that were added or removed."""
+    fresh_entries = fetch_playlist_info(url, engine, metrics)
+    if not fresh_entries:
+        return
+    cache.put(url, fresh_entries)
+    added, removed = diff_entries(cached_entries, fresh_entries)
+    if added or removed:
+        print(f"\nPlaylist changed since it was cached: {len(added)} new, {len(removed)} removed. "
+              "Enter the URL again to see the updated list.")
+
+def print_videos(video_list, positions):
+    """Prints the numbered titles at the given 0-based positions, up to LIST_PRINT_LIMIT of them."""
+    for position in positions[:LIST_PRINT_LIMIT]:
+        print(f"[{position + 1:2}] {video_list[position]['title']}")
+    if len(positions) > LIST_PRINT_LIMIT:
+        print(f"... and {len(positions) - LIST_PRINT_LIMIT} more")
+
 def prompt_for_selection(video_list):
-    """Displays videos and prompts user for selection."""
+    """Displays videos and prompts user for selection.
+
+    Besides numbers and ranges, the selection may contain title filters
+    (e.g. 'lecture !live' or '/^part\\s*\\d+ 1-50'); '?filters' lists the
+    matching titles without selecting them.
+    """
+    index = TitleIndex(video_list)
     print("\n------------------ Videos Found ------------------")
-    for i, video in enumerate(video_list, 1):
-        print(f"[{i:2}] {video['title']}")
+    print_videos(video_list, range(len(video_list)))
     print("--------------------------------------------------")
+    if len(video_list) > LIST_PRINT_LIMIT:
+        print(f"{len(video_list)} videos. Type ? followed by words, !word or /regex to list the matching titles.")
     
     while True:
-        selection_input = input("\nEnter the number(s) to download (e.g., 1, 5, 8-10) or 'all': ").strip().lower()
-        
-        if selection_input == 'all':
-            return video_list
-
-        selected_indices = set()
-        
-        # Parse ranges and individual numbers
-        parts = re.split(r'[,\s]+', selection_input)
-        
-        valid_input = True
-        for part in parts:
-            if not part:
+        selection_input = input("\nEnter the number(s) to download (e.g., 1, 5, 8-10), title filters "
+                                "(e.g., lecture !live /regex) or 'all': ")
+        if selection_input.strip().startswith('?'):
+            try:
+                matches = index.search(selection_input.strip()[1:])
+            except ValueError as e:
+                print(e)
                 continue
-            
-            if '-' in part:
-                try:
-                    start, end = map(int, part.split('-'))
-                    if 1 <= start <= end <= len(video_list):
-                        selected_indices.update(range(start, end + 1))
-                    else:
-                        print("Invalid range. Please enter valid numbers.")
-                        valid_input = False
-                        break
-                except ValueError:
-                    print("Invalid range format. Use numbers and a dash (e.g., 5-8).")
-                    valid_input = False
-                    break
-            else:
-                try:
-                    index = int(part)
-                    if 1 <= index <= len(video_list):
-                        selected_indices.add(index)
-                    else:
-                        print("Invalid number. Please enter a valid number from the list.")
-                        valid_input = False
-                        break
-                except ValueError:
-                    print("Invalid input. Please use numbers or 'all'.")
-                    valid_input = False
-                    break
+            print_videos(video_list, matches)
+            print(f"{len(matches)} matching video(s).")
+            continue
         
-        if valid_input and selected_indices:
-            return [video_list[i-1] for i in sorted(selected_indices)]
-        else:
-            if valid_input:
-                print("No videos selected. Please try again.")
+        try:
+            selected_indices = parse_selection(selection_input, len(video_list), index)
+        except ValueError as e:
+            print(e)
+            continue
+        
+        if selected_indices:
+            print(f"Selected {len(selected_indices)} video(s).")
+            return [video_list[i-1] for i in selected_indices]
+        print("No videos selected. Please try again.")
+
+def offer_resume(journal, jobs=1, archive=None, budget=None, tuner=None, retry_policy=None, metrics=None, staging=None,
+                 space=None):
+    """Asks whether to finish the jobs a previous run left unfinished; discards them otherwise."""
+    resumable = journal.resumable_jobs()
+    if not resumable:
+        return
+    failed = sum(1 for job in resumable if job['event'] == JOB_FAILED)
+    answer = input(f"\n{len(resumable)} download(s) from a previous run did not finish ({failed} failed). "
+                   "Resume them? [Y/n]: ")
+    if answer.strip().lower() in ('', 'y', 'yes'):
+        download_videos(resumable, jobs=jobs, archive=archive, skip_archived=False, journal=journal, budget=budget,
+                        tuner=tuner, retry_policy=retry_policy, metrics=metrics, staging=staging, space=space)
+    else:
+        journal.discard()
+
+def describe_retry(decision):
+    return (f"Attempt {decision.attempt} failed ({decision.category}), "
+            f"retrying in {format_eta(decision.retry_in)}...")
 
-def download_videos(videos_to_download):
-    """Downloads the selected videos."""
+def plan_downloads(videos, prefetcher=None, max_height=None, size_budget=None):
+    """Sets each video's format from its metadata (see format_planner) and prints the plan.
+
+    Returns the videos to download: those over size_budget are left out.
+    Without a prefetcher, videos are only capped at max_height.
+    """
+    plan = None
+    if prefetcher is not None:
+        print(f"\nFetching metadata for {len(videos)} video(s)...")
+        metadata = prefetcher.prefetch(videos).result()
+        plan = plan_formats({url: info for url, info in metadata.items() if info is not None}, max_height, size_budget)
+        print(describe_plan(plan, len(videos)) + ".")
+    planned = []
+    for video in videos:
+        if plan is not None and video['url'] in plan.over_budget:
+            continue
+        info_file = prefetcher.take_info_file(video['url']) if prefetcher is not None else None
+        planned.append(dict(video, format=planned_format(plan, video['url'], max_height), info_file=info_file,
+                            size=planned_size(plan, video['url'])))
+    return planned
+
+def download_videos(videos_to_download, jobs=1, engine=None, archive=None, skip_archived=True, journal=None,
+                    budget=None, tuner=None, retry_policy=None, metrics=None, prefetcher=None, max_height=None,
+                    size_budget=None, staging=None, space=None):
+    """Downloads the selected videos, optionally several at a time.
+
+    Videos listed in the download archive are skipped before anything is
+    scheduled; successful downloads are added to it. With a journal, every
+    job's progress through the queue is recorded for resume. Transient and
+    throttling failures are retried according to retry_policy. With a
+    prefetcher or max_height, formats are planned first (see plan_downloads()).
+    staging and space are passed on to download_video(); parallel downloads
+    only start while their estimated sizes fit the free disk space.
+    """
+    engine = engine or get_default_engine()
+    if archive is not None and skip_archived:
+        pending = [video for video in videos_to_download if not archive.contains(video_id_of(video), VARIANT_VIDEO)]
+        skipped = len(videos_to_download) - len(pending)
+        if skipped:
+            print(f"\nSkipping {skipped} video(s) already in the download archive (use --redownload to fetch them again).")
+        videos_to_download = pending
+    if prefetcher is not None or max_height:
+        videos_to_download = plan_downloads(videos_to_download, prefetcher, max_height, size_budget)
+    videos_to_download = [queue_job(video, journal) for video in videos_to_download]
+
+    if jobs > 1 and len(videos_to_download) > 1:
+        download_videos_parallel(videos_to_download, jobs, engine, archive, journal, budget, tuner, retry_policy,
+                                 metrics, staging, space)
+        return
+
+    retries = RetryManager(retry_policy)
+    queued_at = time.monotonic()
     for i, video in enumerate(videos_to_download, 1):
         print(f"\n[{i}/{len(videos_to_download)}] Starting download for: {video['title']}")
+        ready_at = queued_at # Every video is queued up front; a retry waits from its failed attempt on
         
         try:
-            command = ["yt-dlp", "--progress", video['url']]
-            
-            # Use Popen to show real-time progress
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
-            
-            for line in iter(process.stdout.readline, ''):
-                sys.stdout.write(line)
-            
-            process.wait()
+            while True:
+                started_at = time.monotonic()
+                # Show real-time progress as the engine reports it
+                result = download_video(
+                    video, engine, archive, journal, budget, tuner,
+                    on_progress=lambda event: print(format_progress_line(event), flush=True),
+                    on_output=lambda line: print(line, flush=True),
+                    metrics=metrics, queue_wait=started_at - ready_at, staging=staging, space=space
+                )
+                decision = record_attempt(retries, video, result, started_at, journal, metrics)
+                if decision.retry_in is None:
+                    break
+                print(describe_retry(decision), flush=True)
+                ready_at = time.monotonic()
+                time.sleep(decision.retry_in)
             
-            if process.returncode == 0:
+            if result['success']:
                 print(f"Download of '{video['title']}' completed successfully.")
             else:
-                print(f"Download of '{video['title']}' failed.")
+                print(f"Download of '{video['title']}' failed ({decision.category}, attempt {decision.attempt}).")
                 
         except Exception as e:
             print(f"An error occurred during download: {e}")
 
+class ProgressDisplay:
+    """Multiplexes the progress of concurrent downloads onto the terminal.
+
+    On a TTY it redraws a compact block with one line per active download plus
+    an overall line. Otherwise it falls back to plain, prefixed log lines.
+    """
+
+    REFRESH_INTERVAL = 0.2
+
+    def __init__(self, total, stream=None):
+        self.stream = stream or sys.stdout
+        self.interactive = self.stream.isatty()
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.active = {}         # index: dict(title, percent, speed, eta)
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._drawn_lines = 0
+        self._stop = threading.Event()
+        self._refresher = None
+
+    def start(self):
+        if self.interactive:
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._refresher:
+            self._refresher.join()
+        with self._lock:
+            self._redraw()
+
+    def video_started(self, index, title):
+        with self._lock:
+            self.active[index] = {'title': title, 'percent': 0.0, 'speed': '', 'eta': ''}
+            if not self.interactive:
+                self._log(f"[{index}/{self.total}] Starting download for: {title}")
+
+    def video_progress(self, index, event):
+        """Consumes one progress event from the engine for the given download."""
+        with self._lock:
+            state = self.active.get(index)
+            if state is None:
+                return
+            state['percent'] = event.percent
+            state['speed'] = format_speed(event.speed) if event.speed else ''
+            state['eta'] = format_eta(event.eta) if event.eta is not None else ''
+            if not self.interactive:
+                self._log(f"[{index}/{self.total}] {format_progress_line(event)}")
+
+    def video_output(self, index, line):
+        """Consumes one non-progress line of yt-dlp output for the given download."""
+        if not self.interactive:
+            with self._lock:
+                self._log(f"[{index}/{self.total}] {line}")
+
+    def video_retrying(self, index, title, message):
+        """Takes a download off the live block while it waits to be retried."""
+        with self._lock:
+            self.active.pop(index, None)
+            self._log(f"[{index}/{self.total}] '{title}': {message}")
+
+    def video_finished(self, index, title, success, message=None):
+        with self._lock:
+            self.active.pop(index, None)
+            if success:
+                self.completed += 1
+                text = f"[{index}/{self.total}] Download of '{title}' completed successfully."
+            else:
+                self.failed += 1
+                text = f"[{index}/{self.total}] Download of '{title}' failed."
+                if message:
+                    text += f" {message}"
+            self._log(text)
+
+    def _overall_line(self):
+        done = self.completed + self.failed
+        # Count partially downloaded videos so the ETA moves between completions
+        progress = done + sum(state['percent'] for state in self.active.values()) / 100.0
+        elapsed = time.monotonic() - self.started_at
+        if progress > 0:
+            eta = format_eta(elapsed / progress * (self.total - progress))
+        else:
+            eta = "--:--"
+        return (f"Overall: {done}/{self.total} done ({self.failed} failed), "
+                f"{len(self.active)} active, elapsed {format_eta(elapsed)}, ETA {eta}")
+
+    def _log(self, text):
+        # Permanent messages are written above the live status block
+        if self.interactive:
+            self._clear()
+        self.stream.write(text + "\n")
+        if self.interactive:
+            self._draw()
+        self.stream.flush()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.REFRESH_INTERVAL):
+            with self._lock:
+                self._redraw()
+
+    def _redraw(self):
+        if self.interactive:
+            self._clear()
+            self._draw()
+            self.stream.flush()
+
+    def _clear(self):
+        if self._drawn_lines:
+            self.stream.write(f"\x1b[{self._drawn_lines}F\x1b[J")
+            self._drawn_lines = 0
+
+    def _draw(self):
+        width = max(40, shutil.get_terminal_size().columns - 1)
+        lines = []
+        for index in sorted(self.active):
+            state = self.active[index]
+            line = f"[{index}/{self.total}] {state['percent']:5.1f}% {state['speed']:>11} ETA {state['eta'] or '--:--':>8}  {state['title']}"
+            lines.append(line[:width])
+        lines.append(self._overall_line()[:width])
+        self.stream.write("\n".join(lines) + "\n")
+        self._drawn_lines = len(lines)
+
+def download_videos_parallel(videos_to_download, jobs, engine, archive=None, journal=None, budget=None, tuner=None,
+                             retry_policy=None, metrics=None, staging=None, space=None):
+    """Downloads the selected videos with up to `jobs` yt-dlp processes at once."""
+    total = len(videos_to_download)
+    display = ProgressDisplay(total)
+    indexed = {i: video for i, video in enumerate(videos_to_download, 1)}
+
+    def run_job(index):
+        video = indexed[index]
+        display.video_started(index, video['title'])
+        started_at = time.monotonic()
+        try:
+            result = download_video(
+                video, engine, archive, journal, budget, tuner,
+                on_progress=lambda event: display.video_progress(index, event),
+                on_output=lambda line: display.video_output(index, line),
+                metrics=metrics, queue_wait=scheduler.queue_wait(index), staging=staging, space=space
+            )
+            decision = record_attempt(retries, video, result, started_at, journal, metrics)
+            if decision.retry_in is not None:
+                display.video_retrying(index, video['title'], describe_retry(decision))
+                return RetryAfter(decision.retry_in) # Frees the slot while waiting
+            display.video_finished(index, video['title'], result['success'],
+                                   None if result['success'] else f"({decision.category}, attempt {decision.attempt})")
+        except Exception as e:
+            display.video_finished(index, video['title'], False, f"An error occurred during download: {e}")
+
+    print(f"\nDownloading {total} videos, {jobs} at a time...")
+    display.start()
+    admit = (lambda index: reserve_space(indexed[index], space, staging)) if space is not None else None
+    scheduler = DownloadScheduler(run_job, max_workers=jobs, admit=admit)
+    retries = RetryManager(retry_policy, scheduler) # Throttling pauses the whole queue
+    for index in indexed:
+        scheduler.submit(index)
+    try:
+        while not scheduler.is_idle():
+            time.sleep(0.1)
+    finally:
+        display.stop()
+
+def read_url_file(path):
+    """Returns the URLs listed in a file, skipping blank lines and # comments."""
+    with open(path, encoding="utf-8") as url_file:
+        return [line.strip() for line in url_file if line.strip() and not line.lstrip().startswith('#')]
+
+class JsonLinesWriter:
+    """Writes one JSON record per line to stdout; safe to call from several threads."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, record_type, **fields):
+        record = {'type': record_type, 'time': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+def run_batch(args, cache=None, engine=None, archive=None, skip_archived=True, journal=None, budget=None,
+              tuner=None, retry_policy=None, metrics=None, prefetcher=None, staging=None, space=None):
+    """Headless mode: fetches all playlists concurrently and feeds one shared download pipeline.
+
+    Writes 'playlist', 'progress', 'retry', 'result' and 'summary' JSON-lines
+    records to stdout. With --resume, unfinished jobs from the journal are queued first
+    (announced by a 'resume' record). With --sync, only entries missing from the
+    target folder are queued, and files of videos that left the playlists are
+    reported (and pruned) in 'removed' records. With a prefetcher, each
+    playlist's videos are extracted and their formats planned (a 'plan'
+    record) before they are queued. Downloads only start while their
+    estimated sizes fit the free space of the staging and target volumes.
+    Returns the exit code: 0 if everything succeeded, 1 if any playlist or
+    video failed.
+    """
+    engine = engine or get_default_engine()
+    writer = JsonLinesWriter()
+    urls = list(args.urls)
+    if args.url_file:
+        try:
+            urls.extend(read_url_file(args.url_file))
+        except OSError as e:
+            writer.emit('error', message=f"Could not read URL file: {e}")
+            return 1
+
+    videos = {}             # video_url: video dict, shared by every playlist (duplicates download once)
+    last_progress = {}      # video_url: time of the last progress record
+    counts = {'playlists_failed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0, 'in_folder': 0, 'removed': 0}
+    lock = threading.Lock()
+
+    if args.sync:
+        # The folder listing is the index of what is already downloaded; the archive is not consulted
+        sync_dir = os.path.abspath(args.sync)
+        folder_index = index_folder(sync_dir, archive)
+        manifest = SyncManifest(sync_dir)
+
+    def run_job(video_url):
+        video = videos[video_url]
+        writer.emit('start', video=video_url, title=video['title'], playlist=video['playlist'])
+        started_at = time.monotonic()
+
+        def on_progress(event):
+            now = time.monotonic()
+            if event.status != 'finished' and now - last_progress.get(video_url, 0) < BATCH_PROGRESS_INTERVAL:
+                return
+            last_progress[video_url] = now
+            writer.emit('progress', video=video_url, status=event.status, percent=round(event.percent, 1),
+                        downloaded_bytes=event.downloaded_bytes, total_bytes=event.total_bytes,
+                        speed=event.speed, eta=event.eta)
+
+        try:
+            result = download_video(video, engine, archive, journal, budget, tuner, on_progress=on_progress,
+                                    metrics=metrics, queue_wait=scheduler.queue_wait(video_url), staging=staging,
+                                    space=space)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        last_progress.pop(video_url, None)
+        decision = record_attempt(retries, video, result, started_at, journal, metrics)
+        if decision.retry_in is not None:
+            writer.emit('retry', video=video_url, title=video['title'], playlist=video['playlist'],
+                        attempt=decision.attempt, category=decision.category, error=result.get('error'),
+                        retry_in=round(decision.retry_in, 1), queue_paused_for=round(scheduler.paused_for(), 1))
+            return RetryAfter(decision.retry_in)
+        with lock:
+            counts['succeeded' if result['success'] else 'failed'] += 1
+        writer.emit('result', video=video_url, title=video['title'], playlist=video['playlist'],
+                    success=result['success'], error=result.get('error'), category=decision.category,
+                    attempts=decision.attempt)
+
+    admit = (lambda video_url: reserve_space(videos[video_url], space, staging)) if space is not None else None
+    scheduler = DownloadScheduler(run_job, max_workers=args.jobs or 1, admit=admit)
+    retries = RetryManager(retry_policy, scheduler) # Throttling pauses the whole queue
+    if metrics is not None:
+        metrics.gauge('downloads_active', lambda: scheduler.stats()['active'])
+        metrics.gauge('downloads_queued', lambda: scheduler.stats()['queued'])
+
+    if args.resume and journal is not None:
+        resumable = journal.resumable_jobs()
+        writer.emit('resume', videos=len(resumable))
+        for job in resumable:
+            videos[job['url']] = queue_job(job, journal)
+            scheduler.submit(job['url'])
+
+    def is_archived(video):
+        return (skip_archived and not args.sync and archive is not None
+                and archive.contains(video_id_of(video), VARIANT_VIDEO))
+
+    def plan_playlist(playlist_url, selected):
+        with lock:
+            wanted = [video for video in selected if video['url'] not in videos]
+        wanted = [video for video in wanted if not is_archived(video)]
+        metadata = prefetcher.prefetch(wanted).result()
+        known = {url: info for url, info in metadata.items() if info is not None}
+        plan = plan_formats(known, args.max_height, args.size_budget)
+        writer.emit('plan', url=playlist_url, videos=len(wanted), metadata=len(known), height_cap=plan.height_cap,
+                    total_bytes=plan.total_size, unknown_size=len(plan.unknown_size),
+                    over_budget=len(plan.over_budget))
+        return plan
+
+    def fetch(playlist_url):
+        started_at = time.monotonic()
+        entries = None
+        try:
+            entries = engine.fetch_playlist(playlist_url)
+            if metrics is not None:
+                metrics.playlist_fetched(time.monotonic() - started_at, len(entries), success=bool(entries))
+            if entries and cache is not None:
+                cache.put(playlist_url, entries)
+            index = TitleIndex(entries) if args.select != "all" else None
+            selected_indices = parse_selection(args.select, len(entries), index)
+        except Exception as e:
+            if metrics is not None and entries is None:
+                metrics.playlist_fetched(time.monotonic() - started_at, 0, success=False)
+            with lock:
+                counts['playlists_failed'] += 1
+            writer.emit('playlist', url=playlist_url, success=False, error=str(e))
+            return
+        if not entries:
+            with lock:
+                counts['playlists_failed'] += 1
+            writer.emit('playlist', url=playlist_url, success=False, error="No videos found")
+            return
+
+        if args.sync:
+            manifest.update(playlist_url, entries)
+            plan = plan_sync(entries, folder_index)
+            selected = plan.new
+            with lock:
+                counts['in_folder'] += len(plan.present)
+            writer.emit('playlist', url=playlist_url, success=True, entries=len(entries), selected=len(selected),
+                        in_folder=len(plan.present))
+        else:
+            selected = [entries[index - 1] for index in selected_indices]
+            writer.emit('playlist', url=playlist_url, success=True, entries=len(entries), selected=len(selected))
+        plan = plan_playlist(playlist_url, selected) if prefetcher is not None else None
+        # Downloads start as soon as this playlist is known, while others are still being fetched
+        for video in selected:
+            with lock:
+                if video['url'] in videos:
+                    continue
+                job = dict(video, playlist=playlist_url)
+                if args.sync:
+                    job['output_template'] = os.path.join(sync_dir, OUTPUT_TEMPLATE)
+                reason = None
+                if is_archived(video):
+                    reason = "already downloaded"
+                elif plan is not None and video['url'] in plan.over_budget:
+                    reason = "over size budget"
+                if reason:
+                    counts['skipped'] += 1
+                else:
+                    job['format'] = planned_format(plan, video['url'], args.max_height)
+                    job['size'] = planned_size(plan, video['url'])
+                    if prefetcher is not None:
+                        job['info_file'] = prefetcher.take_info_file(video['url'])
+                    job = queue_job(job, journal)
+                videos[video['url']] = job
+            if reason:
+                writer.emit('skipped', video=video['url'], title=video['title'], playlist=playlist_url, reason=reason)
+                continue
+            scheduler.submit(video['url'])
+
+    with ThreadPoolExecutor(max_workers=BATCH_FETCH_WORKERS) as fetch_pool:
+        list(fetch_pool.map(fetch, urls))
+    if args.sync:
+        sync_removed(writer, manifest, folder_index, sync_dir, args.prune, counts)
+    while not scheduler.is_idle():
+        time.sleep(0.2)
+
+    stats = scheduler.stats()
+    summary = {}
+    if args.sync:
+        summary = {'in_folder': counts['in_folder'], 'removed': counts['removed']}
+    writer.emit('summary', playlists=len(urls), playlists_failed=counts['playlists_failed'], videos=len(videos),
+                succeeded=counts['succeeded'], failed=counts['failed'], skipped=counts['skipped'], retries=stats['retries'],
+                elapsed=round(stats['elapsed'], 1), **summary)
+    return 1 if counts['failed'] or counts['playlists_failed'] else 0
+
+def daemon_args(args):
+    """Returns the daemon command-line options matching this command's download options."""
+    options = ["--jobs", str(args.jobs if args.jobs is not None else DEFAULT_DAEMON_JOBS), "--retries", str(args.retries),
+               "--engine", args.engine]
+    if args.limit_rate:
+        options += ["--limit-rate", str(args.limit_rate)]
+    if args.concurrent_fragments:
+        options += ["--concurrent-fragments", str(args.concurrent_fragments)]
+    if args.no_cache:
+        options.append("--no-cache")
+    if args.metrics_port:
+        options += ["--metrics-port", str(args.metrics_port)]
+    if args.metrics_file:
+        options += ["--metrics-file", os.path.abspath(args.metrics_file)]
+    if args.staging_dir:
+        options += ["--staging-dir", os.path.abspath(args.staging_dir)]
+    return options
+
+def run_daemon_client(args):
+    """Thin-client mode: submits URLs to the download daemon, or queries or cancels its downloads.
+
+    Writes the same JSON-lines records as run_batch, with a 'submitted' record
+    first; the downloads are saved in the current directory. --status writes a
+    single 'status' record and --cancel a 'cancel' record. Returns the exit code.
+    """
+    writer = JsonLinesWriter()
+    try:
+        if args.status:
+            with connect(start=False) as client:
+                writer.emit('status', **client.request('status'))
+            return 0
+        if args.cancel:
+            with connect(start=False) as client:
+                response = client.request('cancel', videos=None if "all" in args.cancel else args.cancel)
+            writer.emit('cancel', **response)
+            return 0
+
+        urls = list(args.urls)
+        if args.url_file:
+            try:
+                urls.extend(read_url_file(args.url_file))
+            except OSError as e:
+                writer.emit('error', message=f"Could not read URL file: {e}")
+                return 1
+        # Subscribe before submitting, so no record of this submission is missed
+        watcher = None if args.detach else connect(daemon_args=daemon_args(args))
+        records = watcher.watch() if watcher is not None else None
+        with connect(daemon_args=daemon_args(args)) as client:
+            response = client.request('submit', urls=urls, select=args.select, directory=os.getcwd(),
+                                      redownload=args.redownload)
+        writer.emit('submitted', submission=response['submission'], playlists=len(urls))
+        if watcher is None:
+            return 0
+        with watcher:
+            return follow_submission(records, response['submission'], writer)
+    except DaemonError as e:
+        writer.emit('error', message=str(e))
+        return 1
+
+def follow_submission(records, submission, writer):
+    """Writes the daemon's records of one submission until its summary. Returns the exit code."""
+    last_progress = {} # video_url: time of the last progress record
+    try:
+        for record in records:
+            if submission not in record.pop('submissions', ()) or record['type'] == 'queued':
+                continue
+            record_type = record.pop('type')
+            del record['time']
+            if record_type == 'progress':
+                now = time.monotonic()
+                if record['status'] != 'finished' and now - last_progress.get(record['video'], 0) < BATCH_PROGRESS_INTERVAL:
+                    continue
+                last_progress[record['video']] = now
+            writer.emit(record_type, **record)
+            if record_type == 'summary':
+                return 1 if record['failed'] or record['playlists_failed'] else 0
+    except KeyboardInterrupt:
+        print("Stopped following; the downloads continue in the daemon (see --status).", file=sys.stderr)
+        return 130
+    writer.emit('error', message="Lost the connection to the download daemon.")
+    return 1
+
+def sync_removed(writer, manifest, folder_index, sync_dir, mode, counts):
+    """Reports (and with --prune, moves or deletes) files of videos that left every synced playlist."""
+    orphans = manifest.orphans(folder_index)
+    kept = []
+    for video_id in orphans:
+        paths = folder_index[video_id]
+        outcomes = dict(prune(paths, sync_dir, mode))
+        for path in paths:
+            writer.emit('removed', video_id=video_id, file=path, action=mode, error=outcomes.get(path))
+        if mode == PRUNE_KEEP or any(outcomes.values()):
+            kept.append(video_id)
+    counts['removed'] = len(orphans)
+    manifest.set_flagged(kept) # Reported again on the next sync until they are dealt with
+    try:
+        manifest.save()
+    except OSError as e:
+        writer.emit('error', message=f"Could not save the sync manifest: {e}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,12 +1,69 @@
 import tkinter as tk
 from tkinter import messagebox, ttk, filedialog
 import customtkinter as ctk
-import subprocess
 import threading
-import json
+import sqlite3
+import queue
+import time
 import os
 import sys
-import re
+from concurrent.futures import ThreadPoolExecutor
+from download_scheduler import DownloadScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, RetryAfter
+from download_engine import DownloadHandle, format_eta, format_progress_line, format_speed, get_default_engine
+from playlist_cache import PlaylistCache, diff_entries
+from video_list_view import VirtualVideoList
+from download_archive import DownloadArchive, VARIANT_MP3, VARIANT_VIDEO, video_id_of
+from job_journal import JobJournal, JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RETRYING, JOB_STARTED
+from bandwidth_budget import BandwidthBudget, BACKGROUND_WEIGHT, FOREGROUND_WEIGHT, parse_rate
+from fragment_tuner import FixedFragments, FragmentTuner
+from transcode import DEFAULT_TRANSCODE_WORKERS, TranscodePool, find_ffmpeg
+from retry import RetryManager
+from metrics import MetricsRegistry, start_exporters
+from download_daemon import DaemonError, RemoteScheduler, daemon_supported, progress_event_of
+from playlist_sync import (REMOVED_DIR_NAME, PRUNE_MOVE, SYNC_OUTPUT_TEMPLATE, SyncManifest, index_folder, plan_sync,
+                           prune)
+from format_planner import choose_format, describe_choice, describe_plan, plan_formats, planned_format, planned_size
+from metadata_prefetch import MetadataPrefetcher, discard_info_file
+from title_index import TitleIndex
+from staging import DiskSpaceGuard, StagingArea, space_directories, staging_dir_from_env
+
+# Default number of videos downloaded at the same time
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 3
+CONCURRENCY_CHOICES = ["1", "2", "3", "4", "6", "8"]
+
+# Total bandwidth shared by all downloads; row-button downloads get a bigger share than "Download All"
+BANDWIDTH_CHOICES = ["Unlimited", "1 MiB/s", "5 MiB/s", "10 MiB/s", "20 MiB/s", "50 MiB/s", "80 MiB/s"]
+
+# Parallel DASH/HLS fragments per video; "Auto" tunes them per host from measured throughput
+FRAGMENT_CHOICES = ["Default", "Auto", "2", "4", "8", "16"]
+
+# Format planning as (max height, size budget). "Best" leaves the choice to yt-dlp at download time;
+# the others fetch every video's full metadata after the listing, show sizes and pick formats up front
+FORMAT_PLAN_CHOICES = {
+    "Best": None,
+    "Best + sizes": (None, None),
+    "Max 1080p": (1080, None),
+    "Max 720p": (720, None),
+    "Max 480p": (480, None),
+    "Under 5 GiB": (None, 5 * 1024 ** 3),
+    "Under 20 GiB": (None, 20 * 1024 ** 3),
+    "Under 50 GiB": (None, 50 * 1024 ** 3),
+}
+
+# Simultaneous MP3 conversions (CPU-bound, so up to the core count)
+TRANSCODE_CHOICES = [str(n) for n in sorted({1, 2, 4, DEFAULT_TRANSCODE_WORKERS})]
+
+# Streamed playlist entries are moved from the fetch thread onto the screen in batches
+ENTRY_BATCH_SIZE = 500
+ENTRY_DRAIN_INTERVAL_MS = 30
+FETCH_DONE = object() # Queue sentinel: the fetch thread has finished
+
+# The filter box is applied once typing pauses for this long
+FILTER_DELAY_MS = 150
+
+# Download threads never call into Tk. They record the latest row state and the monitor
+# tick applies it, so Tk receives at most 1000 / UI_REFRESH_MS progress callbacks per second.
+UI_REFRESH_MS = 100
 
 # Main application class
 class YouTubeDownloaderApp(ctk.CTk):
@@ -19,17 +76,139 @@ class YouTubeDownloaderApp(ctk.CTk):
         self.configure(bg="#f0f0f0")
         
         # --- Variables ---
-        self.download_processes = {} # Stores active subprocesses (video_url: subprocess.Popen object)
-        self.video_widgets = {}      # Stores references to widgets for each video (video_url: dict of widgets)
+        self.download_processes = {} # Stores active downloads (video_url: DownloadHandle, cancellable via terminate())
+        self.download_speeds = {}    # Latest reported speed per active download (video_url: bytes per second)
         self.is_fetching = False     # Flag to prevent multiple fetch operations
         self.download_path = os.getcwd() # Set default download path to current directory
+        self.video_info_list = []
+        self.entry_queue = queue.Queue() # Entries streamed from the fetch thread to the Tk loop
+        self.auto_queue_new_rows = False # Set when "Download All" is clicked while entries are still arriving
+        self.pending_row_updates = {}    # Latest unapplied row changes from download threads (video_url: dict)
+        self.pending_row_lock = threading.Lock()
+        self.ui_calls = queue.Queue()    # Callbacks from engine and worker threads, run on the Tk thread each tick
+        self.ui_stats = {'ticks': 0, 'rows_applied': 0, 'updates_received': 0} # For measuring UI load
+        self.output_templates = {}        # Fixed output templates of resumed and synced jobs (video_url: template)
+        self.download_priorities = {}     # Scheduler priority each queued download was submitted with (video_url: int)
+        self.format_setting = None        # (max height, size budget) of the selected format plan, or None
+        self.format_plan = None           # FormatPlan of the loaded playlist, once its metadata is in
+        self.plan_generation = 0          # Bumped on every new plan request; stale results are dropped
+        self.metadata_statuses = {}       # Size/duration text shown on idle rows (video_url: status)
+        self.title_index = TitleIndex()   # Words of the titles in self.video_info_list, in the same order
+        self.filter_matches = None        # URLs matching the filter box, or None without a filter
+        self.filter_job = None            # Pending after() call that applies the filter box
+        self.staged_templates = {}        # MP3s converted in the staging area (video_url: (staged, output template))
+
+        # yt-dlp backend: in-process yt_dlp when available, otherwise one subprocess per call
+        self.engine = get_default_engine()
+
+        # On-disk playlist metadata cache; loading still works without it
+        try:
+            self.playlist_cache = PlaylistCache()
+        except (sqlite3.Error, OSError):
+            self.playlist_cache = None
+        # Finished fetches are stored from here: their done callbacks run on the engine's event loop,
+        # which must not wait for SQLite while it reads every download's output
+        self.fetch_results = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fetch-results")
+
+        # Index of completed downloads, so "Download All" skips what is already on disk
+        try:
+            self.download_archive = DownloadArchive()
+        except (sqlite3.Error, OSError):
+            self.download_archive = None
+
+        # Full per-video metadata, fetched in the background when a format plan is selected
+        try:
+            self.prefetcher = MetadataPrefetcher(self.engine, self.playlist_cache, on_metadata=self.on_metadata)
+        except OSError:
+            self.prefetcher = None
+
+        # With --daemon the queue lives in the download daemon (started if none is running): downloads keep
+        # running after the window closes and share one concurrency limit with the CLI
+        self.daemon = None
+        if daemon_supported() and "--daemon" in sys.argv[1:]:
+            try:
+                self.daemon = RemoteScheduler(self.describe_job, self.on_daemon_record, start=True)
+            except DaemonError as e:
+                print(f"Warning: download daemon unavailable, downloading in this window ({e}).", file=sys.stderr)
+
+        # Append-only record of queued/started/finished downloads, replayed to resume after a crash
+        # (the daemon keeps its own)
+        self.job_journal = None
+        if self.daemon is None:
+            try:
+                self.job_journal = JobJournal()
+            except OSError:
+                pass
+
+        # Downloads and MP3 conversions run in $YTPD_STAGING_DIR, if set, and are moved into the save
+        # folder once complete; new downloads only start while their estimated sizes fit the free disk space
+        self.staging = None
+        if staging_dir_from_env():
+            try:
+                self.staging = StagingArea(staging_dir_from_env())
+            except OSError:
+                pass
+        self.space_guard = DiskSpaceGuard()
+
+        # Bounded worker pool: queued downloads wait here instead of all starting at once
+        self.scheduler = self.daemon or DownloadScheduler(self.run_download, max_workers=DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+                                                          admit=self.admit_download)
+
+        # Fetch, download and conversion instrumentation; exported over HTTP and/or to a JSON file
+        # when YTPD_METRICS_PORT / YTPD_METRICS_FILE are set
+        self.metrics = MetricsRegistry()
+        self.metrics.gauge('downloads_active', lambda: self.scheduler.stats()['active'])
+        self.metrics.gauge('downloads_queued', lambda: self.scheduler.stats()['queued'])
+        try:
+            self.metrics_exporters = start_exporters(self.metrics)
+        except (OSError, ValueError):
+            self.metrics_exporters = []
+
+        # Failed attempts are classified; transient and throttled ones are requeued with backoff,
+        # and throttling pauses the whole queue
+        self.retry_manager = RetryManager(scheduler=self.scheduler)
+
+        # MP3 rows are converted on a separate pool, so conversions never hold a download slot.
+        # Without ffmpeg on PATH yt-dlp's in-job extraction is used (and reports the missing ffmpeg).
+        ffmpeg = find_ffmpeg()
+        self.transcode_pool = TranscodePool(self.on_transcode_done, ffmpeg=ffmpeg, metrics=self.metrics) if ffmpeg else None
+
+        # Total rate limit, rebalanced across active downloads whenever one starts or finishes
+        self.bandwidth_budget = BandwidthBudget()
+
+        # Fragment concurrency: None (yt-dlp's default), FixedFragments or the auto-tuner
+        self.fragment_policy = None
+        try:
+            self.fragment_tuner = FragmentTuner()
+        except (sqlite3.Error, OSError):
+            self.fragment_tuner = None
 
         # --- GUI Elements ---
         self.create_widgets()
 
         # --- Start monitoring downloads ---
         # This function will periodically check the status of all active downloads
-        self.after(100, self.monitor_downloads)
+        self.after(UI_REFRESH_MS, self.monitor_downloads)
+
+        # Offer to finish what the previous session left behind once the window is up
+        if self.job_journal is not None and len(self.job_journal):
+            self.after(0, self.offer_resume)
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        """Stops the metrics exporters (writing the final JSON snapshot) and closes the window.
+
+        Downloads queued in the daemon continue.
+        """
+        for exporter in self.metrics_exporters:
+            exporter.close()
+        if self.daemon is not None:
+            self.daemon.close()
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        self.fetch_results.shutdown(wait=False)
+        self.destroy()
 
     def create_widgets(self):
         # Header Frame: Contains URL input and Load button
@@ -65,13 +244,50 @@ class YouTubeDownloaderApp(ctk.CTk):
         )
         self.path_button.pack(side=tk.LEFT, padx=5)
 
+        self.sync_button = ctk.CTkButton(
+            path_frame,
+            text="Sync Folder",
+            command=self.start_sync_thread,
+            font=("Arial", 10, "bold"),
+            width=120
+        )
+        self.sync_button.pack(side=tk.LEFT, padx=5)
+
+        # Format plan selector: quality cap or total size budget, planned from prefetched metadata
+        if self.prefetcher is not None:
+            ctk.CTkLabel(path_frame, text="Formats:", font=("Arial", 10)).pack(side=tk.LEFT, padx=(10, 2))
+            self.format_menu = ctk.CTkOptionMenu(
+                path_frame,
+                values=list(FORMAT_PLAN_CHOICES),
+                command=self.set_format_plan,
+                width=120
+            )
+            self.format_menu.set("Best")
+            self.format_menu.pack(side=tk.LEFT, padx=2)
+
         # Status Label: Displays general application status (e.g., fetching, ready, error)
         self.status_label = ctk.CTkLabel(self, text="Paste a playlist URL and click 'Load Playlist'.", font=("Arial", 12))
         self.status_label.pack(pady=10)
 
-        # Video List Frame (Scrollable): Holds individual video entries
-        self.video_list_frame = ctk.CTkScrollableFrame(self, fg_color="transparent")
-        self.video_list_frame.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
+        # Filter box: narrows the list to titles matching words, !exclusions and /regexes
+        filter_frame = ctk.CTkFrame(self, fg_color="transparent")
+        filter_frame.pack(fill=tk.X, padx=10)
+        ctk.CTkLabel(filter_frame, text="Filter:", font=("Arial", 12)).pack(side=tk.LEFT, padx=5)
+        self.filter_entry = ctk.CTkEntry(filter_frame, width=300, placeholder_text="words, !exclude, /regex")
+        self.filter_entry.pack(side=tk.LEFT, padx=5)
+        self.filter_entry.bind("<KeyRelease>", self.schedule_filter)
+        self.filter_label = ctk.CTkLabel(filter_frame, text="", font=("Arial", 10), text_color="gray")
+        self.filter_label.pack(side=tk.LEFT, padx=5)
+
+        # Video List (Scrollable): per-video state rendered through a small pool of reusable rows
+        self.video_list = VirtualVideoList(
+            self,
+            on_download=self.start_single_download,
+            on_cancel=self.cancel_single_download,
+            fg_color="transparent"
+        )
+        self.video_list.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
+        self.video_widgets = self.video_list.visible_rows # Widgets of on-screen rows only (video_url: dict of widgets)
 
         # Control Buttons Frame: Contains Download All and Cancel All buttons
         button_frame = ctk.CTkFrame(self, fg_color="transparent")
@@ -97,6 +313,55 @@ class YouTubeDownloaderApp(ctk.CTk):
         )
         self.cancel_all_button.pack(side=tk.LEFT, padx=10)
 
+        # Concurrency selector: maximum number of simultaneous downloads
+        ctk.CTkLabel(button_frame, text="Parallel:", font=("Arial", 12)).pack(side=tk.LEFT, padx=(10, 2))
+        self.concurrency_menu = ctk.CTkOptionMenu(
+            button_frame,
+            values=CONCURRENCY_CHOICES,
+            command=self.set_max_concurrency,
+            width=70
+        )
+        self.concurrency_menu.set(str(self.scheduler.max_workers))
+        self.concurrency_menu.pack(side=tk.LEFT, padx=2)
+
+        # Conversion selector: maximum number of simultaneous MP3 conversions
+        if self.transcode_pool is not None:
+            ctk.CTkLabel(button_frame, text="Convert:", font=("Arial", 12)).pack(side=tk.LEFT, padx=(10, 2))
+            self.transcode_menu = ctk.CTkOptionMenu(
+                button_frame,
+                values=TRANSCODE_CHOICES,
+                command=lambda value: self.transcode_pool.set_max_workers(int(value)),
+                width=70
+            )
+            self.transcode_menu.set(str(DEFAULT_TRANSCODE_WORKERS))
+            self.transcode_menu.pack(side=tk.LEFT, padx=2)
+
+        # Bandwidth selector: total rate shared by all active downloads
+        ctk.CTkLabel(button_frame, text="Limit:", font=("Arial", 12)).pack(side=tk.LEFT, padx=(10, 2))
+        self.bandwidth_menu = ctk.CTkOptionMenu(
+            button_frame,
+            values=BANDWIDTH_CHOICES,
+            command=self.set_bandwidth_limit,
+            width=100
+        )
+        self.bandwidth_menu.set(BANDWIDTH_CHOICES[0])
+        self.bandwidth_menu.pack(side=tk.LEFT, padx=2)
+
+        # Fragment selector: parallel fragments per video, or per-host auto-tuning
+        ctk.CTkLabel(button_frame, text="Fragments:", font=("Arial", 12)).pack(side=tk.LEFT, padx=(10, 2))
+        self.fragments_menu = ctk.CTkOptionMenu(
+            button_frame,
+            values=FRAGMENT_CHOICES if self.fragment_tuner or self.daemon else [c for c in FRAGMENT_CHOICES if c != "Auto"],
+            command=self.set_fragment_policy,
+            width=90
+        )
+        self.fragments_menu.set(FRAGMENT_CHOICES[0])
+        self.fragments_menu.pack(side=tk.LEFT, padx=2)
+
+        # Queue Status Label: active/queued counts and aggregate throughput
+        self.queue_status_label = ctk.CTkLabel(self, text="", font=("Arial", 10), text_color="gray")
+        self.queue_status_label.pack()
+
         # Footer: Copyright information
         self.footer_label = ctk.CTkLabel(self, text="Nuwan Kaushalya © 2025", text_color="gray")
         self.footer_label.pack(side=tk.BOTTOM, pady=5)
@@ -111,6 +376,160 @@ class YouTubeDownloaderApp(ctk.CTk):
             self.download_path = selected_path
             self.path_label.configure(text=f"Save to: {self.download_path}")
 
+    def set_max_concurrency(self, value):
+        """Applies a new limit on simultaneous downloads."""
+        try:
+            self.scheduler.set_max_workers(int(value))
+        except DaemonError as e:
+            self.report_daemon_error(e)
+            self.concurrency_menu.set(str(self.scheduler.max_workers))
+
+    def set_bandwidth_limit(self, value):
+        """Applies a new total rate limit; running downloads are rebalanced right away."""
+        self.bandwidth_budget.set_total_rate(parse_rate(value))
+        if self.daemon is not None:
+            try:
+                self.daemon.configure(limit_rate=parse_rate(value))
+            except DaemonError as e:
+                self.report_daemon_error(e)
+
+    def report_daemon_error(self, error):
+        """Shows a failed download daemon request in the status line. Runs on the Tk thread."""
+        self.status_label.configure(text=f"Download daemon request failed: {error}")
+
+    def set_format_plan(self, value):
+        """Selects how formats are chosen and plans the loaded playlist accordingly."""
+        self.format_setting = FORMAT_PLAN_CHOICES[value]
+        self.format_plan = None
+        self.plan_generation += 1
+        if self.format_setting is None:
+            self.prefetcher.cancel()
+            return
+        self.start_prefetch()
+
+    def start_prefetch(self):
+        """Fetches the metadata of the listed videos in the background, then plans their formats."""
+        if self.format_setting is None or self.prefetcher is None or not self.video_info_list:
+            return
+        # Archived rows are neither downloaded by "Download All" nor counted against the budget
+        entries = [video_info for video_info in self.video_info_list if not self.is_archived(video_info['url'])]
+        generation = self.plan_generation
+        self.status_label.configure(text=f"Fetching metadata for {len(entries)} videos...")
+        future = self.prefetcher.prefetch(entries)
+        future.add_done_callback(lambda future: self.call_on_ui(self.apply_format_plan, generation, future.result()))
+
+    def on_metadata(self, entry, metadata, error):
+        """Shows a video's size and duration once its metadata is in. Runs on a prefetch thread."""
+        if metadata is not None:
+            self.call_on_ui(self.show_metadata, entry['url'], metadata)
+
+    def show_metadata(self, video_url, metadata, choice=None):
+        """Sets an idle row's status to its planned format, size and duration."""
+        state = self.video_list.get(video_url)
+        if state is None or state['status'] not in ("", self.metadata_statuses.get(video_url)):
+            return # Queued, downloading or finished rows keep their status
+        if choice is None and self.format_setting is not None:
+            choice = choose_format(metadata, self.format_setting[0])
+        status = describe_choice(metadata, choice)
+        self.metadata_statuses[video_url] = status
+        self.update_video_state(video_url, status=status)
+
+    def apply_format_plan(self, generation, metadata_by_url):
+        """Plans the formats of the listed videos once their metadata is in."""
+        if generation != self.plan_generation or self.format_setting is None:
+            return # The setting or the playlist changed meanwhile
+        known = {url: metadata for url, metadata in metadata_by_url.items() if metadata is not None}
+        max_height, size_budget = self.format_setting
+        self.format_plan = plan = plan_formats(known, max_height, size_budget)
+        for video_url, metadata in known.items():
+            if video_url in plan.over_budget:
+                self.metadata_statuses[video_url] = "Over size budget"
+                self.update_video_state(video_url, status="Over size budget")
+            else:
+                self.show_metadata(video_url, metadata, plan.choices.get(video_url))
+        self.status_label.configure(text=describe_plan(plan, len(metadata_by_url)) + ".")
+
+    def download_format(self, video_url, audio_only):
+        """Returns the -f expression a row is downloaded with (None: yt-dlp's default)."""
+        if audio_only or self.format_setting is None:
+            return None
+        return planned_format(self.format_plan, video_url, self.format_setting[0])
+
+    def download_size(self, video_url, audio_only):
+        """Returns the planned size of a row's download in bytes (None if unknown)."""
+        if audio_only or self.format_setting is None:
+            return None
+        return planned_size(self.format_plan, video_url)
+
+    def output_template_for(self, video_url):
+        """Returns a row's output template: its fixed one (resumed and synced jobs), else one in the save folder."""
+        return self.output_templates.get(video_url) or os.path.join(self.download_path, "%(title)s.%(ext)s")
+
+    def staged_template_for(self, video_url, output_template):
+        """Returns the template a row is downloaded with inside the staging area, or None without staging."""
+        if self.staging is None:
+            return None
+        state = self.video_list.get(video_url)
+        video_id = state['video_id'] if state else video_id_of({'url': video_url})
+        return self.staging.template_for(output_template, video_id, bool(state and state['audio_only']))
+
+    def admit_download(self, video_url):
+        """Scheduler admission: reserves the row's estimated size on the save (and staging) volume. Runs under the scheduler lock."""
+        output_template = self.output_template_for(video_url)
+        state = self.video_list.get(video_url)
+        size = self.download_size(video_url, bool(state and state['audio_only']))
+        directories = space_directories(output_template, self.staged_template_for(video_url, output_template))
+        return self.space_guard.reserve(video_url, directories, size)
+
+    def schedule_filter(self, event=None):
+        """Applies the filter box once typing pauses."""
+        if self.filter_job is not None:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(FILTER_DELAY_MS, self.apply_filter)
+
+    def apply_filter(self, keep_position=False):
+        """Shows only the rows whose titles match the filter box; "Download All" then queues only those.
+
+        keep_position keeps the list scrolled where it is, for reapplying the
+        filter to rows that were loaded or refreshed since.
+        """
+        self.filter_job = None
+        query = self.filter_entry.get().strip()
+        if not query:
+            self.filter_matches = None
+            self.video_list.set_filter(None, keep_position)
+            self.filter_label.configure(text="")
+            self.download_all_button.configure(text="Download All")
+            return
+        try:
+            positions = self.title_index.search(query)
+        except ValueError as e:
+            self.filter_label.configure(text=str(e))
+            return
+        self.filter_matches = {self.video_info_list[position]['url'] for position in positions}
+        self.video_list.set_filter(self.filter_matches, keep_position)
+        self.filter_label.configure(text=f"{len(positions)} of {len(self.video_info_list)} match")
+        self.download_all_button.configure(text="Download Matches")
+
+    def reindex_titles(self):
+        """Rebuilds the title index after self.video_info_list was replaced, and reapplies the filter."""
+        self.title_index = TitleIndex(self.video_info_list)
+        self.apply_filter(keep_position=True)
+
+    def set_fragment_policy(self, value):
+        """Chooses how many fragments downloads started from now on fetch in parallel (in the daemon too)."""
+        if value == "Auto":
+            self.fragment_policy = self.fragment_tuner
+        elif value == "Default":
+            self.fragment_policy = None
+        else:
+            self.fragment_policy = FixedFragments(int(value))
+        if self.daemon is not None:
+            try:
+                self.daemon.configure(fragments={"Auto": "auto", "Default": None}.get(value, value))
+            except DaemonError as e:
+                self.report_daemon_error(e)
+
     def create_context_menu(self):
         """Creates and binds the right-click context menu for the URL entry."""
         self.context_menu = tk.Menu(self, tearoff=0)
@@ -139,7 +558,7 @@ class YouTubeDownloaderApp(ctk.CTk):
             pass
 
     def start_fetch_thread(self):
-        """Initiates fetching playlist titles in a separate thread."""
+        """Starts fetching playlist titles through the engine, without blocking the Tk loop."""
         if self.is_fetching:
             return
         
@@ -149,259 +568,609 @@ class YouTubeDownloaderApp(ctk.CTk):
             return
 
         self.is_fetching = True
+        self.auto_queue_new_rows = False
         self.load_button.configure(state=tk.DISABLED)
         self.status_label.configure(text="Fetching playlist titles...")
         
-        # Clear previous video widgets from the display frame
-        for widget in self.video_list_frame.winfo_children():
-            widget.destroy()
+        # Clear the previous playlist from the list
+        self.video_list.clear()
+        self.title_index = TitleIndex()
+        self.format_plan = None
+        self.plan_generation += 1
+        self.metadata_statuses.clear()
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+
+        # Show cached entries right away; the fetch below then only merges the differences
+        cached = self.playlist_cache.get(url) if self.playlist_cache else None
+        if cached:
+            self.video_info_list = cached[0]
+            self.display_videos()
+            self.status_label.configure(text=f"Showing {len(self.video_info_list)} cached videos. Refreshing...")
+            self.start_prefetch()
+            entry_queue = None
+        else:
+            # Stream entries onto the screen as yt-dlp reports them
+            self.video_info_list = []
+            self.entry_queue = entry_queue = queue.Queue()
+            self.after(ENTRY_DRAIN_INTERVAL_MS, self.drain_entry_queue)
+
+        self.fetch_playlist_titles(url, entry_queue)
+
+    def fetch_playlist_titles(self, url, entry_queue=None):
+        """Fetches video titles and URLs from a playlist using the download engine.
 
-        fetch_thread = threading.Thread(target=self.fetch_playlist_titles, args=(url,))
-        fetch_thread.start()
+        The engine runs the fetch in the background and on_fetch_done() handles the
+        result. With an entry_queue, every entry is pushed to it as soon as it is
+        parsed and FETCH_DONE follows the last one. Without one, the result is
+        merged into the (cached) list already on screen.
+        """
+        started_at = time.monotonic()
+        future = self.engine.submit_fetch(url, on_entry=entry_queue.put if entry_queue else None)
+        future.add_done_callback(
+            lambda future: self.fetch_results.submit(self.on_fetch_done, future, url, entry_queue, started_at))
 
-    def fetch_playlist_titles(self, url):
-        """Fetches video titles and URLs from a playlist using yt-dlp."""
+    def on_fetch_done(self, future, url, entry_queue, started_at):
+        """Records a finished playlist fetch. Runs on the fetch_results thread; Tk work goes through call_on_ui()."""
         try:
-            command = ["yt-dlp", "--flat-playlist", "-j", url]
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                universal_newlines=True
-            )
+            video_info_list = future.result()
+            self.metrics.playlist_fetched(time.monotonic() - started_at, len(video_info_list), success=bool(video_info_list))
+            if video_info_list and self.playlist_cache:
+                self.playlist_cache.put(url, video_info_list)
 
-            self.video_info_list = []
-            for line in iter(process.stdout.readline, ''):
-                if line.strip():
-                    try:
-                        video_json = json.loads(line)
-                        self.video_info_list.append({
-                            'title': video_json['title'],
-                            'url': video_json['url']
-                        })
-                    except json.JSONDecodeError:
-                        # Ignore lines that are not valid JSON (e.g., yt-dlp warnings)
-                        pass
-            process.wait()
-
-            # Schedule display_videos to run on the main Tkinter thread
-            self.after(0, self.display_videos)
+            if entry_queue is None:
+                self.call_on_ui(self.merge_refreshed_videos, video_info_list)
 
         except Exception as e:
-            # Schedule error message to run on the main Tkinter thread
-            self.after(0, lambda error_msg=e: messagebox.showerror("Error", f"Failed to fetch playlist: {error_msg}"))
+            self.metrics.playlist_fetched(time.monotonic() - started_at, 0, success=False)
+            if entry_queue is None: # The cached list on screen stays usable
+                self.call_on_ui(self.merge_refreshed_videos, None, str(e))
+            else:
+                self.call_on_ui(messagebox.showerror, "Error", f"Failed to fetch playlist: {e}")
         finally:
-            self.is_fetching = False
-            self.load_button.configure(state=tk.NORMAL)
+            if entry_queue is not None:
+                entry_queue.put(FETCH_DONE)
+            self.call_on_ui(self.end_fetch)
+
+    def end_fetch(self):
+        """Re-enables loading and syncing once a fetch or sync has finished."""
+        self.is_fetching = False
+        self.load_button.configure(state=tk.NORMAL)
+        self.sync_button.configure(state=tk.NORMAL)
+
+    def call_on_ui(self, callback, *args):
+        """Runs callback(*args) on the Tk thread at the next refresh tick. Safe to call from any thread."""
+        self.ui_calls.put((callback, args))
+
+    def run_ui_calls(self):
+        while True:
+            try:
+                callback, args = self.ui_calls.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
+
+    def start_sync_thread(self):
+        """Mirrors the playlist in the URL entry into the download folder: only missing videos are queued."""
+        if self.is_fetching:
+            return
+
+        url = self.url_entry.get()
+        if not url:
+            messagebox.showerror("Error", "Please enter a URL.")
+            return
+
+        self.is_fetching = True
+        self.auto_queue_new_rows = False
+        self.load_button.configure(state=tk.DISABLED)
+        self.sync_button.configure(state=tk.DISABLED)
+        self.status_label.configure(text=f"Syncing with {self.download_path}: fetching playlist...")
+        self.video_list.clear()
+
+        sync_thread = threading.Thread(target=self.sync_playlist, args=(url, self.download_path))
+        sync_thread.start()
+
+    def sync_playlist(self, url, directory):
+        """Fetches a playlist and diffs it against the folder index. Runs on a worker thread."""
+        started_at = time.monotonic()
+        try:
+            # One flat playlist fetch; what is on disk comes from a single directory listing
+            video_info_list = self.engine.fetch_playlist(url)
+            self.metrics.playlist_fetched(time.monotonic() - started_at, len(video_info_list), success=bool(video_info_list))
+            if video_info_list and self.playlist_cache:
+                self.playlist_cache.put(url, video_info_list)
+            folder_index = index_folder(directory, self.download_archive)
+            manifest = SyncManifest(directory)
+            plan = plan_sync(video_info_list, folder_index)
+            if video_info_list:
+                manifest.update(url, video_info_list)
+            orphans = manifest.orphans(folder_index)
+            self.call_on_ui(self.apply_sync, directory, video_info_list, plan, manifest, folder_index, orphans)
+
+        except Exception as e:
+            self.call_on_ui(messagebox.showerror, "Error", f"Failed to sync playlist: {e}")
+        finally:
+            self.call_on_ui(self.end_fetch)
+
+    def apply_sync(self, directory, video_info_list, plan, manifest, folder_index, orphans):
+        """Shows a sync result, offers to move files of videos that left the playlist and queues the new ones."""
+        self.video_info_list = video_info_list
+        self.display_videos()
+        if not video_info_list:
+            return
+        for video_info in plan.present:
+            self.update_video_state(video_info['url'], status="In folder", progress=1.0)
+
+        kept = orphans
+        if orphans and messagebox.askyesno(
+            "Videos left the playlist",
+            f"{len(orphans)} video(s) in {directory} are no longer in any synced playlist.\n\n"
+            f"Move their files to '{REMOVED_DIR_NAME}'? Choose No to keep them where they are."
+        ):
+            paths = [path for video_id in orphans for path in folder_index[video_id]]
+            failed_paths = {path for path, error in prune(paths, directory, PRUNE_MOVE) if error}
+            kept = [video_id for video_id in orphans if failed_paths.intersection(folder_index[video_id])]
+        manifest.set_flagged(kept) # Kept files are pointed out again by the next sync
+        try:
+            manifest.save()
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save the sync manifest: {e}")
+
+        # New entries are saved with their ID in the name, so the next sync recognizes them
+        for video_info in plan.new:
+            self.output_templates[video_info['url']] = os.path.join(directory, SYNC_OUTPUT_TEMPLATE)
+            self.start_single_download(video_info['url'], priority=PRIORITY_NORMAL)
+        self.status_label.configure(
+            text=f"Synced {len(video_info_list)} videos: {len(plan.present)} in folder, {len(plan.new)} new queued"
+                 + (f", {len(orphans)} no longer in the playlist." if orphans else ".")
+        )
+
+    def drain_entry_queue(self):
+        """Adds streamed entries to the list in small batches so the UI stays responsive."""
+        finished = False
+        batch = []
+        while len(batch) < ENTRY_BATCH_SIZE:
+            try:
+                video_info = self.entry_queue.get_nowait()
+            except queue.Empty:
+                break
+            if video_info is FETCH_DONE:
+                finished = True
+                break
+            batch.append(video_info)
+
+        if batch:
+            self.video_info_list.extend(batch)
+            self.title_index.add(batch)
+            self.video_list.extend(batch)
+            if self.filter_matches is not None:
+                self.apply_filter(keep_position=True) # Takes in the new rows; a query takes milliseconds
+            self.mark_archived_rows(batch)
+            if self.auto_queue_new_rows:
+                self.queue_rows(video_info['url'] for video_info in batch
+                                if self.filter_matches is None or video_info['url'] in self.filter_matches)
+
+        if finished:
+            if self.video_info_list:
+                self.status_label.configure(text=f"Found {len(self.video_info_list)} videos. Ready to download.")
+                self.start_prefetch()
+            else:
+                self.status_label.configure(text="No videos found in playlist.")
+                self.download_all_button.configure(state=tk.DISABLED)
+            return
+
+        if self.video_info_list:
+            self.status_label.configure(text=f"Loading playlist... {len(self.video_info_list)} entries loaded")
+        self.after(ENTRY_DRAIN_INTERVAL_MS, self.drain_entry_queue)
 
     def display_videos(self):
         """Displays fetched video titles with download options."""
         if self.video_info_list:
             self.status_label.configure(text=f"Found {len(self.video_info_list)} videos. Ready to download.")
             self.download_all_button.configure(state=tk.NORMAL)
-            
-            for video_info in self.video_info_list:
-                video_url = video_info['url']
-                
-                # Frame for each video row
-                row_frame = ctk.CTkFrame(self.video_list_frame, fg_color="transparent")
-                row_frame.pack(fill=tk.X, pady=2, padx=5)
-
-                # Video Title Label
-                ctk.CTkLabel(row_frame, text=video_info['title'], anchor="w", font=("Arial", 12)).pack(side=tk.LEFT, padx=5, expand=True)
-
-                # Status Label for individual video download
-                status_label = ctk.CTkLabel(row_frame, text="", fg_color="transparent", font=("Arial", 10))
-                status_label.pack(side=tk.LEFT, padx=5)
-                
-                # Progress Bar for individual video download
-                progress_bar = ctk.CTkProgressBar(row_frame, orientation="horizontal", width=150)
-                progress_bar.set(0)
-                progress_bar.pack(side=tk.LEFT, padx=5)
-
-                # Audio Only Checkbox for each video
-                audio_only_video_var = ctk.BooleanVar(value=False)
-                audio_only_checkbox = ctk.CTkCheckBox(
-                    row_frame,
-                    text="MP3", # Shorter text for individual checkbox
-                    variable=audio_only_video_var,
-                    font=("Arial", 9)
-                )
-                audio_only_checkbox.pack(side=tk.LEFT, padx=5)
-
-                # Download button for individual video
-                download_button = ctk.CTkButton(
-                    row_frame,
-                    text="Download",
-                    command=lambda url=video_url: self.start_single_download(url),
-                    font=("Arial", 12, "bold"),
-                    width=100
-                )
-                download_button.pack(side=tk.RIGHT, padx=5)
-
-                # Cancel button for individual video
-                cancel_button = ctk.CTkButton(
-                    row_frame,
-                    text="Cancel",
-                    command=lambda url=video_url: self.cancel_single_download(url),
-                    state=tk.DISABLED,
-                    fg_color="red",
-                    hover_color="#c70000",
-                    width=60,
-                    font=("Arial", 10, "bold")
-                )
-                cancel_button.pack(side=tk.RIGHT, padx=5)
-                
-                # Store references to widgets and their state variables
-                self.video_widgets[video_url] = {
-                    'status_label': status_label,
-                    'progress_bar': progress_bar,
-                    'download_button': download_button,
-                    'cancel_button': cancel_button,
-                    'audio_only_var': audio_only_video_var, # Store the BooleanVar
-                }
+            self.video_list.set_items(self.video_info_list)
+            self.mark_archived_rows(self.video_info_list)
         else:
             self.status_label.configure(text="No videos found in playlist.")
             self.download_all_button.configure(state=tk.DISABLED)
+        self.reindex_titles()
+
+    def merge_refreshed_videos(self, fresh_video_info_list, error=None):
+        """Applies a background refresh to the displayed (cached) list: adds new rows, drops removed ones."""
+        if not fresh_video_info_list:
+            # The refresh failed or returned nothing; keep showing the cached list
+            reason = f"refresh failed: {error}" if error else "refresh failed"
+            self.status_label.configure(text=f"Showing {len(self.video_info_list)} cached videos ({reason}).")
+            return
+
+        added, removed = diff_entries(self.video_info_list, fresh_video_info_list)
+        for video_info in removed:
+            video_url = video_info['url']
+            # Rows that are queued or downloading stay until they finish
+            if self.scheduler.is_queued(video_url) or self.scheduler.is_active(video_url):
+                continue
+            self.video_list.remove(video_url)
+        self.video_list.extend(added)
+        self.mark_archived_rows(added)
+
+        self.video_info_list = fresh_video_info_list
+        self.reindex_titles()
+        if self.auto_queue_new_rows: # "Download All" was clicked while the cached list was refreshing
+            self.queue_rows(video_info['url'] for video_info in added
+                            if self.filter_matches is None or video_info['url'] in self.filter_matches)
+        self.status_label.configure(
+            text=f"Found {len(self.video_info_list)} videos ({len(added)} new, {len(removed)} removed since cached). Ready to download."
+        )
+        if added or removed:
+            self.plan_generation += 1
+            self.start_prefetch() # Only the new videos are extracted; the plan covers the refreshed list
 
-    def start_single_download(self, video_url):
-        """Prepares and starts the download of a single video in a new thread."""
-        if video_url in self.download_processes: # Prevent double-clicking
+    def mark_archived_rows(self, video_info_list):
+        """Shows 'Already downloaded' on rows whose video is in the download archive."""
+        if self.download_archive is None:
+            return
+        for video_info in video_info_list:
+            video_id = video_id_of(video_info)
+            if self.download_archive.contains(video_id, VARIANT_VIDEO):
+                self.update_video_state(video_info['url'], status="Already downloaded", progress=1.0)
+            elif self.download_archive.contains(video_id, VARIANT_MP3):
+                self.update_video_state(video_info['url'], status="Already downloaded (MP3)", progress=1.0)
+
+    def is_archived(self, video_url):
+        """True if the row's video, in its currently selected variant, is in the download archive."""
+        state = self.video_list.get(video_url)
+        if self.download_archive is None or state is None:
+            return False
+        variant = VARIANT_MP3 if state['audio_only'] else VARIANT_VIDEO
+        return self.download_archive.contains(state['video_id'], variant)
+
+    def update_video_state(self, video_url, **changes):
+        """Updates a video's row state (status, progress, button states). Must run on the Tk thread."""
+        self.video_list.update(video_url, **changes)
+
+    def post_video_state(self, video_url, **changes):
+        """Records row changes from a worker thread; newer values overwrite older unapplied ones."""
+        with self.pending_row_lock:
+            self.pending_row_updates.setdefault(video_url, {}).update(changes)
+            self.ui_stats['updates_received'] += 1
+
+    def apply_pending_row_updates(self):
+        """Applies the coalesced worker changes on the Tk thread, one update per changed row."""
+        with self.pending_row_lock:
+            pending, self.pending_row_updates = self.pending_row_updates, {}
+        for video_url, changes in pending.items():
+            self.update_video_state(video_url, **changes)
+        self.ui_stats['rows_applied'] += len(pending)
+
+    def offer_resume(self):
+        """Asks whether to requeue the downloads the previous session did not finish."""
+        jobs = self.job_journal.resumable_jobs()
+        failed = sum(1 for job in jobs if job['event'] == JOB_FAILED)
+        resume = messagebox.askyesno(
+            "Resume downloads",
+            f"{len(jobs)} download(s) from the previous session did not finish ({failed} failed).\n\n"
+            "Resume them? Partially downloaded files are continued."
+        )
+        if not resume:
+            self.job_journal.discard()
+            return
+
+        self.video_info_list = [{'title': job.get('title') or job['url'], 'url': job['url'], 'id': job.get('id')} for job in jobs]
+        self.display_videos()
+        self.status_label.configure(text=f"Resuming {len(jobs)} downloads from the previous session.")
+        for job in jobs:
+            if job.get('output_template'):
+                self.output_templates[job['url']] = job['output_template']
+            self.update_video_state(job['url'], audio_only=bool(job.get('audio_only')))
+            self.start_single_download(job['url'], priority=PRIORITY_NORMAL)
+
+    def record_job(self, event, video_url, **fields):
+        """Appends a job event to the journal, if it is available."""
+        if self.job_journal is not None:
+            self.job_journal.record(event, video_url, **fields)
+
+    def start_single_download(self, video_url, priority=PRIORITY_HIGH):
+        """Queues a single video for download. Queued rows clicked again jump the queue."""
+        if self.is_converting(video_url): # Downloaded already, waiting for or in MP3 conversion
+            return
+        if self.scheduler.is_active(video_url): # Prevent double-clicking
+            # A row button on a running background download moves it to the foreground share
+            if priority == PRIORITY_HIGH:
+                self.bandwidth_budget.set_weight(video_url, FOREGROUND_WEIGHT)
+            return
+        try:
+            if self.scheduler.promote(video_url, priority):
+                self.download_priorities[video_url] = min(priority, self.download_priorities.get(video_url, priority))
+                self.update_video_state(video_url, status="Queued (next)")
+                return
+            queued = self.scheduler.submit(video_url, priority)
+        except DaemonError as e: # The row keeps its state
+            self.report_daemon_error(e)
             return
         
         # Disable global download all and enable global cancel all
         self.download_all_button.configure(state=tk.DISABLED)
         self.cancel_all_button.configure(state=tk.NORMAL)
         
-        widgets = self.video_widgets[video_url]
-        widgets['download_button'].configure(state=tk.DISABLED)
-        widgets['cancel_button'].configure(state=tk.NORMAL) # Enable cancel button
-        widgets['status_label'].configure(text="Starting...")
+        # Enable cancel button; the download button stays enabled while queued so the row can be moved to the front
+        self.update_video_state(video_url, status="Queued", progress=0.0, cancel_enabled=True)
 
-        download_thread = threading.Thread(target=self.run_download, args=(video_url,))
-        download_thread.start()
+        if queued:
+            self.download_priorities[video_url] = priority
+            state = self.video_list.get(video_url)
+            if state is not None:
+                self.record_job(JOB_QUEUED, video_url, title=state['title'], id=state['video_id'],
+                                audio_only=state['audio_only'])
 
     def run_download(self, video_url):
-        """Executes the yt-dlp command for a single video."""
-        widgets = self.video_widgets[video_url]
-        full_output = [] # To store all lines from yt-dlp for final analysis
+        """Downloads a single video through the engine. Runs on a scheduler worker thread."""
+        state = self.video_list.get(video_url)
+        audio_only = bool(state and state['audio_only']) # Check if audio-only is selected for THIS video
+        video_id = state['video_id'] if state else video_id_of({'url': video_url})
+        priority = self.download_priorities.pop(video_url, PRIORITY_NORMAL)
+        update = lambda **changes: self.post_video_state(video_url, **changes)
+        update(status="Starting...", download_enabled=False)
+        shortfall = self.space_guard.shortfall(video_url) # Admitted although it cannot fit; fails without downloading
+        fragment_policy = self.fragment_policy
+        session = fragment_policy.begin(video_url) if fragment_policy is not None and not shortfall else None
+        result = None
+        handed_off = False # Set once the file is queued for MP3 conversion
+        retrying = False   # Set when the job goes back to the queue for another attempt
+        started_at = time.monotonic()
+        download_metrics = self.metrics.begin_download(video_url, self.scheduler.queue_wait(video_url))
+
+        def on_progress(event):
+            if session is not None:
+                session.feed_progress(event)
+            download_metrics.feed_progress(event)
+            if event.speed:
+                self.download_speeds[video_url] = event.speed
+            update(progress=event.percent / 100.0, status=format_progress_line(event))
+
+        def on_output(line):
+            if session is not None:
+                session.feed_line(line)
+            update(status=line)
         
         try:
-            # Base command arguments
-            command = ["yt-dlp", "--progress"]
-            
-            # Add output template with selected path
-            output_template = os.path.join(self.download_path, "%(title)s.%(ext)s")
-            command.extend(["-o", output_template])
+            # Add output template with selected path (resumed jobs keep their original one, also across retries)
+            output_template = self.output_template_for(video_url)
+            staged_template = self.staged_template_for(video_url, output_template)
+            self.record_job(JOB_STARTED, video_url, output_template=output_template, audio_only=audio_only)
 
-            # Check if audio-only is selected for THIS video
-            if widgets['audio_only_var'].get():
-                command.extend(["--extract-audio", "--audio-format", "mp3", "--no-playlist"])
-            
-            command.append(video_url) # Add the video URL last
-
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT, # Merge stdout and stderr for simpler parsing
-                text=True,
-                bufsize=1, # Line-buffered output
-                universal_newlines=True
-            )
-            self.download_processes[video_url] = process
-            
-            # Read output in a loop to update progress
-            progress_regex = re.compile(r'\[download\]\s+(\d+\.\d+)%')
-            
-            while True:
-                line = process.stdout.readline()
-                if not line: # No more output
-                    break
-                
-                full_output.append(line) # Store every line
-
-                # Check if process terminated early (e.g., cancelled)
-                if process.poll() is not None and not line.strip(): 
-                    break # Exit if process is done and no more output
-
-                match = progress_regex.search(line)
-                if match:
-                    try:
-                        percentage = float(match.group(1)) / 100.0
-                        self.after(0, lambda p=percentage: widgets['progress_bar'].set(p))
-                        self.after(0, lambda l=line.strip(): widgets['status_label'].configure(text=l))
-                    except (ValueError, IndexError):
-                        self.after(0, lambda l=line.strip(): widgets['status_label'].configure(text=l))
+            handle = DownloadHandle()
+            handle.concurrent_fragments = session.fragments if session is not None else None
+            self.download_processes[video_url] = handle
+            self.bandwidth_budget.add(video_url, handle, FOREGROUND_WEIGHT if priority == PRIORITY_HIGH else BACKGROUND_WEIGHT)
+            transcode = audio_only and self.transcode_pool is not None
+            # Prefetched info skips the extraction; it is used for one attempt, so a retry extracts again
+            info_file = self.prefetcher.take_info_file(video_url) if self.prefetcher is not None else None
+            try:
+                if shortfall:
+                    result = {'success': False, 'cancelled': False, 'returncode': None, 'error': shortfall,
+                              'filename': None}
                 else:
-                    self.after(0, lambda l=line.strip(): widgets['status_label'].configure(text=l))
-            
-            process.wait() # Wait for the subprocess to truly complete
+                    result = self.engine.download(
+                        video_url,
+                        handle=handle,
+                        output_template=staged_template or output_template,
+                        audio_only=audio_only,
+                        on_progress=on_progress,
+                        on_output=on_output,
+                        extract_audio=not transcode,
+                        format_selector=self.download_format(video_url, audio_only),
+                        info_file=info_file
+                    )
+            finally:
+                if info_file:
+                    discard_info_file(info_file)
+            if staged_template and not transcode:
+                result = self.staging.finalize(result, staged_template, output_template)
+            download_metrics.finish(result)
 
-            # --- FINAL STATUS DETERMINATION ---
-            is_success = False
-            combined_output_str = "".join(full_output)
+            if result['success'] and transcode:
+                # Hand the audio file to the conversion stage and free this download slot
+                if staged_template:
+                    self.staged_templates[video_url] = (staged_template, output_template) # Moved once converted
+                if result.get('filename') and self.transcode_pool.submit(video_url, result['filename']):
+                    handed_off = True
+                    self.retry_manager.record_attempt(video_url, result, time.monotonic() - started_at)
+                    update(status="Queued for MP3 conversion", progress=1.0, cancel_enabled=True)
+                    return
+                self.staged_templates.pop(video_url, None)
+                result = dict(result, success=False, error="The downloaded audio file could not be found for conversion.")
 
-            if process.returncode == 0:
-                is_success = True
-            else:
-                # Even if returncode is non-zero, check for success indicators in output
-                # This handles cases where yt-dlp exits with warnings but completes successfully
-                if (re.search(r'\[download\] 100%', combined_output_str) or # Explicit 100% download
-                    re.search(r'\[ExtractAudio\] Destination:', combined_output_str) or # Audio extracted
-                    re.search(r'\[ffmpeg\] Destination:', combined_output_str) or     # ffmpeg conversion/merge
-                    re.search(r'\[Merger\] Merging formats into', combined_output_str)): # Video/audio merged
-                    is_success = True
-            
-            # Update UI on the main thread based on final determination
-            if is_success:
-                self.after(0, lambda: widgets['status_label'].configure(text="Download Completed!"))
-                self.after(0, lambda: widgets['progress_bar'].set(1.0)) # Ensure 100%
-            else:
-                error_message = combined_output_str.strip()
-                if not error_message: # Fallback if output is empty
-                    error_message = f"Unknown error (Exit Code: {process.returncode})"
-                self.after(0, lambda e_msg=error_message: widgets['status_label'].configure(text=f"Download Failed! {e_msg}"))
-                self.after(0, lambda: widgets['progress_bar'].set(0)) # Reset or show failed state
+            decision = self.retry_manager.record_attempt(video_url, result, time.monotonic() - started_at)
+            if decision.retry_in is not None:
+                retrying = True
+                self.metrics.retry_scheduled(decision.category)
+                self.download_priorities[video_url] = priority
+                self.record_job(JOB_RETRYING, video_url, attempt=decision.attempt, category=decision.category,
+                                error=result['error'], retry_in=round(decision.retry_in, 1))
+                # Clicking Download while waiting retries right away
+                update(status=f"Attempt {decision.attempt} failed ({decision.category}), retrying in {format_eta(decision.retry_in)}",
+                       progress=0.0, download_enabled=True, cancel_enabled=True)
+                return RetryAfter(decision.retry_in)
+
+            label = f"Download Failed ({decision.category}, attempt {decision.attempt})!" if decision.category else "Download Failed!"
+            self.finish_download(video_url, video_id, audio_only, result, failure_label=label)
 
         except Exception as e:
-            self.after(0, lambda error_msg=e: widgets['status_label'].configure(text=f"Error: {error_msg}"))
+            self.record_job(JOB_FAILED, video_url, error=str(e))
+            if result is None: # The engine itself raised
+                download_metrics.finish({'success': False, 'error': str(e)})
+            update(status=f"Error: {e}")
         finally:
             # Cleanup and reset UI for this specific video
             if video_url in self.download_processes:
                 del self.download_processes[video_url]
+            self.download_speeds.pop(video_url, None)
+            self.bandwidth_budget.remove(video_url) # Hands its share to the remaining downloads
+            if session is not None:
+                fragment_policy.end(session, failed=result is None or not (result['success'] or result['cancelled']))
+            if not handed_off: # A conversion keeps the space until it is done
+                self.space_guard.release(video_url, result['filename'] if result and result['success'] else None)
             
-            self.after(0, lambda: widgets['download_button'].configure(state=tk.NORMAL))
-            self.after(0, lambda: widgets['cancel_button'].configure(state=tk.DISABLED))
-            
-            # Check if all downloads are complete to re-enable global download_all
-            self.after(0, self._check_global_buttons_state)
+            # Global buttons are re-evaluated by the next monitor tick
+            if not handed_off and not retrying:
+                update(download_enabled=True, cancel_enabled=False)
+
+    def describe_job(self, video_url):
+        """Returns the job the download daemon gets for a row: URL, title, output template, MP3 flag and format."""
+        state = self.video_list.get(video_url)
+        audio_only = bool(state and state['audio_only'])
+        output_template = (self.output_templates.pop(video_url, None)
+                           or os.path.join(self.download_path, "%(title)s.%(ext)s"))
+        # The daemon deletes the info file once the first attempt is over
+        info_file = self.prefetcher.take_info_file(video_url) if self.prefetcher is not None else None
+        return {'url': video_url, 'title': state['title'] if state else video_url,
+                'id': state['video_id'] if state else None, 'audio_only': audio_only,
+                'output_template': output_template, 'format': self.download_format(video_url, audio_only),
+                'size': self.download_size(video_url, audio_only), 'info_file': info_file}
+
+    def on_daemon_record(self, record):
+        """Shows a download daemon record on its row. Runs on the daemon watch thread."""
+        record_type = record['type']
+        video_url = record.get('video')
+        update = lambda **changes: self.post_video_state(video_url, **changes)
+        if record_type == 'start':
+            update(status="Starting...", progress=0.0, download_enabled=False, cancel_enabled=True)
+        elif record_type == 'progress':
+            event = progress_event_of(record)
+            if event.speed:
+                self.download_speeds[video_url] = event.speed
+            update(progress=event.percent / 100.0, status=format_progress_line(event))
+        elif record_type == 'retry':
+            self.download_speeds.pop(video_url, None)
+            update(status=f"Attempt {record['attempt']} failed ({record['category']}), retrying in {format_eta(record['retry_in'])}",
+                   progress=0.0, download_enabled=True, cancel_enabled=True)
+        elif record_type == 'result':
+            self.download_speeds.pop(video_url, None)
+            if record['success']:
+                update(status="Download Completed!", progress=1.0)
+            elif record['cancelled']:
+                update(status="Cancelled", progress=0.0)
+            else:
+                label = (f"Download Failed ({record['category']}, attempt {record['attempts']})!" if record['category']
+                         else "Download Failed!")
+                update(status=f"{label} {record['error']}", progress=0.0)
+            update(download_enabled=True, cancel_enabled=False)
+        elif record_type == 'disconnected':
+            self.call_on_ui(messagebox.showerror, "Error",
+                            "Lost the connection to the download daemon. Restart the app to reconnect.")
+
+    def finish_download(self, video_url, video_id, audio_only, result, failure_label="Download Failed!"):
+        """Records a job's outcome in the archive and journal and shows it on its row. Thread-safe."""
+        update = lambda **changes: self.post_video_state(video_url, **changes)
+        self.output_templates.pop(video_url, None)
+        if result['success']:
+            if self.download_archive is not None:
+                variant = VARIANT_MP3 if audio_only else VARIANT_VIDEO
+                self.download_archive.add(video_id, variant, result.get('filename'))
+            self.record_job(JOB_COMPLETED, video_url, filename=result.get('filename'))
+            update(status="Download Completed!", progress=1.0) # Ensure 100%
+        elif result['cancelled']:
+            self.record_job(JOB_CANCELLED, video_url)
+            update(status="Cancelled", progress=0.0)
+        else:
+            self.record_job(JOB_FAILED, video_url, error=result['error'])
+            update(status=f"{failure_label} {result['error']}", progress=0.0) # Reset or show failed state
 
+    def on_transcode_done(self, video_url, result):
+        """Completes an MP3 row once its conversion has finished. Runs on a transcode pool thread."""
+        staged = self.staged_templates.pop(video_url, None)
+        if staged is not None:
+            result = self.staging.finalize(result, *staged)
+        self.space_guard.release(video_url, result['filename'] if result['success'] else None)
+        state = self.video_list.get(video_url)
+        video_id = state['video_id'] if state else video_id_of({'url': video_url})
+        self.finish_download(video_url, video_id, True, result, failure_label="MP3 Conversion Failed!")
+        self.post_video_state(video_url, download_enabled=True, cancel_enabled=False)
+
+    def is_converting(self, video_url):
+        return self.transcode_pool is not None and self.transcode_pool.is_busy(video_url)
 
     def download_all(self):
-        """Starts downloading all videos in the loaded playlist."""
+        """Starts downloading all videos in the loaded playlist (only the matching ones while filtered)."""
         self.download_all_button.configure(state=tk.DISABLED)
         self.cancel_all_button.configure(state=tk.NORMAL)
+
+        # Entries still streaming in get queued as they arrive
+        self.auto_queue_new_rows = self.is_fetching
         
-        for video_info in self.video_info_list:
-            video_url = video_info['url']
-            # Only start if not already downloading
-            if video_url not in self.download_processes:
-                self.start_single_download(video_url)
+        self.queue_rows(video_info['url'] for video_info in self.video_info_list
+                        if self.filter_matches is None or video_info['url'] in self.filter_matches)
+
+    def queue_rows(self, video_urls):
+        """Queues rows for "Download All" unless they are queued, downloading, already archived or over the size budget.
+
+        With the daemon they are submitted in one request instead of one round-trip per row.
+        """
+        # Row buttons bypass this check, so a single archived video can still be fetched again on request
+        video_urls = [video_url for video_url in video_urls if not (
+            self.scheduler.is_queued(video_url) or self.scheduler.is_active(video_url)
+            or self.is_converting(video_url) or self.is_archived(video_url)
+            or (self.format_plan is not None and video_url in self.format_plan.over_budget))]
+        if self.daemon is None:
+            for video_url in video_urls:
+                self.start_single_download(video_url, priority=PRIORITY_NORMAL)
+            return
+        if not video_urls:
+            return
+        try:
+            queued = self.daemon.submit_many(video_urls, PRIORITY_NORMAL)
+        except DaemonError as e: # The rows keep their state
+            self.report_daemon_error(e)
+            return
+        self.download_all_button.configure(state=tk.DISABLED)
+        self.cancel_all_button.configure(state=tk.NORMAL)
+        for video_url in video_urls:
+            self.update_video_state(video_url, status="Queued", progress=0.0, cancel_enabled=True)
+        for video_url in queued:
+            self.download_priorities[video_url] = PRIORITY_NORMAL
+
+    def _reset_queued_row(self, video_url):
+        """Returns a row that was removed from the queue to its idle state."""
+        self.record_job(JOB_CANCELLED, video_url)
+        self.download_priorities.pop(video_url, None)
+        self.output_templates.pop(video_url, None)
+        self.update_video_state(video_url, status="Cancelled", progress=0.0, download_enabled=True, cancel_enabled=False)
 
     def cancel_single_download(self, video_url):
-        """Terminates the subprocess for a specific video download."""
-        if video_url in self.download_processes:
+        """Removes a queued video or terminates the subprocess for an active download."""
+        try:
+            dequeued = self.scheduler.cancel(video_url)
+        except DaemonError as e:
+            self.report_daemon_error(e)
+            return
+        if dequeued:
+            self._reset_queued_row(video_url)
+        elif video_url in self.download_processes:
             process = self.download_processes[video_url]
             process.terminate() # Send termination signal
             # The run_download's finally block will handle cleanup and UI reset
-            widgets = self.video_widgets[video_url]
-            self.after(0, lambda: widgets['status_label'].configure(text="Cancelling...")) # Immediate feedback
-            self.after(0, lambda: widgets['progress_bar'].set(0)) # Reset progress bar immediately
+            self.update_video_state(video_url, status="Cancelling...", progress=0.0) # Immediate feedback
+        elif self.daemon is not None and self.daemon.is_active(video_url):
+            # scheduler.cancel() above already asked the daemon to stop it; its 'result' record resets the row
+            self.update_video_state(video_url, status="Cancelling...", progress=0.0)
+        elif self.transcode_pool is not None and self.transcode_pool.cancel(video_url):
+            # A running conversion reports back through on_transcode_done
+            self.update_video_state(video_url, status="Cancelling...")
 
     def cancel_all(self):
         """Terminates all active download subprocesses."""
         self.status_label.configure(text="Cancelling all downloads...")
+
+        # Drop everything still waiting in the queue first so no new downloads start
+        try:
+            dequeued = self.scheduler.clear()
+        except DaemonError as e:
+            self.report_daemon_error(e)
+            dequeued = []
+        for video_url in dequeued:
+            self._reset_queued_row(video_url)
+        if self.transcode_pool is not None:
+            self.transcode_pool.cancel_all()
         
         # Create a list of keys to avoid RuntimeError: dictionary changed size during iteration
         keys_to_terminate = list(self.download_processes.keys())
@@ -409,26 +1178,56 @@ class YouTubeDownloaderApp(ctk.CTk):
             process = self.download_processes[video_url]
             process.terminate()
             # The run_download's finally block for each video will handle its cleanup.
-            widgets = self.video_widgets[video_url]
-            self.after(0, lambda: widgets['status_label'].configure(text="Cancelling...")) # Immediate feedback
-            self.after(0, lambda: widgets['progress_bar'].set(0)) # Reset progress bar immediately
+            self.update_video_state(video_url, status="Cancelling...", progress=0.0) # Immediate feedback
 
         # Global buttons will be reset by _check_global_buttons_state once all processes terminate
 
     def monitor_downloads(self):
-        """Periodically checks the status of active downloads and updates UI."""
-        # The actual status update logic is now primarily within run_download's loop and finally block.
-        # This monitor is mainly for global button state and general app status.
-        
-        # We just need to check if there are any processes left to decide global button state
+        """Periodically applies download progress and updates the global UI state."""
+        self.ui_stats['ticks'] += 1
+
+        # Fetch results and dialogs handed over by other threads
+        self.run_ui_calls()
+
+        # Per-row progress recorded by download threads since the last tick
+        self.apply_pending_row_updates()
+
+        # Check if there are any processes left to decide global button state
         self._check_global_buttons_state()
+        self._update_queue_status()
 
         # Reschedule the next check
-        self.after(100, self.monitor_downloads)
+        self.after(UI_REFRESH_MS, self.monitor_downloads)
+
+    def _update_queue_status(self):
+        """Shows active/queued counts and aggregate throughput of the scheduler."""
+        stats = self.scheduler.stats()
+        if not stats['elapsed'] and not stats.get('admission_blocked'):
+            self.queue_status_label.configure(text="")
+            return
+        total_speed = sum(self.download_speeds.values())
+        text = (f"Active: {stats['active']}/{stats['max_workers']} | Queued: {stats['queued']} | "
+                f"Finished: {stats['completed']} ({stats['jobs_per_minute']:.1f}/min) | "
+                f"Total speed: {format_speed(total_speed)}")
+        if self.bandwidth_budget.total_rate:
+            text += f" of {format_speed(self.bandwidth_budget.total_rate)}"
+        if stats['retries']:
+            text += f" | Retries: {stats['retries']} ({stats['delayed']} waiting)"
+        if stats['paused_for']:
+            text += f" | Paused {format_eta(stats['paused_for'])} (throttled)"
+        if stats.get('admission_blocked'): # Not reported by older daemons
+            text += " | Waiting for free disk space"
+        if self.transcode_pool is not None:
+            transcode_stats = self.transcode_pool.stats()
+            if transcode_stats['elapsed']:
+                text += (f"\nMP3: converting {transcode_stats['active']}/{transcode_stats['max_workers']} | "
+                         f"Waiting: {transcode_stats['queued']} | Converted: {transcode_stats['completed']} "
+                         f"({transcode_stats['jobs_per_minute']:.1f}/min, avg {transcode_stats['avg_run']:.1f}s)")
+        self.queue_status_label.configure(text=text)
 
     def _check_global_buttons_state(self):
         """Helper to enable/disable global Download All/Cancel All buttons."""
-        if not self.download_processes: # No active downloads
+        if self.scheduler.is_idle() and (self.transcode_pool is None or self.transcode_pool.is_idle()): # Nothing active or queued
             self.download_all_button.configure(state=tk.NORMAL)
             self.cancel_all_button.configure(state=tk.DISABLED)
             # Only change global status label if it's currently showing "Cancelling..."